@@ -0,0 +1,151 @@
+"""
+Micro-benchmark: chunk metadata scanning, before and after the
+single-pass scanner.
+
+Chunks a corpus once, then times the per-chunk code analysis with the
+old implementation (one uncompiled re.search per pattern, re-run for every
+flag) against Chunker._scan_chunk, and checks both produce identical
+metadata.
+
+    python benchmarks/bench_chunker_metadata.py [PATH ...] [--limit N] [--repeat N]
+
+PATH defaults to the Python standard library, which gives a large, varied
+corpus without any setup.
+"""
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import re
+import sysconfig
+import time
+
+from bugtrace.rag.chunker import Chunker
+
+
+SUFFIXES = {'.py', '.js', '.ts', '.jsx', '.tsx', '.go', '.java', '.rs', '.c', '.cpp', '.md'}
+
+
+# ----------------------------------------------------------------------
+# Previous implementation, kept verbatim for comparison
+# ----------------------------------------------------------------------
+
+def _has_error_handling(text: str) -> bool:
+    patterns = [
+        r'\btry\s*:',
+        r'\bexcept\s+',
+        r'\bcatch\s*\(',
+        r'\bfinally\s*:',
+        r'\.catch\(',
+    ]
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+
+
+def _has_logging(text: str) -> bool:
+    patterns = [
+        r'\blogger\.',
+        r'\bprint\(',
+        r'\bconsole\.log\(',
+        r'\bLog\.',
+        r'logging\.',
+    ]
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+
+
+def _has_todo(text: str) -> bool:
+    return bool(re.search(r'#\s*TODO|//\s*TODO', text, re.IGNORECASE))
+
+
+def _has_fixme(text: str) -> bool:
+    return bool(re.search(r'#\s*FIXME|//\s*FIXME', text, re.IGNORECASE))
+
+
+def _extract_python_metadata(text: str) -> Dict:
+    metadata = {}
+    func_match = re.search(r'def\s+(\w+)\s*\(', text)
+    if func_match:
+        metadata['function_name'] = func_match.group(1)
+    class_match = re.search(r'class\s+(\w+)', text)
+    if class_match:
+        metadata['class_name'] = class_match.group(1)
+    return metadata
+
+
+def legacy_scan(text: str, python: bool) -> Dict:
+    metadata = {
+        'has_error_handling': _has_error_handling(text),
+        'has_logging': _has_logging(text),
+        'has_todo': _has_todo(text),
+        'has_fixme': _has_fixme(text),
+        'line_count': text.count('\n') + 1,
+    }
+    if python:
+        metadata.update(_extract_python_metadata(text))
+    return metadata
+
+
+# ----------------------------------------------------------------------
+
+def collect(paths: List[Path], limit: int) -> List[Path]:
+    files = []
+    for root in paths:
+        candidates = [root] if root.is_file() else sorted(root.rglob('*'))
+        for path in candidates:
+            if path.is_file() and path.suffix.lower() in SUFFIXES:
+                files.append(path)
+                if len(files) >= limit:
+                    return files
+    return files
+
+
+def chunk_corpus(files: List[Path]) -> List[Tuple[str, bool]]:
+    chunker = Chunker()
+    chunks = []
+    for path in files:
+        try:
+            content = path.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            continue
+        python = path.suffix == '.py'
+        chunks.extend((chunk['text'], python) for chunk in chunker.chunk_file(path, content))
+    return chunks
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', type=Path, help='files or directories to chunk')
+    parser.add_argument('--limit', type=int, default=2000, help='maximum number of files')
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs (best is reported)')
+    args = parser.parse_args()
+
+    paths = args.paths or [Path(sysconfig.get_paths()['stdlib'])]
+    files = collect(paths, args.limit)
+    chunks = chunk_corpus(files)
+    if not chunks:
+        raise SystemExit('no chunks to scan')
+    size = sum(len(text) for text, _ in chunks)
+    print(f"corpus: {len(files)} files, {len(chunks)} chunks, {size / 1024 / 1024:.1f} MB")
+
+    scan = Chunker()._scan_chunk
+    mismatches = sum(1 for text, python in chunks if scan(text, python) != legacy_scan(text, python))
+    if mismatches:
+        raise SystemExit(f"{mismatches} chunks differ from the previous implementation")
+
+    before = best_of(args.repeat, lambda: [legacy_scan(text, python) for text, python in chunks])
+    after = best_of(args.repeat, lambda: [scan(text, python) for text, python in chunks])
+
+    print(f"before (per-pattern re.search): {len(chunks) / before:>10,.0f} chunks/s")
+    print(f"after  (single-pass scanner):   {len(chunks) / after:>10,.0f} chunks/s")
+    print(f"speedup: {before / after:.1f}x, identical metadata on all chunks")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,9 +6,10 @@ from rich.table import Table
 
 from bugtrace.utils.fs import ensure_state_dir
 from bugtrace.rag.embeddings import get_embedder
-from bugtrace.rag.vector_store import VectorStore
+from bugtrace.rag.vector_store import DEFAULT_SEMANTIC_TIMEOUT, VectorStore
 from bugtrace.config.settings import load_user_config
 from bugtrace.rag.indexer import index_project 
+from bugtrace.rag.watcher import wait_for_watcher
 from bugtrace.llm.ollama import OllamaLLM
 from bugtrace.llm.base import LLMConfig
 
@@ -38,10 +39,8 @@ def analyze_bug(project_root: Path, bug_description: str, top_k: int = 6, show_c
         )
     console.print(f"\n[bold cyan]🔍 Analyzing:[/bold cyan] {bug_description}\n")
     
-     # Single source of truth
-    index_project(project_root)
-
-    # Load config and setup
+    # Load config once for the whole command
+    project_root = Path(project_root).resolve()
     config = load_user_config(project_root)
     state_dir = ensure_state_dir(project_root)
     index_dir = state_dir / "index"
@@ -49,7 +48,26 @@ def analyze_bug(project_root: Path, bug_description: str, top_k: int = 6, show_c
     # Initialize embedder and vector store
     console.print("[dim]Loading vector database...[/dim]")
     embedder = get_embedder(config)
-    vector_store = VectorStore(index_dir, project_root, embedder)
+    vector_store = VectorStore(index_dir, project_root, embedder, field_weights=config["rag"].get("field_weights"),
+                              keyword_backend=config["rag"].get("keyword_backend", "bm25"),
+                              semantic_timeout=config["rag"].get("semantic_timeout", DEFAULT_SEMANTIC_TIMEOUT))
+
+    # A running `bugtrace watch` keeps the index current; otherwise one
+    # scan + incremental index pass (single source of truth)
+    watch_state = wait_for_watcher(state_dir)
+    if watch_state is not None and watch_state.get("generation"):
+        console.print(f"[dim]Index kept current by bugtrace watch (generation {watch_state['generation']})[/dim]")
+    elif watch_state is not None:
+        console.print("[yellow]⚠ bugtrace watch is still on its initial sync; results may be incomplete[/yellow]")
+    else:
+        result = index_project(project_root, verbose=False, config=config, vector_store=vector_store)
+        if result.fresh:
+            console.print(f"[dim]✓ Index is fresh ({result.total_files} files)[/dim]")
+        else:
+            console.print(
+                f"[dim]✓ Index updated: {result.indexed} files indexed, "
+                f"{result.removed} removed[/dim]"
+            )
     
     # Search for relevant code
     console.print("[dim]Searching for relevant code...[/dim]\n")
@@ -1,5 +1,6 @@
 from pathlib import Path
-from bugtrace.utils.fs import walk_project, update_manifest, ensure_state_dir
+from typing import Dict, List, NamedTuple
+from bugtrace.utils.fs import discover_files, sync_manifest, ensure_state_dir
 from bugtrace.config.settings import load_user_config
 from bugtrace.utils.state import StateManager  
 
@@ -9,7 +10,27 @@ from rich.console import Console
 console = Console()
 
 
-def scan_project(project_root: Path = None, verbose: bool = True):
+class ScanResult(NamedTuple):
+    manifest: Dict[str, dict]       # new manifest, as written to the store
+    changes: Dict[str, List[str]]   # new/changed/unchanged/removed paths
+    config: dict                    # validated config used for the scan
+
+
+def scan_project(
+    project_root: Path = None,
+    verbose: bool = True,
+    paranoid: bool = False,
+    jobs: int = None,
+    config: dict = None,
+    state_manager: StateManager = None,
+) -> ScanResult:
+    """
+    Discover project files and bring the manifest up to date.
+    
+    config / state_manager can be passed by callers that already loaded
+    them (e.g. index_project) so one command loads config only once.
+    Returns the in-memory manifest and diff.
+    """
     if project_root is None:
         project_root = Path.cwd()
     elif isinstance(project_root, str):
@@ -19,32 +40,44 @@ def scan_project(project_root: Path = None, verbose: bool = True):
     # Ensure .bugtrace exists
     state_dir = ensure_state_dir(project_root)
 
-    state_manager = StateManager(state_dir)
+    if state_manager is None:
+        state_manager = StateManager(state_dir)
 
     # Load user config from bugtrace.yaml
-    config = load_user_config(project_root)
-    
-    try:
-        from bugtrace.config.settings import validate_config
-        validate_config(config)
-        if verbose:
-            console.print("[green]✓ Configuration valid[/green]")
-    except ValueError as e:
-        console.print(f"[red]✗ Invalid configuration: {e}[/red]")
-        raise
+    if config is None:
+        config = load_user_config(project_root)
+        
+        try:
+            from bugtrace.config.settings import validate_config
+            validate_config(config)
+            if verbose:
+                console.print("[green]✓ Configuration valid[/green]")
+        except ValueError as e:
+            console.print(f"[red]✗ Invalid configuration: {e}[/red]")
+            raise
 
-    # Get ignore patterns from YAML
-    ignore = config.get("paths", {}).get("ignore", [])
-
-    # Walk project files
+    # Walk project files (or read them from git, per paths.discovery)
     if verbose:
         console.print("[dim]Scanning project files...[/dim]")
-    all_files = walk_project(project_root, ignore=ignore)
+    discovery = discover_files(project_root, config)
+    all_files = discovery.files
+
+    if verbose and discovery.mode != config.get("paths", {}).get("discovery", "walk"):
+        console.print("[yellow]⚠ Not a git checkout - falling back to directory walk[/yellow]")
 
     # Hash & update manifest
     if verbose:
         console.print("[dim]Updating manifest...[/dim]")
-    stats = update_manifest(state_dir, all_files)
+    if jobs is None:
+        jobs = (config.get("scan") or {}).get("jobs")
+    manifest, changes = sync_manifest(
+        state_dir,
+        all_files,
+        paranoid=paranoid,
+        jobs=jobs,
+        git_oids=discovery.git_oids,
+    )
+    stats = {key: len(paths) for key, paths in changes.items()}
 
     # Print summary
     if verbose:
@@ -63,3 +96,5 @@ def scan_project(project_root: Path = None, verbose: bool = True):
         )
     # ✅ Update scan timestamp in state
     state_manager.update_scan_time()
+
+    return ScanResult(manifest, changes, config)
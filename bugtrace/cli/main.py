@@ -227,43 +227,104 @@ def scan(
         file_okay=False,
         dir_okay=True,
         resolve_path=True,
-    )
+    ),
+    paranoid: bool = typer.Option(
+        False, "--paranoid", help="Rehash every file instead of trusting size/mtime/inode"
+    ),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of hashing threads (defaults to scan.jobs)"
+    ),
 ):
     """Scan project files and update manifest."""
     from bugtrace.analyze.core import scan_project
     project_root = path or Path.cwd()
-    scan_project(project_root)
+    scan_project(project_root, paranoid=paranoid, jobs=jobs)
 
 @app.command()
 def index(
     path: str = typer.Option(".", "--path", "-p", help="Project root path"),
     force: bool = typer.Option(False, "--force", "-f", help="Force full re-index"),
+    paranoid: bool = typer.Option(
+        False, "--paranoid", help="Rehash every file instead of trusting size/mtime/inode"
+    ),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of hashing threads (defaults to scan.jobs)"
+    ),
 ):
     """
     Build RAG embeddings from tracked files.
     Intelligently indexes only new/changed files unless --force is used.
     """
     from bugtrace.rag.indexer import index_project
+    from bugtrace.rag.watcher import read_watch_state
     
     project_root = Path(path).resolve()
     
+    # A watcher holds the keyword index in memory; writing behind it would
+    # be lost at its next compaction
+    watch_state = read_watch_state(project_root / ".bugtrace")
+    if watch_state is not None:
+        console.print(
+            f"[bold red]❌ bugtrace watch (pid {watch_state['pid']}) is keeping this index current.[/bold red]\n"
+            f"[dim]Stop it before running bugtrace index.[/dim]"
+        )
+        raise typer.Exit(code=1)
+    
     try:
-        index_project(project_root, force=force)
+        index_project(project_root, force=force, paranoid=paranoid, jobs=jobs)
     except Exception as e:
         console.print(f"\n[bold red]❌ Indexing failed:[/bold red] {e}")
         raise typer.Exit(code=1)
     
 
+@app.command()
+def watch(
+    path: str = typer.Option(".", "--path", "-p", help="Project root path"),
+    debounce: float = typer.Option(
+        0.5, "--debounce", help="Seconds of quiet before a batch of changes is indexed"
+    ),
+    paranoid: bool = typer.Option(
+        False, "--paranoid", help="Rehash every file instead of trusting size/mtime/inode"
+    ),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of hashing threads (defaults to scan.jobs)"
+    ),
+):
+    """
+    Keep the manifest and index current as files change.
+    While it runs, analyze and session skip their scan/index step.
+    """
+    from bugtrace.rag.watcher import ProjectWatcher
+    
+    project_root = Path(path).resolve()
+    watcher = ProjectWatcher(project_root, debounce=debounce, paranoid=paranoid, jobs=jobs)
+    
+    console.print(f"[bold]Watching[/bold] {project_root} [dim](Ctrl+C to stop)[/dim]\n")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        console.print("\n[dim]Watcher stopped[/dim]")
+    except Exception as e:
+        console.print(f"\n[bold red]❌ Watch failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    
+
 @app.command()
 def status(
     path: str = typer.Option(".", "--path", "-p", help="Project root path"),
+    paranoid: bool = typer.Option(
+        False, "--paranoid", help="Rehash every file instead of trusting size/mtime/inode"
+    ),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of hashing threads (defaults to scan.jobs)"
+    ),
 ):
     """
     Show current project indexing status.
     Checks for file changes without modifying anything.
     """
     from bugtrace.utils.state import StateManager
-    from bugtrace.utils.fs import ensure_state_dir, load_manifest, walk_project, hash_file
+    from bugtrace.utils.fs import ensure_state_dir, load_manifest, discover_files, compare_manifest
     from bugtrace.config.settings import load_user_config, validate_config
     from rich.table import Table
     
@@ -279,12 +340,12 @@ def status(
     table.add_column("Item", style="cyan")
     table.add_column("Status")
     
-    # Load config to get ignore patterns
+    # Load config to get ignore patterns / discovery mode
     config = load_user_config(project_root)
-    ignore = config.get("paths", {}).get("ignore", [])
     
     # Check actual files on disk (without modifying manifest)
-    current_files = walk_project(project_root, ignore=ignore)
+    discovery = discover_files(project_root, config)
+    current_files = discovery.files
     current_file_count = len(current_files)
     
     # Load manifest
@@ -292,27 +353,15 @@ def status(
     
     # Calculate actual changes by comparing disk vs manifest
     if manifest and current_files:
-        new_files = []
-        changed_files = []
-        unchanged_files = []
-        
-        current_file_paths = {str(f) for f in current_files}
-        manifest_paths = set(manifest.keys())
-        
-        # Check each current file
-        for file_path in current_files:
-            file_str = str(file_path)
-            current_hash = hash_file(file_path)
-            
-            if file_str not in manifest:
-                new_files.append(file_str)
-            elif manifest[file_str] != current_hash:
-                changed_files.append(file_str)
-            else:
-                unchanged_files.append(file_str)
-        
-        # Check for removed files
-        removed_files = [f for f in manifest_paths if f not in current_file_paths]
+        # Files whose stat matches the manifest are not rehashed
+        if jobs is None:
+            jobs = (config.get("scan") or {}).get("jobs")
+        _, changes = compare_manifest(
+            manifest, current_files, paranoid=paranoid, jobs=jobs, git_oids=discovery.git_oids
+        )
+        new_files = changes["new"]
+        changed_files = changes["changed"]
+        removed_files = changes["removed"]
         
         # Display file tracking status
         total_changes = len(new_files) + len(changed_files) + len(removed_files)
@@ -376,6 +425,20 @@ def status(
         table.add_row("Indexed files", "[yellow]Not indexed[/yellow]")
         table.add_row("", f"[dim]Run 'bugtrace index' to build embeddings[/dim]")
     
+    # Files the last index runs could not process
+    failures = state_manager.get_failures()
+    if failures:
+        table.add_row("Failed files", f"[red]{len(failures)} files failed to index[/red]")
+        for failed_path, failure in list(failures.items())[:5]:
+            try:
+                shown = Path(failed_path).relative_to(project_root)
+            except ValueError:
+                shown = failed_path
+            table.add_row("", f"[dim]{shown}: {failure['error'][:80]}[/dim]")
+        if len(failures) > 5:
+            table.add_row("", f"[dim]... and {len(failures) - 5} more[/dim]")
+        table.add_row("", f"[dim]Run 'bugtrace index' to retry them[/dim]")
+    
     # Check config validity
     try:
         validate_config(config)
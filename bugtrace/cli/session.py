@@ -13,10 +13,12 @@ from ..config.settings import load_user_config
 from ..llm import get_llm, LLMConnectionError
 from ..rag.embeddings import get_embedder
 from ..rag.indexer import index_project
-from ..rag.vector_store import VectorStore
+from ..rag.watcher import wait_for_watcher
+from ..rag.vector_store import DEFAULT_SEMANTIC_TIMEOUT, VectorStore
 from ..agent.session_agent import SessionAgent
 from langchain_core.messages import HumanMessage
 from bugtrace.utils.errors import print_traceback
+from bugtrace.utils.fs import ensure_state_dir
 from .commands import handle_command
 from .input import get_user_input
 from .commands import handle_command
@@ -49,11 +51,7 @@ def session_command(
         # 1. Load config
         config = load_user_config(project_root)
         
-        # 2. Index project
-        index_project(project_root, verbose=False)
-        console.print(f"[green]✓[/green] Project indexed")
-        
-        # 3. Setup LLM using factory
+        # 2. Setup LLM using factory
         llm = get_llm(config)
         
         # Check LLM availability
@@ -72,7 +70,7 @@ def session_command(
             console.print("  ollama serve")
             raise typer.Exit(1)
         
-        # 4. Setup embedder using factory
+        # 3. Setup embedder using factory
         try:
             embedder = get_embedder(config)
         except ValueError as e:
@@ -84,30 +82,47 @@ def session_command(
             console.print(f"[red]✗[/red] Failed to initialize embedder: {e}")
             raise typer.Exit(1)
         
-        # 5. Setup vector store
+        # 4. Setup vector store
         bugtrace_dir = project_root / ".bugtrace"
         index_dir = bugtrace_dir / "index"
         
         vector_store = VectorStore(
             index_dir=index_dir,
             project_root=project_root,
-            embedder=embedder
+            embedder=embedder,
+            field_weights=config["rag"].get("field_weights"),
+            keyword_backend=config["rag"].get("keyword_backend", "bm25"),
+            semantic_timeout=config["rag"].get("semantic_timeout", DEFAULT_SEMANTIC_TIMEOUT),
         )
         
-        # 5. Create session agent
+        # 5. Index project (unless `bugtrace watch` keeps it current),
+        # reusing the config and vector store loaded above
+        watch_state = wait_for_watcher(ensure_state_dir(Path(project_root).resolve()))
+        if watch_state is not None and watch_state.get("generation"):
+            console.print(f"[green]✓[/green] Index kept current by bugtrace watch (generation {watch_state['generation']})")
+        elif watch_state is not None:
+            console.print("[yellow]⚠[/yellow] bugtrace watch is still on its initial sync; answers may miss files")
+        else:
+            result = index_project(project_root, verbose=False, config=config, vector_store=vector_store)
+            if result.fresh:
+                console.print(f"[green]✓[/green] Index is fresh")
+            else:
+                console.print(f"[green]✓[/green] Project indexed ({result.indexed} files updated)")
+        
+        # 6. Create session agent
         agent = SessionAgent(
             llm_config=config,
             vector_store=vector_store,
             project_root=project_root,
         )
         
-        # 6. Display session info
+        # 7. Display session info
         console.print()
         console.print("[bold]💬 Exploratory debugging session[/bold]")
         
         console.print("[dim]Type your questions (type \\q to quit)[/dim]\n")
         
-        # 7. Interactive loop
+        # 8. Interactive loop
         run_session_loop(agent)
         
     except LLMConnectionError as e:
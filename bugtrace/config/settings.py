@@ -12,12 +12,30 @@ DEFAULT_CONFIG = {
         "project_root": ".",
         "ignore": ["node_modules", "venv", ".git", ".bugtrace"],
         "logs": ["logs/"],
+        "discovery": "walk",  # "git" = use .git/index and .gitignore
+    },
+    "scan": {
+        "jobs": 0,  # 0 = pick from CPU count
+    },
+    "index": {
+        "jobs": 0,  # chunking processes, 0 = pick from CPU count
+        "batch_size": 64,  # chunks per embedding request
+        "batch_tokens": 16384,  # estimated tokens (chars / 4) per embedding request
+        "embed_concurrency": 2,  # embedding requests in flight
+        "embedding_cache_mb": 512,  # size cap of .bugtrace/embeddings.db, 0 = off
     },
     "rag": {
         "chunk_size": 1000,
         "chunk_overlap": 200,
         "top_k": 6,
         "store": "chroma",
+        "keyword_backend": "bm25",  # bm25 (memory-mapped segment) or fts5 (SQLite)
+        "semantic_timeout": 10.0,  # seconds before search falls back to keyword results, 0 = wait
+        "field_weights": {  # BM25F weight of each keyword-search field
+            "path": 2.0,
+            "symbol": 3.0,
+            "body": 1.0,
+        },
     },
     "tools": {
         "code_search": True,
@@ -110,12 +128,42 @@ def validate_config(config: dict) -> dict:
         elif not all(isinstance(item, str) for item in paths["ignore"]):
             errors.append("paths.ignore must contain only strings")
     
+    if "discovery" in paths and paths["discovery"] not in ["walk", "git"]:
+        errors.append(f"paths.discovery must be one of: walk, git (got '{paths['discovery']}')")
+    
     if "logs" in paths:
         if not isinstance(paths["logs"], list):
             errors.append("paths.logs must be a list")
         elif not all(isinstance(item, str) for item in paths["logs"]):
             errors.append("paths.logs must contain only strings")
     
+    # Validate scan section (optional)
+    scan = config.get("scan") or {}
+    
+    jobs = scan.get("jobs", 0)
+    if not isinstance(jobs, int) or isinstance(jobs, bool):
+        errors.append("scan.jobs must be an integer")
+    elif jobs < 0 or jobs > 256:
+        errors.append("scan.jobs must be between 0 and 256 (0 = auto)")
+    
+    # Validate index section (optional)
+    index = config.get("index") or {}
+    
+    for key, low, high in [
+        ("jobs", 0, 256),
+        ("batch_size", 1, 2048),
+        ("batch_tokens", 256, 1_000_000),
+        ("embed_concurrency", 1, 32),
+        ("embedding_cache_mb", 0, 1_000_000),
+    ]:
+        if key not in index:
+            continue
+        value = index[key]
+        if not isinstance(value, int) or isinstance(value, bool):
+            errors.append(f"index.{key} must be an integer")
+        elif value < low or value > high:
+            errors.append(f"index.{key} must be between {low} and {high}")
+    
     # Validate RAG section
     rag = config.get("rag", {})
     
@@ -141,6 +189,35 @@ def validate_config(config: dict) -> dict:
         if rag["store"] not in ["chroma"]:
             errors.append(f"rag.store must be one of: chroma (got '{rag['store']}')")
     
+    if "keyword_backend" in rag:
+        if rag["keyword_backend"] not in ["bm25", "fts5"]:
+            errors.append(f"rag.keyword_backend must be one of: bm25, fts5 (got '{rag['keyword_backend']}')")
+
+    if "semantic_timeout" in rag:
+        semantic_timeout = rag["semantic_timeout"]
+        if isinstance(semantic_timeout, bool) or not isinstance(semantic_timeout, (int, float)):
+            errors.append("rag.semantic_timeout must be a number of seconds")
+        elif semantic_timeout < 0:
+            errors.append("rag.semantic_timeout must be 0 (no limit) or more")
+
+    if "field_weights" in rag:
+        field_weights = rag["field_weights"]
+        if not isinstance(field_weights, dict):
+            errors.append("rag.field_weights must be a mapping of field to weight")
+        else:
+            for field, weight in field_weights.items():
+                if field not in ["path", "symbol", "body"]:
+                    errors.append(f"rag.field_weights keys must be path, symbol or body (got '{field}')")
+                elif not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                    errors.append(f"rag.field_weights.{field} must be a number")
+                elif weight < 0 or weight > 100:
+                    errors.append(f"rag.field_weights.{field} must be between 0 and 100")
+            # Fields left out keep their default weight
+            if {"path", "symbol", "body"} <= set(field_weights) and not any(
+                isinstance(weight, (int, float)) and weight > 0 for weight in field_weights.values()
+            ):
+                errors.append("rag.field_weights needs at least one weight above 0")
+    
     # Validate tools section
     tools = config.get("tools", {})
     
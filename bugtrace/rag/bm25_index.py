@@ -0,0 +1,564 @@
+"""
+Incremental inverted index with BM25F scoring.
+
+Replaces rebuilding a rank_bm25.BM25Okapi over the whole corpus after
+every change. The index is a read-only base Segment (memory-mapped
+postings, see bm25_segment) plus an in-memory overlay: a postings dict
+{doc_id: term frequency per field} per term for documents added since,
+and tombstones for base documents removed since. Document lengths,
+document frequencies and the total lengths are updated as documents come
+and go, so adding or removing a document costs O(its tokens); compacted()
+merges both layers into the arrays of a new segment.
+
+Documents have several fields (body, path, symbol names), each with its
+own term frequencies and length. Scores follow BM25F: a term's per-field
+frequencies, length-normalized per field, are combined into one weighted
+frequency before BM25 saturation,
+
+    tf' = sum_f  w_f * tf_f / (1 - b + b * len_f / avglen_f)
+    score = sum_t  idf(t) * tf' * (k1 + 1) / (tf' + k1)
+
+so a hit in a short, high-weight field (a symbol name) counts for more
+than the same hit in a long body, without being counted twice. The idf
+(over documents containing the term in any field) and its floor for
+negative values are BM25Okapi's (k1=1.5, b=0.75, epsilon=0.25); with only
+the body weighted, scores equal BM25Okapi's up to rounding.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import itertools
+import math
+
+import numpy as np
+
+from bugtrace.rag.bm25_segment import Segment
+
+
+FIELDS = ("body", "path", "symbol")
+DEFAULT_FIELD_WEIGHTS = {"body": 1.0, "path": 2.0, "symbol": 3.0}
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int64)
+_EMPTY_SCORES = np.zeros(0, dtype=np.float64)
+
+# Pruning thresholds come from partial sums taken in another order than
+# the exact scores; keep a margin well above the rounding error
+_ROUNDING_SLACK = 1 - 1e-9
+
+
+class BM25Index:
+    """
+    BM25F statistics and scoring over a base segment plus an overlay.
+
+    Base documents keep their segment ids (0 .. base_docs - 1); overlay
+    documents must be added with larger, increasing ids. Only documents
+    that contain at least one query term get a score; every other document
+    scores 0, as it would with BM25Okapi.
+
+    Field weights only matter at query time, so they can change without
+    rebuilding the index.
+    """
+
+    def __init__(
+        self,
+        base: Optional[Segment] = None,
+        fields: Sequence[str] = FIELDS,
+        weights: Optional[Dict[str, float]] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.fields = tuple(fields)
+        if base is not None and tuple(base.fields) != self.fields:
+            raise ValueError(f"segment fields {base.fields} do not match {self.fields}")
+        weights = {**DEFAULT_FIELD_WEIGHTS, **(weights or {})}
+        self.weights = np.array([float(weights.get(field, 0.0)) for field in self.fields])
+        n_fields = len(self.fields)
+
+        self.base = base
+        self.base_docs = base.n_docs if base is not None else 0
+        self.deleted = set()                  # tombstoned base doc ids
+        self._alive: Optional[np.ndarray] = None
+        self._deleted_df: Counter = Counter()  # term -> tombstoned docs containing it
+        self._deleted_len = np.zeros(n_fields, dtype=np.int64)
+        self._base_terms: Dict[str, Optional[int]] = {}  # term -> segment index
+
+        self.postings: Dict[str, Dict[int, Tuple[int, ...]]] = {}
+        self.doc_len: Dict[int, Tuple[int, ...]] = {}
+        self._overlay_len = np.zeros(n_fields, dtype=np.int64)
+
+        # Number of terms per document frequency: BM25Okapi floors negative
+        # idf values at epsilon * (mean idf over the vocabulary), and the mean
+        # only depends on how many terms share each df
+        self._df_terms: Counter = Counter(base.df_histogram if base is not None else {})
+        self._average_idf = None
+        self._base_factors = None
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    @property
+    def n_docs(self) -> int:
+        return self.base_docs - len(self.deleted) + len(self.doc_len)
+
+    @property
+    def total_len(self) -> np.ndarray:
+        """Total length of every field."""
+        base_len = self.base.total_len if self.base is not None else 0
+        return base_len - self._deleted_len + self._overlay_len
+
+    def avglen(self) -> np.ndarray:
+        """Average length of every field (1 for fields that are always empty)."""
+        if not self.n_docs:
+            return np.ones(len(self.fields))
+        average = self.total_len / self.n_docs
+        return np.where(average > 0, average, 1.0)
+
+    def live_ids(self) -> np.ndarray:
+        """Ids of all live documents, in increasing (insertion) order."""
+        if self._alive is not None:
+            base_ids = np.flatnonzero(self._alive)
+        else:
+            base_ids = np.arange(self.base_docs, dtype=np.int64)
+        overlay_ids = np.fromiter(self.doc_len, dtype=np.int64, count=len(self.doc_len))
+        return np.concatenate([base_ids.astype(np.int64), overlay_ids])
+
+    def _first_live(self, count: int) -> np.ndarray:
+        """The first count live ids, without materialising all of them."""
+        base_ids = np.arange(min(self.base_docs, count + len(self.deleted)), dtype=np.int64)
+        if self._alive is not None:
+            base_ids = base_ids[self._alive[base_ids]]
+        base_ids = base_ids[:count]
+        overlay_ids = list(itertools.islice(self.doc_len, count - len(base_ids)))
+        return np.concatenate([base_ids, np.array(overlay_ids, dtype=np.int64)])
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def add(self, doc_id: int, fields: Sequence[List[str]]):
+        """Index a new overlay document, given its tokens per field."""
+        if doc_id < self.base_docs or doc_id in self.doc_len:
+            raise ValueError(f"document {doc_id} is already indexed")
+
+        # df() and _move() inlined: this loop runs once per distinct term
+        all_postings, df_terms = self.postings, self._df_terms
+        has_base = self.base is not None
+        for term, tfs in self._field_counts(fields).items():
+            postings = all_postings.get(term)
+            if postings is None:
+                postings = all_postings[term] = {}
+            df = len(postings) + self._base_df(term) if has_base else len(postings)
+            postings[doc_id] = tfs
+            if df:
+                df_terms[df] -= 1
+            df_terms[df + 1] = df_terms.get(df + 1, 0) + 1
+
+        lengths = tuple(len(tokens) for tokens in fields)
+        self.doc_len[doc_id] = lengths
+        self._overlay_len += lengths
+        self._average_idf = self._base_factors = None
+
+    def _field_counts(self, fields: Sequence[List[str]]) -> Dict[str, Tuple[int, ...]]:
+        """{term: frequency per field}"""
+        zeros = (0,) * len(fields)
+        # The first field (the body) holds most terms
+        tail = zeros[1:]
+        counts = {term: (freq,) + tail for term, freq in Counter(fields[0]).items()}
+        for i, tokens in enumerate(fields[1:], 1):
+            head, tail = zeros[:i], zeros[i + 1:]
+            for term, freq in Counter(tokens).items():
+                tfs = counts.get(term)
+                if tfs is None:
+                    counts[term] = head + (freq,) + tail
+                else:
+                    counts[term] = tfs[:i] + (freq,) + tfs[i + 1:]
+        return counts
+
+    def remove(self, doc_id: int, fields: Sequence[List[str]]):
+        """Drop a document; fields are the tokens it was indexed with."""
+        terms = set().union(*fields)
+        if doc_id < self.base_docs:
+            self._remove_base(doc_id, terms)
+            return
+
+        lengths = self.doc_len.pop(doc_id, None)
+        if lengths is None:
+            return
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None or doc_id not in postings:
+                continue
+            df = self.df(term)
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+            self._move(df, df - 1)
+
+        self._overlay_len -= lengths
+        self._average_idf = self._base_factors = None
+
+    def _remove_base(self, doc_id: int, terms: set):
+        if doc_id in self.deleted:
+            return
+        for term in terms:
+            df = self.df(term)
+            self._deleted_df[term] += 1
+            self._move(df, df - 1)
+
+        self.deleted.add(doc_id)
+        if self._alive is None:
+            self._alive = np.ones(self.base_docs, dtype=bool)
+        self._alive[doc_id] = False
+        self._deleted_len += self.base.doc_lens[doc_id]
+        self._average_idf = self._base_factors = None
+
+    def _move(self, old_df: int, new_df: int):
+        if old_df:
+            self._df_terms[old_df] -= 1
+        if new_df:
+            self._df_terms[new_df] += 1
+
+    # ------------------------------------------------------------------
+    # Statistics
+    # ------------------------------------------------------------------
+
+    def _base_index(self, term: str) -> Optional[int]:
+        if self.base is None:
+            return None
+        if term not in self._base_terms:
+            self._base_terms[term] = self.base.lookup(term)
+        return self._base_terms[term]
+
+    def _base_df(self, term: str) -> int:
+        index = self._base_index(term)
+        if index is None:
+            return 0
+        return self.base.df(index) - self._deleted_df.get(term, 0)
+
+    def df(self, term: str) -> int:
+        """Number of live documents containing term (in any field)."""
+        return len(self.postings.get(term, ())) + self._base_df(term)
+
+    def idf(self, term: str) -> float:
+        """BM25Okapi idf of a term (0 if unknown)."""
+        df = self.df(term)
+        if not df:
+            return 0.0
+        idf = self._raw_idf(df)
+        if idf < 0:
+            idf = self.epsilon * self.average_idf()
+        return idf
+
+    def average_idf(self) -> float:
+        if self._average_idf is None:
+            total, terms = 0.0, 0
+            for df, count in self._df_terms.items():
+                if count:
+                    total += count * self._raw_idf(df)
+                    terms += count
+            self._average_idf = total / terms if terms else 0.0
+        return self._average_idf
+
+    def _raw_idf(self, df: int) -> float:
+        return math.log(self.n_docs - df + 0.5) - math.log(df + 0.5)
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def _contributions(self, idf: float, tfs: np.ndarray, factors: np.ndarray) -> np.ndarray:
+        """BM25F contribution of one term to documents with these per-field tfs and factors."""
+        k1 = self.k1
+        tf = (tfs * factors).sum(axis=1)
+        return idf * (tf * (k1 + 1) / (tf + k1))
+
+    def _factors(self, lens: np.ndarray) -> np.ndarray:
+        """Per-field w_f / (1 - b + b * len_f / avglen_f) of documents with these lengths."""
+        b = self.b
+        return self.weights / (1 - b + b * lens / self.avglen())
+
+    def _base_factor_table(self) -> np.ndarray:
+        # Only depends on the field averages, so it is shared by every term
+        # and query until the next update
+        if self._base_factors is None:
+            self._base_factors = self._factors(self.base.doc_lens)
+        return self._base_factors
+
+    def _overlay_array(self, values, count: int) -> np.ndarray:
+        return np.array(list(values), dtype=np.int64).reshape(count, len(self.fields))
+
+    def _term_postings(self, term: str) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(doc ids, per-field tfs, per-field factors) of a term, base then overlay."""
+        parts = []
+        index = self._base_index(term)
+        if index is not None:
+            ids, tfs = self.base.postings(index)
+            if self._alive is not None:
+                keep = self._alive[ids]
+                ids, tfs = ids[keep], tfs[keep]
+            parts.append((ids, tfs, self._base_factor_table()[ids]))
+
+        postings = self.postings.get(term)
+        if postings:
+            count = len(postings)
+            parts.append((
+                np.fromiter(postings.keys(), dtype=np.int64, count=count),
+                self._overlay_array(postings.values(), count),
+                self._factors(self._overlay_array((self.doc_len[doc_id] for doc_id in postings), count)),
+            ))
+        return parts
+
+    def _term_tfs(self, term: str, doc_ids: np.ndarray) -> np.ndarray:
+        """Per-field frequencies of a term in the given live documents (sorted ids)."""
+        tfs = np.zeros((len(doc_ids), len(self.fields)), dtype=np.int64)
+        index = self._base_index(term)
+        if index is not None:
+            ids, base_tfs = self.base.postings(index)
+            if len(ids):
+                at = np.minimum(np.searchsorted(ids, doc_ids), len(ids) - 1)
+                found = ids[at] == doc_ids
+                tfs[found] = base_tfs[at[found]]
+
+        postings = self.postings.get(term)
+        if postings:
+            overlay = np.flatnonzero(doc_ids >= self.base_docs)
+            for i in overlay.tolist():
+                tfs[i] = postings.get(int(doc_ids[i]), 0)
+        return tfs
+
+    def _doc_factors(self, doc_ids: np.ndarray) -> np.ndarray:
+        factors = np.zeros((len(doc_ids), len(self.fields)))
+        in_base = doc_ids < self.base_docs
+        if self.base is not None:
+            factors[in_base] = self._base_factor_table()[doc_ids[in_base]]
+        overlay = np.flatnonzero(~in_base)
+        if len(overlay):
+            lens = self._overlay_array((self.doc_len[int(doc_ids[i])] for i in overlay.tolist()), len(overlay))
+            factors[overlay] = self._factors(lens)
+        return factors
+
+    def get_scores(self, query: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25F scores of the documents containing any query term, as
+        (sorted doc ids, scores). Repeated query terms count once per
+        occurrence, as in BM25Okapi.get_scores.
+        """
+        if not self.n_docs:
+            return _EMPTY_IDS, _EMPTY_SCORES
+
+        all_ids, all_scores = [], []
+        for term in query:
+            if not self.df(term):
+                continue
+            idf = self.idf(term)
+            for ids, tfs, factors in self._term_postings(term):
+                all_scores.append(self._contributions(idf, tfs, factors))
+                all_ids.append(ids.astype(np.int64))
+
+        if not all_ids:
+            return _EMPTY_IDS, _EMPTY_SCORES
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        # bincount adds the weights in input order, i.e. query-term order per
+        # document, like BM25Okapi's running sum
+        scores = np.bincount(inverse.ravel(), weights=np.concatenate(all_scores), minlength=len(ids))
+        return ids, scores
+
+    def _scores_of(self, query: List[str], doc_ids: np.ndarray) -> np.ndarray:
+        """Exact scores of the given live documents (sorted ids)."""
+        factors = self._doc_factors(doc_ids)
+        scores = np.zeros(len(doc_ids))
+        for term in query:
+            if not self.df(term):
+                continue
+            # Absent terms add 0.0, which leaves the running sum unchanged
+            scores += self._contributions(self.idf(term), self._term_tfs(term, doc_ids), factors)
+        return scores
+
+    def _has_unmatched(self, terms: List[str], probes: int = 64) -> bool:
+        """Whether some live document contains none of the terms (checked cheaply)."""
+        if sum(self.df(term) for term in terms) < self.n_docs:
+            return True
+        sample = self._first_live(probes)
+        matched = np.zeros(len(sample), dtype=bool)
+        for term in terms:
+            matched |= self._term_tfs(term, sample).any(axis=1)
+        return not matched.all()
+
+    def _max_score(self, query: List[str], k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Max-score pruning: score the query terms with the highest upper
+        bounds first, and stop reading postings once the remaining terms
+        together cannot lift an unseen document into the top k. The
+        documents that can still make it are then scored exactly.
+
+        Returns (sorted doc ids, scores) of a candidate set that contains
+        the top k, or None when pruning does not apply (negative idf, or
+        no document left unmatched to anchor the minimum score at 0).
+        """
+        weights = Counter(query)
+        terms = sorted(weights, key=lambda term: -self.idf(term) * weights[term])
+        if len(terms) < 2 or any(self.idf(term) < 0 for term in terms):
+            return None
+        # tf' * (k1 + 1) / (tf' + k1) < k1 + 1 for any frequencies and lengths
+        bounds = [self.idf(term) * weights[term] * (self.k1 + 1) for term in terms]
+
+        part_ids, part_scores = [], []
+        for i, term in enumerate(terms[:-1]):
+            for ids, tfs, factors in self._term_postings(term):
+                part_ids.append(ids.astype(np.int64))
+                part_scores.append(weights[term] * self._contributions(self.idf(term), tfs, factors))
+            if not part_ids:
+                continue
+            ids, inverse = np.unique(np.concatenate(part_ids), return_inverse=True)
+            partial = np.bincount(inverse.ravel(), weights=np.concatenate(part_scores), minlength=len(ids))
+            part_ids, part_scores = [ids], [partial]
+            if len(ids) < k:
+                continue
+
+            # Partial scores are lower bounds, so the k-th best one is a
+            # threshold no document outside the top k can reach
+            threshold = np.partition(partial, len(partial) - k)[len(partial) - k] * _ROUNDING_SLACK
+            remaining = sum(bounds[i + 1:])
+            if remaining < threshold:
+                if not self._has_unmatched(terms):
+                    return None
+                candidates = ids[partial + remaining >= threshold]
+                return candidates, self._scores_of(query, candidates)
+        return None
+
+    def top_k(self, query: List[str], k: int) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        """
+        The k best live documents in rank order (score descending, ties in
+        insertion order, as a stable sort over all documents would give),
+        their scores, and the minimum and maximum score over all live
+        documents. Returns fewer than k only if there are fewer live
+        documents.
+        """
+        n_docs = self.n_docs
+        k = min(k, n_docs)
+        if not k:
+            return _EMPTY_IDS, _EMPTY_SCORES, 0.0, 0.0
+
+        terms = [term for term in query if self.df(term)]
+        pruned = self._max_score(terms, k)
+        if pruned is not None:
+            # Every candidate scores > 0 and some document scores 0
+            ids, scores = pruned
+            unmatched = True
+        else:
+            ids, scores = self.get_scores(terms)
+            unmatched = len(ids) < n_docs
+
+        min_score = float(scores.min()) if len(scores) else 0.0
+        max_score = float(scores.max()) if len(scores) else 0.0
+        if unmatched:
+            min_score, max_score = min(min_score, 0.0), max(max_score, 0.0)
+
+        # Positive scores first: select the top k, then sort only those
+        positive = np.flatnonzero(scores > 0)
+        if len(positive) > k:
+            kth = np.partition(scores[positive], len(positive) - k)[len(positive) - k]
+            positive = positive[scores[positive] >= kth]
+        positive = positive[np.argsort(-scores[positive], kind="stable")][:k]
+        ranked_ids, ranked_scores = [ids[positive]], [scores[positive]]
+
+        # Then documents scoring 0 (matched or not) in insertion order, then
+        # negative scores
+        missing = k - len(positive)
+        if missing:
+            live = self.live_ids()
+            zeros = live[~np.isin(live, ids[scores != 0])][:missing]
+            ranked_ids.append(zeros)
+            ranked_scores.append(np.zeros(len(zeros)))
+            missing -= len(zeros)
+        if missing:
+            negative = np.flatnonzero(scores < 0)
+            negative = negative[np.argsort(-scores[negative], kind="stable")][:missing]
+            ranked_ids.append(ids[negative])
+            ranked_scores.append(scores[negative])
+
+        return np.concatenate(ranked_ids), np.concatenate(ranked_scores), min_score, max_score
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def compacted(self):
+        """
+        Merge base and overlay into segment arrays. Live documents are
+        renumbered 0..n-1 in their current order.
+
+        Returns (old_ids, terms, postings_offsets, postings_ids,
+        postings_tfs, doc_lens), where old_ids[new_id] is a document's
+        current id, terms are sorted, and postings_tfs / doc_lens have a
+        column per field.
+        """
+        n_fields = len(self.fields)
+        old_ids = self.live_ids()
+        rank_parts, id_parts, tf_parts = [], [], []
+
+        base_terms: List[str] = []
+        base_alive = 0
+        if self.base is not None:
+            base = self.base
+            base_terms = [base.term(i) for i in range(base.n_terms)]
+            base_alive = self.base_docs - len(self.deleted)
+
+        terms_all = sorted(set(base_terms).union(self.postings), key=lambda term: term.encode("utf-8"))
+        term_ranks = {term: rank for rank, term in enumerate(terms_all)}
+
+        if self.base is not None and base_terms:
+            renumber = np.full(self.base_docs, -1, dtype=np.int64)
+            renumber[old_ids[:base_alive]] = np.arange(base_alive, dtype=np.int64)
+            ids = base.postings_ids.astype(np.int64)
+            term_of = np.repeat(
+                np.array([term_ranks[term] for term in base_terms], dtype=np.int64),
+                np.diff(base.postings_offsets.astype(np.int64)),
+            )
+            new_ids = renumber[ids]
+            keep = new_ids >= 0
+            rank_parts.append(term_of[keep])
+            id_parts.append(new_ids[keep])
+            tf_parts.append(base.postings_tfs[keep].astype(np.int64))
+
+        if self.postings:
+            # One pass over the overlay into flat lists, converted once
+            ranks, ids, tfs = [], [], []
+            for term, postings in self.postings.items():
+                ranks.extend([term_ranks[term]] * len(postings))
+                ids.extend(postings)
+                tfs.extend(postings.values())
+            overlay_ids = np.fromiter(self.doc_len, dtype=np.int64, count=len(self.doc_len))
+            rank_parts.append(np.array(ranks, dtype=np.int64))
+            id_parts.append(base_alive + np.searchsorted(overlay_ids, np.array(ids, dtype=np.int64)))
+            flat = np.fromiter(itertools.chain.from_iterable(tfs), dtype=np.int64, count=len(tfs) * n_fields)
+            tf_parts.append(flat.reshape(len(tfs), n_fields))
+
+        if rank_parts:
+            ranks = np.concatenate(rank_parts)
+            order = np.argsort(ranks, kind="stable")
+            postings_ids = np.concatenate(id_parts)[order]
+            postings_tfs = np.concatenate(tf_parts)[order]
+            counts = np.bincount(ranks, minlength=len(terms_all))
+        else:
+            postings_ids = np.zeros(0, dtype=np.int64)
+            postings_tfs = np.zeros((0, n_fields), dtype=np.int64)
+            counts = np.zeros(len(terms_all), dtype=np.int64)
+
+        # Terms only found in removed documents drop out of the vocabulary
+        present = counts > 0
+        terms = [term for term, keep in zip(terms_all, present) if keep]
+        postings_offsets = np.concatenate([[0], np.cumsum(counts[present])]).astype(np.int64)
+
+        if self.base is not None:
+            base_lens = self.base.doc_lens[old_ids[:base_alive]].astype(np.int64)
+        else:
+            base_lens = np.zeros((0, n_fields), dtype=np.int64)
+        overlay_lens = self._overlay_array(self.doc_len.values(), len(self.doc_len))
+        doc_lens = np.concatenate([base_lens, overlay_lens])
+
+        return old_ids, terms, postings_offsets, postings_ids, postings_tfs, doc_lens
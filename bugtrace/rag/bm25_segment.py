@@ -0,0 +1,256 @@
+"""
+Compact on-disk BM25 segment, memory-mapped for reading.
+
+A segment is one immutable file holding a tokenized keyword index:
+
+    magic | meta offset | meta length
+    term offsets (u64) + term bytes          sorted vocabulary
+    postings offsets (u64) + doc ids (u32) + term frequencies (u32 per field)
+    document lengths (u32 per field)
+    document offsets (u64) + document bytes  JSON {"text", "metadata"}
+    file offsets (u64) + file bytes          sorted file paths
+    file doc offsets (u64) + file doc ids (u32)
+    meta                                     JSON: fields, counts, df histogram,
+                                             schema, sections
+
+Opening a segment maps the file and parses only the small meta block.
+The arrays are numpy views over the mapping, so a query only touches the
+pages of the vocabulary entries, postings and documents it reads.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b"BTBM25S1"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sQQ")
+_U32 = np.dtype("<u4")
+_U64 = np.dtype("<u8")
+
+
+class SegmentError(Exception):
+    """The segment file is missing, truncated or of another format."""
+
+
+class Segment:
+    """Read-only view of a segment file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SegmentError(f"cannot open {path}: {e}") from e
+
+        try:
+            magic, meta_offset, meta_len = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise SegmentError(f"{path} is not a BM25 segment")
+            self.meta = json.loads(self._mmap[meta_offset:meta_offset + meta_len])
+            if self.meta.get("format") not in (1, FORMAT_VERSION):
+                raise SegmentError(f"{path} has unsupported format {self.meta.get('format')}")
+
+            # Format 1 had a single body field
+            self.fields = self.meta.get("fields", ["body"])
+            n_fields = len(self.fields)
+            sections = self.meta["sections"]
+            self.term_offsets = self._array(sections["term_offsets"], _U64)
+            self.postings_offsets = self._array(sections["postings_offsets"], _U64)
+            self.postings_ids = self._array(sections["postings_ids"], _U32)
+            self.postings_tfs = self._array(sections["postings_tfs"], _U32).reshape(-1, n_fields)
+            self.doc_lens = self._array(sections["doc_lens"], _U32).reshape(-1, n_fields)
+            self.doc_offsets = self._array(sections["doc_offsets"], _U64)
+            self.file_offsets = self._array(sections["file_offsets"], _U64)
+            self.file_doc_offsets = self._array(sections["file_doc_offsets"], _U64)
+            self.file_doc_ids = self._array(sections["file_doc_ids"], _U32)
+            self._term_base = sections["terms"][0]
+            self._doc_base = sections["docs"][0]
+            self._file_base = sections["files"][0]
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            self.close()
+            raise SegmentError(f"{path} is corrupt: {e}") from e
+        except SegmentError:
+            self.close()
+            raise
+
+        self.n_docs = self.meta["n_docs"]
+        self.total_len = np.atleast_1d(np.asarray(self.meta["total_len"], dtype=np.int64))
+        self.generation = self.meta.get("generation", 0)
+        self.schema = self.meta.get("schema", {})
+        self.n_terms = len(self.term_offsets) - 1
+        self.n_files = len(self.file_offsets) - 1
+
+    def _array(self, section: Sequence[int], dtype: np.dtype) -> np.ndarray:
+        offset, count = section
+        if offset + count * dtype.itemsize > len(self._mmap):
+            raise SegmentError(f"{self.path} is truncated")
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+
+    def close(self):
+        """Release the mapping (best effort while arrays are still referenced)."""
+        for name in (
+            "term_offsets", "postings_offsets", "postings_ids", "postings_tfs", "doc_lens",
+            "doc_offsets", "file_offsets", "file_doc_offsets", "file_doc_ids",
+        ):
+            self.__dict__.pop(name, None)
+        try:
+            self._mmap.close()
+        except (BufferError, AttributeError):
+            pass
+
+    # ------------------------------------------------------------------
+
+    @property
+    def df_histogram(self) -> Dict[int, int]:
+        """{document frequency: number of terms with it}"""
+        return {int(df): count for df, count in self.meta["df_histogram"].items()}
+
+    def term(self, index: int) -> str:
+        return self._bytes(self._term_base, self.term_offsets, index).decode("utf-8")
+
+    def lookup(self, term: str) -> Optional[int]:
+        """Index of a term in the vocabulary, or None."""
+        return self._search(term.encode("utf-8"), self.term_offsets, self._term_base, self.n_terms)
+
+    def df(self, index: int) -> int:
+        return int(self.postings_offsets[index + 1]) - int(self.postings_offsets[index])
+
+    def postings(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc ids, term frequencies per field) of a term, in doc id order."""
+        start, end = int(self.postings_offsets[index]), int(self.postings_offsets[index + 1])
+        return self.postings_ids[start:end], self.postings_tfs[start:end]
+
+    def document(self, doc_id: int) -> dict:
+        return json.loads(self.document_bytes(doc_id))
+
+    def document_bytes(self, doc_id: int) -> bytes:
+        return self._bytes(self._doc_base, self.doc_offsets, doc_id)
+
+    def file_docs(self, path: str) -> List[int]:
+        """Doc ids of a file's chunks."""
+        index = self._search(path.encode("utf-8", "surrogatepass"), self.file_offsets, self._file_base, self.n_files)
+        if index is None:
+            return []
+        start, end = int(self.file_doc_offsets[index]), int(self.file_doc_offsets[index + 1])
+        return self.file_doc_ids[start:end].tolist()
+
+    def files(self) -> List[str]:
+        return [self._bytes(self._file_base, self.file_offsets, i).decode("utf-8", "surrogatepass") for i in range(self.n_files)]
+
+    def _bytes(self, base: int, offsets: np.ndarray, index: int) -> bytes:
+        return self._mmap[base + int(offsets[index]):base + int(offsets[index + 1])]
+
+    def _search(self, key: bytes, offsets: np.ndarray, base: int, count: int) -> Optional[int]:
+        # Binary search over sorted UTF-8 strings (byte order == code point order)
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._bytes(base, offsets, mid)
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+
+def write_segment(
+    path: Path,
+    terms: List[str],
+    postings_offsets: np.ndarray,
+    postings_ids: np.ndarray,
+    postings_tfs: np.ndarray,
+    doc_lens: np.ndarray,
+    documents: List[bytes],
+    files: Dict[str, List[int]],
+    generation: int,
+    fields: Sequence[str] = ("body",),
+    schema: Optional[dict] = None,
+):
+    """
+    Write a segment atomically (temp file + rename).
+
+    terms must be sorted by their UTF-8 bytes; term i's postings are
+    postings_ids/tfs[postings_offsets[i]:postings_offsets[i + 1]], with doc
+    ids in increasing order. postings_tfs and doc_lens have one column per
+    field. documents are JSON-encoded chunks, parallel to doc_lens. schema
+    describes how the postings were built (tokenizer, field sources), so
+    readers can tell when they need rebuilding.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    sections = {}
+
+    encoded_terms = [term.encode("utf-8") for term in terms]
+    file_names = sorted(files, key=lambda name: name.encode("utf-8", "surrogatepass"))
+    encoded_files = [name.encode("utf-8", "surrogatepass") for name in file_names]
+    file_doc_ids = [doc_id for name in file_names for doc_id in files[name]]
+
+    df = np.diff(np.asarray(postings_offsets, dtype=_U64)).astype(np.int64)
+    histogram = np.bincount(df) if len(df) else np.zeros(0, dtype=np.int64)
+
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, 0, 0))
+
+        def write_array(name: str, values, dtype: np.dtype):
+            _pad(f)
+            array = np.ascontiguousarray(values, dtype=dtype)
+            sections[name] = [f.tell(), array.size]
+            f.write(array.tobytes())
+
+        def write_blob(name: str, offsets_name: str, items: List[bytes]):
+            write_array(offsets_name, _offsets(items), _U64)
+            sections[name] = [f.tell(), len(items)]
+            for item in items:
+                f.write(item)
+
+        write_blob("terms", "term_offsets", encoded_terms)
+        write_array("postings_offsets", postings_offsets, _U64)
+        write_array("postings_ids", postings_ids, _U32)
+        write_array("postings_tfs", postings_tfs, _U32)
+        write_array("doc_lens", doc_lens, _U32)
+        write_blob("docs", "doc_offsets", documents)
+        write_blob("files", "file_offsets", encoded_files)
+        write_array("file_doc_offsets", _offsets([files[name] for name in file_names]), _U64)
+        write_array("file_doc_ids", file_doc_ids, _U32)
+
+        meta = json.dumps({
+            "format": FORMAT_VERSION,
+            "generation": generation,
+            "schema": schema or {},
+            "fields": list(fields),
+            "n_docs": len(documents),
+            "total_len": np.asarray(doc_lens, dtype=np.int64).reshape(-1, len(fields)).sum(axis=0).tolist(),
+            "df_histogram": {str(value): int(count) for value, count in enumerate(histogram) if value and count},
+            "sections": sections,
+        }).encode("utf-8")
+        meta_offset = f.tell()
+        f.write(meta)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, meta_offset, len(meta)))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def _offsets(items: Sequence[Sequence]) -> np.ndarray:
+    offsets = np.zeros(len(items) + 1, dtype=_U64)
+    if items:
+        np.cumsum([len(item) for item in items], out=offsets[1:])
+    return offsets
+
+
+def _pad(f):
+    # Keep arrays 8-byte aligned for the numpy views
+    remainder = f.tell() % 8
+    if remainder:
+        f.write(b"\0" * (8 - remainder))
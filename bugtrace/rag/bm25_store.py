@@ -1,122 +1,364 @@
 from pathlib import Path
-from rank_bm25 import BM25Okapi
+from typing import Dict, List, Optional
 import json
-import re
+import os
 
+from bugtrace.rag.bm25_index import FIELDS, BM25Index
+from bugtrace.rag.bm25_segment import Segment, SegmentError, write_segment
+from bugtrace.rag.keyword_store import KeywordStore
+from bugtrace.rag.tokenizer import TOKENIZER_VERSION, tokenize_query
 
-class BM25Store:
+
+# Compact once the journal holds more than this many added/removed
+# documents, or this share of the live documents, whichever is larger
+COMPACT_MIN_OPS = 1000
+COMPACT_RATIO = 0.25
+
+
+class BM25Store(KeywordStore):
     """
     Persistent BM25 keyword index for code retrieval.
+
+    The index lives in persist_dir as an immutable, memory-mapped
+    segment (see bm25_segment) plus an append-only journal of the chunks
+    added and files removed since the segment was written. Opening the
+    store maps the segment and replays the journal, so only journalled
+    chunks are tokenized; once the journal grows past a share of the
+    index it is folded into a new segment.
+
+    Chunks are indexed in three BM25F fields (see bm25_index): the text,
+    the file path relative to project_root, and the symbol names from the
+    chunk metadata. field_weights ({field: weight}) override
+    DEFAULT_FIELD_WEIGHTS at query time.
+
+    The journal starts with the generation of the segment it applies to,
+    and every compaction bumps the generation, so a journal left behind
+    by an interrupted compaction is recognised and ignored.
     """
 
-    def __init__(self, persist_dir: Path):
+    def __init__(
+        self,
+        persist_dir: Path,
+        project_root: Optional[Path] = None,
+        field_weights: Optional[Dict[str, float]] = None,
+    ):
         self.persist_dir = persist_dir
         self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self.project_root = project_root.resolve() if project_root is not None else None
+        self.field_weights = field_weights
 
         self.docs_path = self.persist_dir / "documents.json"
+        self.segment_path = self.persist_dir / "segment.bin"
+        self.journal_path = self.persist_dir / "journal.jsonl"
 
-        self.documents = []
-        self.tokenized_documents = []
-        self.bm25 = None
+        self.segment: Optional[Segment] = None
+        self.index = BM25Index(weights=field_weights)
+        self._documents: Dict[int, dict] = {}       # journalled documents
+        self._file_docs: Dict[str, List[int]] = {}  # journalled documents per file
+        self._next_id = 0
+        self._journal_ops = 0
+        self._generation = 0
 
         self._load()
 
-    def _tokenize(self, text: str):
-        """
-        Better tokenizer for code + stacktraces.
-        """
-        text = text.lower()
+    def __len__(self) -> int:
+        return len(self.index)
 
-        # split on non-word chars
-        tokens = re.split(r'[^a-zA-Z0-9_\.]+', text)
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
 
-        return [t for t in tokens if t]
+    @property
+    def schema(self) -> dict:
+        """How postings are built; a segment built otherwise is rebuilt on open."""
+        return {
+            "tokenizer": TOKENIZER_VERSION,
+            "root": str(self.project_root) if self.project_root is not None else None,
+        }
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
 
     def _load(self):
-        if not self.docs_path.exists():
+        segment = None
+        if self.segment_path.exists():
+            try:
+                segment = Segment(self.segment_path)
+            except SegmentError:
+                # Unreadable index: start empty, the next full index rebuilds
+                # it. The journal only makes sense on top of the lost segment
+                if self.journal_path.exists():
+                    self.journal_path.unlink()
+
+        if segment is not None and (segment.schema != self.schema or tuple(segment.fields) != FIELDS):
+            self._rebuild(segment)
             return
 
-        with open(self.docs_path, "r", encoding="utf-8") as f:
-            self.documents = json.load(f)
-
-        self.tokenized_documents = [
-            self._tokenize(doc["text"])
-            for doc in self.documents
-        ]
-
-        if self.tokenized_documents:
-            self.bm25 = BM25Okapi(self.tokenized_documents)
-
-    def save(self):
-        with open(self.docs_path, "w", encoding="utf-8") as f:
-            json.dump(self.documents, f)
+        self._open_segment(segment)
+        if segment is None and self.docs_path.exists():
+            self._migrate()
+        for record in self._journal():
+            if "add" in record:
+                self._add_document(record["add"])
+            elif "delete" in record:
+                self._remove_file(record["delete"])
+
+    def _open_segment(self, segment: Optional[Segment]):
+        if self.segment is not None and self.segment is not segment:
+            self.segment.close()
+        self.segment = segment
+        if segment is not None:
+            self._generation = segment.generation
+        self.index = BM25Index(segment, weights=self.field_weights)
+        self._documents = {}
+        self._file_docs = {}
+        self._next_id = segment.n_docs if segment is not None else 0
+        self._journal_ops = 0
+
+    @property
+    def generation(self) -> int:
+        # Kept across _open_segment(None) so a rebuild still moves forward
+        return self._generation
+
+    def _journal(self):
+        """Records of the journal, if it applies to the current generation."""
+        if not self.journal_path.exists():
+            return
 
-    def rebuild(self):
-        self.tokenized_documents = [
-            self._tokenize(doc["text"])
-            for doc in self.documents
-        ]
+        with open(self.journal_path, "rb") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return
+            if header.get("generation") != self.generation:
+                # Left over from before the last compaction
+                return
+
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    # Torn line from an interrupted write (or one still
+                    # being written by another process)
+                    continue
+                yield record
+
+    def _rebuild(self, segment: Segment):
+        """
+        Re-index the chunks of a segment built another way (older
+        tokenizer or fields, other project root), journal included.
+        """
+        documents = {doc_id: segment.document(doc_id) for doc_id in range(segment.n_docs)}
+        files = {path: segment.file_docs(path) for path in segment.files()}
+        next_id = segment.n_docs
+        self._generation = segment.generation
+        segment.close()
+
+        for record in self._journal():
+            if "add" in record:
+                documents[next_id] = record["add"]
+                files.setdefault(record["add"]["metadata"].get("file"), []).append(next_id)
+                next_id += 1
+            elif "delete" in record:
+                for doc_id in files.pop(record["delete"], []):
+                    del documents[doc_id]
+
+        self._build(documents.values())
+
+    def _migrate(self):
+        """Convert a documents.json index into a segment (kept as *.json.bak)."""
+        with open(self.docs_path, "r", encoding="utf-8") as f:
+            documents = json.load(f)
+
+        self._build(documents)
+        if self.segment is not None:
+            os.replace(self.docs_path, self.docs_path.with_name(self.docs_path.name + ".bak"))
+
+    def _build(self, documents):
+        """Index documents from scratch into a new segment."""
+        self._open_segment(None)
+        for doc in documents:
+            self._add_document(doc)
+        self.compact()
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def _add_document(self, doc: dict):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._documents[doc_id] = doc
+        self._file_docs.setdefault(doc["metadata"].get("file"), []).append(doc_id)
+        self.index.add(doc_id, self._fields(doc))
+        self._journal_ops += 1
+
+    def _remove_file(self, path: str) -> bool:
+        doc_ids = self._file_docs.pop(path, [])
+        if self.segment is not None:
+            doc_ids = [doc_id for doc_id in self.segment.file_docs(path) if doc_id not in self.index.deleted] + doc_ids
+        if not doc_ids:
+            return False
+        for doc_id in doc_ids:
+            doc = self._documents.pop(doc_id, None) or self.segment.document(doc_id)
+            self.index.remove(doc_id, self._fields(doc))
+        self._journal_ops += len(doc_ids)
+        return True
+
+    def _append(self, records: List[dict]):
+        """Append records to the journal in one write, then compact if due."""
+        if not records:
+            return
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            if not f.tell():
+                data = json.dumps({"generation": self.generation}).encode("utf-8") + b"\n" + data
+            else:
+                # Start on a fresh line if an earlier write was cut short
+                with open(self.journal_path, "rb") as tail:
+                    tail.seek(-1, os.SEEK_END)
+                    if tail.read(1) != b"\n":
+                        data = b"\n" + data
+            f.write(data)
 
-        self.bm25 = BM25Okapi(self.tokenized_documents)
+        if self._journal_ops > max(COMPACT_MIN_OPS, COMPACT_RATIO * len(self.index)):
+            self.compact()
 
     def add_chunks(self, chunks):
         """
         Add chunks to BM25 index.
         """
-
+        records = []
         for chunk in chunks:
-            self.documents.append({
+            doc = {
                 "text": chunk["text"],
                 "metadata": chunk["metadata"]
-            })
+            }
+            self._add_document(doc)
+            records.append({"add": doc})
 
-        self.rebuild()
-        self.save()
+        self._append(records)
 
-    def delete_file_chunks(self, filepath: str):
-        filepath = str(Path(filepath).resolve())
+    def delete_files(self, paths):
+        """
+        Remove the chunks of many files with one journal write.
+        """
+        paths = {str(Path(filepath).resolve()) for filepath in paths}
 
-        self.documents = [
-            doc
-            for doc in self.documents
-            if doc["metadata"].get("file") != filepath
-        ]
+        self._append([{"delete": path} for path in paths if self._remove_file(path)])
 
-        self.rebuild()
-        self.save()
+    def replace_files(self, files):
+        """
+        Replace the chunks of many files ({filepath: chunks}) with one
+        journal write.
+        """
+        records = []
+        for filepath in files:
+            path = str(Path(filepath).resolve())
+            if self._remove_file(path):
+                records.append({"delete": path})
+        for chunks in files.values():
+            for chunk in chunks:
+                doc = {
+                    "text": chunk["text"],
+                    "metadata": chunk["metadata"]
+                }
+                self._add_document(doc)
+                records.append({"add": doc})
+
+        self._append(records)
+
+    def compact(self):
+        """
+        Fold the journal into a new segment. If the segment cannot be
+        replaced (e.g. another process still maps it on Windows), the
+        journal is kept and compaction is retried on a later update.
+        """
+        old_ids, terms, postings_offsets, postings_ids, postings_tfs, doc_lens = self.index.compacted()
+
+        file_of: Dict[int, str] = {}
+        if self.segment is not None:
+            for path in self.segment.files():
+                for doc_id in self.segment.file_docs(path):
+                    file_of[doc_id] = path
+        for path, doc_ids in self._file_docs.items():
+            for doc_id in doc_ids:
+                file_of[doc_id] = path
+
+        documents, files = [], {}
+        for new_id, doc_id in enumerate(old_ids.tolist()):
+            if doc_id in self._documents:
+                documents.append(json.dumps(self._documents[doc_id]).encode("utf-8"))
+            else:
+                documents.append(self.segment.document_bytes(doc_id))
+            if file_of.get(doc_id) is not None:
+                files.setdefault(file_of[doc_id], []).append(new_id)
+
+        # Everything needed is copied out, so release our own mapping (a
+        # mapped file cannot be replaced on Windows)
+        generation = self.generation + 1
+        previous = self.segment
+        if previous is not None:
+            previous.close()
+        try:
+            write_segment(
+                self.segment_path, terms, postings_offsets, postings_ids, postings_tfs,
+                doc_lens, documents, files, generation, FIELDS, self.schema,
+            )
+            segment = Segment(self.segment_path)
+        except (OSError, SegmentError):
+            if previous is not None:
+                # Reopen whatever segment is on disk and replay the journal
+                self.segment = None
+                self._load()
+            return
 
-    def search(self, query: str, k: int = 5):
-        if not self.bm25:
-            return []
+        self._open_segment(segment)
 
-        tokenized_query = self._tokenize(query)
+        # A stale journal is ignored once the new segment is in place, so a
+        # crash between the two renames loses nothing
+        tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": self.generation}) + "\n")
+        os.replace(tmp_path, self.journal_path)
 
-        scores = self.bm25.get_scores(tokenized_query)
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
 
-        ranked = sorted(
-            zip(self.documents, scores),
-            key=lambda x: x[1],
-            reverse=True
-        )
+    def _document(self, doc_id: int) -> dict:
+        doc = self._documents.get(doc_id)
+        return doc if doc is not None else self.segment.document(doc_id)
 
-        # -----------------------------
-        # NORMALIZE USING ALL DOCUMENTS
-        # -----------------------------
+    def search(self, query: str, k: int = 5):
+        n_docs = len(self.index)
+        if not n_docs:
+            return []
 
-        all_scores = [
-            score
-            for _, score in ranked
-        ]
+        tokenized_query = list(tokenize_query(query))
 
-        min_score = min(all_scores)
-        max_score = max(all_scores)
+        # Duplicate (file, chunk_id) entries are skipped, so widen the
+        # selection until k distinct chunks are found
+        limit = k
+        while True:
+            results = self._top_results(tokenized_query, k, limit)
+            if len(results) >= k or limit >= n_docs:
+                return results
+            limit *= 2
 
+    def _top_results(self, tokenized_query, k: int, limit: int):
+        ranked_ids, ranked_scores, min_score, max_score = self.index.top_k(tokenized_query, limit)
 
         results = []
 
         seen = set()
 
-        for doc, score in ranked:
+        for doc_id, score in zip(ranked_ids.tolist(), ranked_scores.tolist()):
+            doc = self._document(doc_id)
             key = (
                 doc["metadata"].get("file"),
                 str(doc["metadata"].get("chunk_id"))
@@ -130,6 +372,7 @@ class BM25Store:
             if len(results) >= k:
                 break
 
+            # Normalized against the minimum and maximum over all documents
             if max_score == min_score:
                 normalized = 1.0
             else:
@@ -1,14 +1,59 @@
 # bugtrace/rag/chunker.py
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from langchain_text_splitters import (
     RecursiveCharacterTextSplitter,
     Language
 )
-import ast
 import re
 import hashlib
 
+from bugtrace.rag.outline import outline_symbols
+from bugtrace.rag.structure import (
+    Piece,
+    line_at,
+    newline_offsets,
+    pack_symbols,
+    python_symbols,
+    split_lines,
+)
+
+
+# Bump when chunk boundaries or chunk text change, so existing indexes
+# are re-chunked (see INDEX_SCOPES in bugtrace.rag.indexer)
+CHUNKER_VERSION = 3
+
+# Code-analysis metadata: (key, exact pattern). The flags are set when
+# their pattern matches anywhere in a chunk; the Python names take the
+# first match and only apply to .py files.
+_PROBES = [
+    ('has_error_handling', re.compile(
+        r'\btry\s*:|\bexcept\s+|\bcatch\s*\(|\bfinally\s*:|\.catch\(', re.IGNORECASE)),
+    ('has_logging', re.compile(
+        r'\blogger\.|\bprint\(|\bconsole\.log\(|\bLog\.|logging\.', re.IGNORECASE)),
+    ('has_todo', re.compile(r'#\s*TODO|//\s*TODO', re.IGNORECASE)),
+    ('has_fixme', re.compile(r'#\s*FIXME|//\s*FIXME', re.IGNORECASE)),
+    ('function_name', re.compile(r'def\s+(\w+)\s*\(')),
+    ('class_name', re.compile(r'class\s+(\w+)')),
+]
+_PYTHON_NAMES = ('function_name', 'class_name')
+
+# Every place a probe can start, in one pass. The alternatives are plain
+# lowercase literals up front (word boundaries are left to the probes),
+# which lets the regex engine skip ahead on a first-character prefilter.
+# A scanner hit never covers the start of another probe's match, so
+# consuming it hides nothing.
+_SCANNER_PATTERN = (
+    r'try\s*:|except\s|catch\s*\(|finally\s*:|\.catch\('
+    r'|logger\.|print\(|console\.log\(|log\.|logging\.'
+    r'|#\s*todo|//\s*todo|#\s*fixme|//\s*fixme'
+    r'|def\s|class\s'
+)
+_METADATA_SCANNER = re.compile(_SCANNER_PATTERN)
+# For non-ASCII chunks, where lower() may not line up with re.IGNORECASE
+_METADATA_SCANNER_NOCASE = re.compile(_SCANNER_PATTERN, re.IGNORECASE)
+
+
 class Chunker:
     """Smart file chunker using LangChain text splitters"""
     
@@ -50,7 +95,9 @@ class Chunker:
     
     def chunk_file(self, filepath: Path, content: str) -> List[Dict]:
         """
-        Chunk file using appropriate LangChain splitter.
+        Chunk file on symbol boundaries where a structural front end exists
+        (Python, JS/TS, Go, Java, Rust), else with the appropriate LangChain
+        splitter.
         
         Args:
             filepath: Path to the file
@@ -63,6 +110,22 @@ class Chunker:
             return []
         
         suffix = filepath.suffix.lower()
+        file_metadata = self._file_metadata(filepath)
+        
+        pieces = self._structural_pieces(suffix, content)
+        if pieces is not None:
+            result = []
+            for i, piece in enumerate(pieces):
+                metadata = self._create_metadata(
+                    filepath, piece.text, i, len(pieces), line_start=piece.start, line_end=piece.end,
+                    file_metadata=file_metadata,
+                )
+                # Names come from the symbol tree, not the regex guesses
+                metadata.pop('function_name', None)
+                metadata.pop('class_name', None)
+                metadata.update(self._symbol_metadata(piece))
+                result.append({'text': piece.text, 'metadata': metadata})
+            return result
         
         # Get appropriate splitter
         if suffix in self.LANGUAGE_MAP:
@@ -72,107 +135,151 @@ class Chunker:
             # Default to generic text splitter
             splitter = self._get_text_splitter()
         
-        # Split the content
-        chunks = splitter.split_text(content)
+        # Split the content, keeping each chunk's character offset
+        spans = self._split_with_offsets(splitter, content)
+        newlines = newline_offsets(content)
         
         # Convert to our chunk format with metadata
         result = []
-        for i, chunk_text in enumerate(chunks):
+        for i, (start, chunk_text) in enumerate(spans):
+            line_start = line_end = None
+            if start is not None:
+                line_start = line_at(newlines, start)
+                line_end = line_at(newlines, start + max(len(chunk_text) - 1, 0))
             result.append({
                 'text': chunk_text,
-                'metadata': self._create_metadata(filepath, chunk_text, i, len(chunks), full_content=content)
+                'metadata': self._create_metadata(
+                    filepath, chunk_text, i, len(spans), line_start=line_start, line_end=line_end,
+                    file_metadata=file_metadata,
+                )
             })
         
         return result
-        
     
-    def _create_metadata(self, filepath: Path, chunk_text: str, chunk_id: int, total_chunks: int, full_content: str = None) -> Dict:
-        """Create rich metadata for bug tracing"""
-
-        line_start = None
-        line_end = None
+    def _structural_pieces(self, suffix: str, content: str) -> Optional[List[Piece]]:
+        """Symbol-aligned pieces, or None to fall back to text splitting."""
+        if suffix == '.py':
+            try:
+                symbols = python_symbols(content)
+            except (SyntaxError, ValueError, RecursionError):
+                return None
+        else:
+            symbols = outline_symbols(suffix, content)
+            if symbols is None:
+                return None
+        return pack_symbols(split_lines(content), symbols, self.chunk_size, self.chunk_overlap)
     
-        if full_content:
-            # Find where this chunk appears in the full content
-            chunk_start_pos = full_content.find(chunk_text)
-            if chunk_start_pos != -1:
-                # Count newlines before this chunk
-                line_start = full_content[:chunk_start_pos].count('\n') + 1
-                # Count newlines in this chunk
-                line_end = line_start + chunk_text.count('\n')
-            metadata = {
-                # File context
-                'file': str(filepath.resolve()),
-                'file_name': filepath.name,
-                'file_type': filepath.suffix.lstrip('.'),
-                
-                # Chunk context
-                'chunk_id': chunk_id,
-                'total_chunks': total_chunks,
-                'chunk_hash': hashlib.md5(chunk_text.encode()).hexdigest()[:16],
-
-                # ✅ Line numbers (NEW)
-                'line_start': line_start,
-                'line_end': line_end,
-                
-                # Code analysis (for bug tracing)
-                'has_error_handling': self._has_error_handling(chunk_text),
-                'has_logging': self._has_logging(chunk_text),
-                'has_todo': self._has_todo(chunk_text),
-                'has_fixme': self._has_fixme(chunk_text),
-                'line_count': chunk_text.count('\n') + 1,
-            }
-            
-            # Add language-specific metadata
-            if filepath.suffix == '.py':
-                metadata.update(self._extract_python_metadata(chunk_text))
-            
+    def _symbol_metadata(self, piece: Piece) -> Dict:
+        """Qualified names of the symbols a structural chunk covers"""
+        metadata = {}
+        primary = piece.symbols[0] if piece.symbols else None
+        if primary is None:
+            if piece.scope:
+                metadata['qualified_name'] = piece.scope
+                metadata['class_name'] = piece.scope
             return metadata
         
-    def _has_error_handling(self, text: str) -> bool:
-        """Check if chunk has error handling"""
-        patterns = [
-            r'\btry\s*:',
-            r'\bexcept\s+',
-            r'\bcatch\s*\(',
-            r'\bfinally\s*:',
-            r'\.catch\(',
-        ]
-        return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+        metadata['qualified_name'] = primary.qualname
+        metadata['symbol_kind'] = primary.kind
+        if len(piece.symbols) > 1:
+            metadata['symbols'] = ", ".join(symbol.qualname for symbol in piece.symbols)
+        if primary.kind == 'class':
+            metadata['class_name'] = primary.qualname
+        else:
+            metadata['function_name'] = primary.qualname
+            if piece.scope:
+                metadata['class_name'] = piece.scope
+        return metadata
     
-    def _has_logging(self, text: str) -> bool:
-        """Check if chunk has logging statements"""
-        patterns = [
-            r'\blogger\.',
-            r'\bprint\(',
-            r'\bconsole\.log\(',
-            r'\bLog\.',
-            r'logging\.',
-        ]
-        return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+    def _split_with_offsets(self, splitter: RecursiveCharacterTextSplitter, content: str) -> List[Tuple[Optional[int], str]]:
+        """
+        Split content and return (offset, chunk_text) pairs.
+        
+        Chunks come out of the splitter in order, and the next one cannot
+        start before the previous end minus the overlap, so each chunk is
+        located by a forward search from there. Repeated text (overlaps,
+        boilerplate) therefore maps to the right occurrence and the whole
+        file is searched roughly once. offset is None if a chunk can't be
+        found verbatim.
+        """
+        spans = []
+        prev_start, prev_len = 0, 0
+        for chunk_text in splitter.split_text(content):
+            lower_bound = max(0, prev_start + prev_len - self.chunk_overlap)
+            start = content.find(chunk_text, lower_bound)
+            if start == -1:
+                start = content.find(chunk_text, prev_start)
+            if start == -1:
+                spans.append((None, chunk_text))
+                continue
+            spans.append((start, chunk_text))
+            prev_start, prev_len = start, len(chunk_text)
+        return spans
     
-    def _has_todo(self, text: str) -> bool:
-        """Check for TODO comments"""
-        return bool(re.search(r'#\s*TODO|//\s*TODO', text, re.IGNORECASE))
+    def _create_metadata(
+        self,
+        filepath: Path,
+        chunk_text: str,
+        chunk_id: int,
+        total_chunks: int,
+        line_start: Optional[int] = None,
+        line_end: Optional[int] = None,
+        file_metadata: Optional[Dict] = None,
+    ) -> Dict:
+        """Create rich metadata for bug tracing"""
+        metadata = dict(file_metadata or self._file_metadata(filepath))
+        metadata.update({
+            # Chunk context
+            'chunk_id': chunk_id,
+            'total_chunks': total_chunks,
+            'chunk_hash': hashlib.md5(chunk_text.encode()).hexdigest()[:16],
+
+            # ✅ Line numbers (NEW)
+            'line_start': line_start,
+            'line_end': line_end,
+        })
+        
+        # Code analysis (for bug tracing), plus Python-specific metadata
+        metadata.update(self._scan_chunk(chunk_text, python=filepath.suffix == '.py'))
+        return metadata
     
-    def _has_fixme(self, text: str) -> bool:
-        """Check for FIXME comments"""
-        return bool(re.search(r'#\s*FIXME|//\s*FIXME', text, re.IGNORECASE))
+    def _file_metadata(self, filepath: Path) -> Dict:
+        """File context shared by every chunk of a file (resolved once per file)"""
+        return {
+            'file': str(filepath.resolve()),
+            'file_name': filepath.name,
+            'file_type': filepath.suffix.lstrip('.'),
+        }
     
-    def _extract_python_metadata(self, text: str) -> Dict:
-        """Extract Python-specific metadata"""
-        metadata = {}
-        
-        # Check for function definitions
-        func_match = re.search(r'def\s+(\w+)\s*\(', text)
-        if func_match:
-            metadata['function_name'] = func_match.group(1)
+    def _scan_chunk(self, text: str, python: bool = False) -> Dict:
+        """
+        Code-analysis flags (error handling, logging, TODO, FIXME) and, for
+        Python, the first function/class name, in a single pass over the chunk.
+        """
+        if text.isascii():
+            hits = _METADATA_SCANNER.finditer(text.lower())
+        else:
+            hits = _METADATA_SCANNER_NOCASE.finditer(text)
         
-        # Check for class definitions
-        class_match = re.search(r'class\s+(\w+)', text)
-        if class_match:
-            metadata['class_name'] = class_match.group(1)
+        pending = [(key, probe) for key, probe in _PROBES if python or key not in _PYTHON_NAMES]
+        found = {}
+        for hit in hits:
+            matched = False
+            for key, probe in pending:
+                match = probe.match(text, hit.start())
+                if match is not None:
+                    found[key] = match.group(1) if key in _PYTHON_NAMES else True
+                    matched = True
+            if matched:
+                pending = [(key, probe) for key, probe in pending if key not in found]
+                if not pending:
+                    break
         
+        metadata = {key: found.get(key, False) for key, _ in _PROBES if key not in _PYTHON_NAMES}
+        metadata['line_count'] = text.count('\n') + 1
+        for key in _PYTHON_NAMES:
+            if key in found:
+                metadata[key] = found[key]
         return metadata
 
     def _get_code_splitter(self, language: Language) -> RecursiveCharacterTextSplitter:
@@ -212,72 +319,3 @@ class Chunker:
             )
         return self._splitters['text']
 
-
-class EnhancedChunker(Chunker):
-    """
-    Enhanced chunker that adds semantic metadata for Python files.
-    Uses AST for Python to extract function/class names.
-    """
-    
-    def chunk_file(self, filepath: Path, content: str) -> List[Dict]:
-        """
-        Chunk file with enhanced metadata extraction.
-        """
-        # Get base chunks from parent class
-        chunks = super().chunk_file(filepath, content)
-        
-        # Add enhanced metadata for Python files
-        if filepath.suffix == '.py':
-            chunks = self._enhance_python_chunks(filepath, content, chunks)
-        
-        return chunks
-    
-    def _enhance_python_chunks(self, filepath: Path, content: str, chunks: List[Dict]) -> List[Dict]:
-        """
-        Add function/class context to Python chunks using AST.
-        """
-        try:
-            tree = ast.parse(content)
-        except SyntaxError:
-            # If parsing fails, return chunks as-is
-            return chunks
-        
-        # Extract all function and class definitions with line numbers
-        definitions = []
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                definitions.append({
-                    'type': 'function',
-                    'name': node.name,
-                    'line_start': node.lineno,
-                    'line_end': node.end_lineno,
-                    'docstring': ast.get_docstring(node)
-                })
-            elif isinstance(node, ast.ClassDef):
-                definitions.append({
-                    'type': 'class',
-                    'name': node.name,
-                    'line_start': node.lineno,
-                    'line_end': node.end_lineno,
-                    'docstring': ast.get_docstring(node)
-                })
-        
-        # Match chunks to definitions based on content
-        for chunk in chunks:
-            chunk_text = chunk['text']
-            
-            # Find which definition this chunk belongs to
-            for defn in definitions:
-                # Simple heuristic: if chunk contains the definition name
-                if f"def {defn['name']}" in chunk_text or f"class {defn['name']}" in chunk_text:
-                    chunk['metadata'].update({
-                        'definition_type': defn['type'],
-                        'definition_name': defn['name'],
-                        'has_docstring': defn['docstring'] is not None
-                    })
-                    # Include docstring in chunk text if available
-                    if defn['docstring'] and defn['docstring'] not in chunk_text:
-                        chunk['text'] = f"# {defn['name']}: {defn['docstring']}\n\n{chunk_text}"
-                    break
-        
-        return chunks
\ No newline at end of file
@@ -25,4 +25,13 @@ class BaseEmbedder(ABC):
         Returns:
             Integer dimension (e.g., 768 for nomic-embed-text)
         """
-        pass
\ No newline at end of file
+        pass
+    
+    def get_model_name(self) -> str:
+        """
+        Name of the embedding model, used to key cached vectors.
+        
+        Returns:
+            Model name (defaults to the `model` attribute or the class name)
+        """
+        return getattr(self, "model", None) or type(self).__name__
@@ -0,0 +1,75 @@
+"""
+Request packing for embedding backends.
+
+Chunks from many files are packed into requests capped both by count and
+by an estimated token budget, so small files no longer produce tiny
+requests and large files no longer produce oversized ones. Each packed
+batch keeps the caller's items alongside the texts, so vectors can be
+mapped back to the chunks (and files) they belong to.
+"""
+from typing import Generic, List, NamedTuple, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+# Rough characters-per-token ratio for code and English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (len / 4), at least 1."""
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+class Batch(NamedTuple):
+    items: list       # caller-supplied items, parallel to texts
+    texts: List[str]
+    tokens: int       # estimated tokens in the batch
+
+
+class TokenBudgetBatcher(Generic[T]):
+    """
+    Streaming packer: add() texts one at a time and get back a Batch
+    whenever the current one is full.
+
+    A batch is closed before adding a text would exceed max_texts or
+    max_tokens. A single text larger than the token budget is sent on its
+    own rather than dropped (the backend truncates it).
+    """
+
+    def __init__(self, max_texts: int, max_tokens: int):
+        if max_texts < 1 or max_tokens < 1:
+            raise ValueError("max_texts and max_tokens must be positive")
+        self.max_texts = max_texts
+        self.max_tokens = max_tokens
+        self._items: list = []
+        self._texts: List[str] = []
+        self._tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def add(self, item: T, text: str) -> Optional[Batch]:
+        """
+        Queue one text. Returns the batch closed to make room for it,
+        or None if it fit into the current batch.
+        """
+        tokens = estimate_tokens(text)
+        closed = None
+        if self._texts and (
+            len(self._texts) >= self.max_texts or self._tokens + tokens > self.max_tokens
+        ):
+            closed = self.flush()
+
+        self._items.append(item)
+        self._texts.append(text)
+        self._tokens += tokens
+        return closed
+
+    def flush(self) -> Optional[Batch]:
+        """Close and return the current batch (None if empty)."""
+        if not self._texts:
+            return None
+        batch = Batch(self._items, self._texts, self._tokens)
+        self._items, self._texts, self._tokens = [], [], 0
+        return batch
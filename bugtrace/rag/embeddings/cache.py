@@ -0,0 +1,243 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are stored in .bugtrace/embeddings.db keyed by (embedding model,
+dimension, sha256 of the chunk text), so unchanged chunks of an edited
+file - or every chunk after a forced re-index - are served from disk
+instead of the embedding backend. The cache is capped in size and evicts
+least recently used entries.
+"""
+from array import array
+from pathlib import Path
+from typing import Dict, List
+import hashlib
+import sqlite3
+import threading
+import time
+
+from bugtrace.rag.embeddings.base import BaseEmbedder
+
+
+CACHE_FILE = "embeddings.db"
+DEFAULT_CACHE_MB = 512
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model     TEXT NOT NULL,
+    dim       INTEGER NOT NULL,
+    text_hash BLOB NOT NULL,
+    vector    BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, dim, text_hash)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used);
+"""
+
+# Stay well below SQLite's host-parameter limit in IN (...) lists
+_BATCH = 500
+
+# Evict down to this fraction of the cap so eviction doesn't run on every put
+_EVICT_TO = 0.9
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).digest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed vector cache with an LRU size cap.
+
+    Vectors are stored as float32. last_used is refreshed on every hit;
+    when the stored vectors exceed max_bytes the oldest entries are evicted.
+    Safe to use from the pipeline's embedding threads.
+    """
+
+    def __init__(self, db_path: Path, max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        self.size_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, dim: int, hashes: List[bytes]) -> Dict[bytes, List[float]]:
+        """Return {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time_ns()
+        with self._lock:
+            for i in range(0, len(unique), _BATCH):
+                batch = unique[i:i + _BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND dim = ? AND text_hash IN ({placeholders})",
+                    [model, dim, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                self._touch(model, dim, list(found), now)
+            self.hits += sum(1 for key in hashes if key in found)
+            self.misses += sum(1 for key in hashes if key not in found)
+        return found
+
+    def _touch(self, model: str, dim: int, keys: List[bytes], now: int):
+        """
+        Refresh last_used of cache hits. Best effort: if another process
+        holds the write lock, the hits are still served and only their LRU
+        position is stale.
+        """
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            return
+        try:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND dim = ? AND text_hash = ?",
+                [(now, model, dim, key) for key in keys],
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            self.conn.execute("ROLLBACK")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def put_many(self, model: str, dim: int, vectors: Dict[bytes, List[float]]):
+        """Store vectors and evict old entries if over the size cap."""
+        if not vectors:
+            return
+        now = time.time_ns()
+        rows = [
+            (model, dim, key, array("f", vector).tobytes(), now)
+            for key, vector in vectors.items()
+        ]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO embeddings (model, dim, text_hash, vector, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    if cursor.rowcount:
+                        self.size_bytes += len(row[3])
+                if self.size_bytes > self.max_bytes:
+                    self._evict()
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        target = int(self.max_bytes * _EVICT_TO)
+        while self.size_bytes > target:
+            rows = self.conn.execute(
+                "SELECT model, dim, text_hash, LENGTH(vector) FROM embeddings "
+                "ORDER BY last_used LIMIT ?",
+                (_BATCH,),
+            ).fetchall()
+            if not rows:
+                self.size_bytes = 0
+                break
+            for model, dim, key, length in rows:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE model = ? AND dim = ? AND text_hash = ?",
+                    (model, dim, key),
+                )
+                self.size_bytes -= length
+                if self.size_bytes <= target:
+                    break
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class CachedEmbedder(BaseEmbedder):
+    """
+    Embedder wrapper that consults an EmbeddingCache before calling the
+    wrapped embedder, which only sees the texts that missed.
+    """
+
+    def __init__(self, embedder: BaseEmbedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder.get_model_name()
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        dim = self.embedder.get_dimension()
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model, dim, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embedder.embed_texts(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model, dim, fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_texts(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedder.embed_query(text)
+
+    def get_dimension(self) -> int:
+        return self.embedder.get_dimension()
+
+    def get_model_name(self) -> str:
+        return self.model
+
+
+def cached_embedder(embedder: BaseEmbedder, state_dir: Path, config: dict) -> BaseEmbedder:
+    """
+    Wrap an embedder with the project's embedding cache, sized by
+    index.embedding_cache_mb (0 disables caching).
+    """
+    if isinstance(embedder, CachedEmbedder):
+        return embedder
+    cache_mb = (config.get("index") or {}).get("embedding_cache_mb", DEFAULT_CACHE_MB)
+    if not cache_mb:
+        return embedder
+    cache = _open_cache(state_dir / CACHE_FILE, cache_mb * 1024 * 1024)
+    return CachedEmbedder(embedder, cache)
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _open_cache(db_path: Path, max_bytes: int) -> EmbeddingCache:
+    """Return the shared cache for a database path."""
+    key = str(Path(db_path).resolve())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or not cache.db_path.exists():
+            cache = EmbeddingCache(Path(key), max_bytes)
+            _caches[key] = cache
+        cache.max_bytes = max_bytes
+        return cache
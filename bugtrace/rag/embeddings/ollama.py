@@ -23,8 +23,7 @@ class OllamaEmbedder(BaseEmbedder):
         
         # Test connection and get dimension
         try:
-            test_result = ollama.embeddings(model=self.model, prompt="test")
-            self._dimension = len(test_result["embedding"])
+            self._dimension = len(self._embed_one("test"))
         except Exception as e:
             raise RuntimeError(
                 f"Failed to connect to Ollama with model '{self.model}'. "
@@ -41,19 +40,24 @@ class OllamaEmbedder(BaseEmbedder):
         return [x / norm for x in vec]
     
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for batch of texts"""
+        """Generate embeddings for batch of texts (one /api/embed request)"""
         if not texts:
             return []
         
-        embeddings = []
-        for text in texts:
-            if not text or not text.strip():
-                # Return zero vector for empty text
-                embeddings.append([0.0] * self._dimension)
-                continue
-            
-            result = ollama.embeddings(model=self.model, prompt=text)
-            embeddings.append(self._normalize(result["embedding"]))
+        # Return zero vector for empty text
+        embeddings = [[0.0] * self._dimension for _ in texts]
+        positions = [i for i, text in enumerate(texts) if text and text.strip()]
+        if not positions:
+            return embeddings
+        
+        result = ollama.embed(model=self.model, input=[texts[i] for i in positions])
+        vectors = result["embeddings"]
+        if len(vectors) != len(positions):
+            raise RuntimeError(
+                f"Ollama returned {len(vectors)} embeddings for {len(positions)} texts"
+            )
+        for i, vec in zip(positions, vectors):
+            embeddings[i] = self._normalize(vec)
         
         return embeddings
     
@@ -67,5 +71,10 @@ class OllamaEmbedder(BaseEmbedder):
         return self.embed_texts(texts)
     
     def embed_query(self, text: str) -> List[float]:
-        result = ollama.embeddings(model=self.model, prompt=text)
-        return self._normalize(result["embedding"])
\ No newline at end of file
+        return self._normalize(self._embed_one(text))
+    
+    def _embed_one(self, text: str) -> List[float]:
+        # Same endpoint (/api/embed) as embed_texts: the legacy
+        # /api/embeddings truncates and normalizes differently, so queries
+        # would not be comparable with the indexed chunks
+        return ollama.embed(model=self.model, input=[text])["embeddings"][0]
\ No newline at end of file
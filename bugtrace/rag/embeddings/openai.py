@@ -7,9 +7,10 @@ load_dotenv()
 
 class OpenAIEmbedder(BaseEmbedder):
     def __init__(self):
+        self.model = "text-embedding-3-small"
         try:
             self.embedder = OpenAIEmbeddings(
-                model="text-embedding-3-small",
+                model=self.model,
                 api_key=os.getenv("OPENAI_API_KEY"),
             )
 
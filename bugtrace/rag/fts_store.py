@@ -0,0 +1,262 @@
+"""
+SQLite FTS5 keyword backend (rag.keyword_backend: fts5).
+
+Chunks live in one database file next to the vectors: their JSON in a
+plain table, their tokens in an FTS5 table with one column per field
+(body, path, symbol - see KeywordStore._fields). Python's sqlite3 cannot
+register a custom FTS5 tokenizer, so chunks are tokenized with the code
+tokenizer (see tokenizer) and stored as space-separated tokens; FTS5's
+unicode61 tokenizer, with '_' and '.' as token characters and diacritics
+kept, splits them back unchanged.
+
+Ranking is FTS5's bm25() with rag.field_weights as column weights. It
+weights each field's term frequency like BM25F but normalizes by the
+whole chunk's length rather than per field, so scores differ slightly
+from BM25Store.
+
+The index stays on disk: opening it is instant, memory does not grow
+with the project, and WAL mode lets sessions read while `bugtrace watch`
+writes. Every add, delete or replace is one transaction.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import sqlite3
+import threading
+
+from bugtrace.rag.bm25_index import DEFAULT_FIELD_WEIGHTS, FIELDS
+from bugtrace.rag.keyword_store import KeywordStore
+from bugtrace.rag.tokenizer import TOKENIZER_VERSION, tokenize_query
+
+
+# How FTS5 splits the stored tokens; part of the schema, since changing
+# it means recreating the table
+FTS_TOKENIZE = "unicode61 remove_diacritics 0 tokenchars '_.'"
+
+TOKENS_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_tokens USING fts5(
+    body, path, symbol,            -- FIELDS order, rowid = chunks.id
+    tokenize = "{FTS_TOKENIZE}"
+);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id       INTEGER PRIMARY KEY,
+    file     TEXT,
+    chunk_id TEXT,
+    document TEXT NOT NULL         -- JSON {"text", "metadata"}
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS chunks_key ON chunks (file, chunk_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+""" + TOKENS_TABLE
+
+# Stay well below SQLite's host-parameter limit in IN (...) lists
+_BATCH = 500
+
+
+class FTS5Store(KeywordStore):
+    """
+    Keyword index in an SQLite FTS5 table.
+
+    A chunk is keyed by (file, chunk_id): adding it again replaces the
+    stored copy. The connection is shared by the threads of a process
+    behind a lock; other processes read concurrently through WAL.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        project_root: Optional[Path] = None,
+        field_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.project_root = project_root.resolve() if project_root is not None else None
+
+        weights = {**DEFAULT_FIELD_WEIGHTS, **(field_weights or {})}
+        self.weights = tuple(float(weights[field]) for field in FIELDS)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            self.conn.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.conn.close()
+            raise RuntimeError(
+                f"SQLite {sqlite3.sqlite_version} has no FTS5 support ({e}); "
+                "set rag.keyword_backend to bm25"
+            ) from e
+
+        self._check_schema()
+
+    @property
+    def schema(self) -> dict:
+        """How tokens are built; an index built otherwise is re-tokenized on open."""
+        return {
+            "tokenizer": TOKENIZER_VERSION,
+            "root": str(self.project_root) if self.project_root is not None else None,
+            "fields": list(FIELDS),
+            "fts_tokenize": FTS_TOKENIZE,
+        }
+
+    def _check_schema(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is not None and json.loads(row[0]) == self.schema:
+            return
+
+        with self._transaction() as conn:
+            conn.execute("DROP TABLE chunk_tokens")
+            conn.execute(TOKENS_TABLE)
+            rows = conn.execute("SELECT id, document FROM chunks").fetchall()
+            conn.executemany(
+                "INSERT INTO chunk_tokens (rowid, body, path, symbol) VALUES (?, ?, ?, ?)",
+                ((chunk_id, *self._columns(json.loads(document))) for chunk_id, document in rows),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)",
+                (json.dumps(self.schema),),
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def _columns(self, doc: dict) -> List[str]:
+        return [" ".join(tokens) for tokens in self._fields(doc)]
+
+    def _insert(self, conn: sqlite3.Connection, chunks: List[Dict]):
+        for chunk in chunks:
+            doc = {
+                "text": chunk["text"],
+                "metadata": chunk["metadata"]
+            }
+            key = (doc["metadata"].get("file"), str(doc["metadata"].get("chunk_id")))
+            row = conn.execute("SELECT id FROM chunks WHERE file = ? AND chunk_id = ?", key).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM chunk_tokens WHERE rowid = ?", row)
+                conn.execute("DELETE FROM chunks WHERE id = ?", row)
+
+            cursor = conn.execute(
+                "INSERT INTO chunks (file, chunk_id, document) VALUES (?, ?, ?)",
+                (*key, json.dumps(doc)),
+            )
+            conn.execute(
+                "INSERT INTO chunk_tokens (rowid, body, path, symbol) VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, *self._columns(doc)),
+            )
+
+    def _delete(self, conn: sqlite3.Connection, paths: List[str]):
+        for i in range(0, len(paths), _BATCH):
+            batch = paths[i:i + _BATCH]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(
+                f"DELETE FROM chunk_tokens WHERE rowid IN "
+                f"(SELECT id FROM chunks WHERE file IN ({placeholders}))",
+                batch,
+            )
+            conn.execute(f"DELETE FROM chunks WHERE file IN ({placeholders})", batch)
+
+    def add_chunks(self, chunks):
+        """
+        Add chunks to the FTS index.
+        """
+        if not chunks:
+            return
+        with self._transaction() as conn:
+            self._insert(conn, chunks)
+
+    def delete_files(self, paths):
+        """
+        Remove the chunks of many files in one transaction.
+        """
+        paths = sorted({str(Path(filepath).resolve()) for filepath in paths})
+        if not paths:
+            return
+        with self._transaction() as conn:
+            self._delete(conn, paths)
+
+    def replace_files(self, files):
+        """
+        Replace the chunks of many files ({filepath: chunks}) in one
+        transaction.
+        """
+        paths = sorted({str(Path(filepath).resolve()) for filepath in files})
+        with self._transaction() as conn:
+            self._delete(conn, paths)
+            for chunks in files.values():
+                self._insert(conn, chunks)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, k: int = 5):
+        # Quoted, so tokens such as "and" or "not" are not read as operators
+        terms = dict.fromkeys(tokenize_query(query))
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+
+        # Rank in a subquery: joined first, SQLite would sort the chunk JSON
+        # of every match instead of k rowids
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT chunks.document, top.score FROM ("
+                "    SELECT rowid, -bm25(chunk_tokens, ?, ?, ?) AS score FROM chunk_tokens"
+                "    WHERE chunk_tokens MATCH ? ORDER BY score DESC, rowid LIMIT ?"
+                ") AS top JOIN chunks ON chunks.id = top.rowid "
+                "ORDER BY top.score DESC, top.rowid",
+                (*self.weights, match, k),
+            ).fetchall()
+
+        # Chunks without any query term score 0, so normalize against
+        # [0, best score] like BM25Store's min/max over all chunks
+        max_score = rows[0][1] if rows else 0.0
+        results = []
+        for document, score in rows:
+            doc = json.loads(document)
+            if max_score <= 0:
+                normalized = 1.0
+            else:
+                normalized = max(score, 0.0) / max_score
+
+            normalized = 0.1 + (0.9 * normalized)
+
+            results.append({
+                    "text": doc["text"],
+                    "metadata": doc["metadata"],
+                    "score": float(normalized),
+                    "bm25_score": float(normalized),
+                    "source": "bm25"
+                })
+
+        return results
@@ -1,56 +1,108 @@
 # bugtrace/rag/indexer.py
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, NamedTuple
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
 import hashlib
 import json
 
-from bugtrace.utils.fs import ensure_state_dir, load_manifest
+from bugtrace.utils.fs import ensure_state_dir, entry_hash
 from bugtrace.utils.state import StateManager
 from bugtrace.config.settings import load_user_config, validate_config
 from bugtrace.rag.vector_store import VectorStore
+from bugtrace.rag.chunker import CHUNKER_VERSION
 from bugtrace.rag.embeddings import get_embedder
+from bugtrace.rag.embeddings.cache import CachedEmbedder, cached_embedder
+from bugtrace.rag.pipeline import PipelineResult, run_pipeline
 
 
 
 console = Console()
 
 
+# Config keys that invalidate the index, grouped by what a change costs.
+# Anything else (llm.model, llm.temperature, analysis.*, tools.*, index.*
+# tuning, ...) never triggers re-indexing.
+INDEX_SCOPES = {
+    # Re-embed everything
+    "embedding": [("llm", "provider"), ("rag", "store")],
+    # Re-chunk and re-embed; identical chunks come from the embedding cache
+    "chunking": [("rag", "chunk_size"), ("rag", "chunk_overlap")],
+    # Only the added/removed files change, which the scan already diffs
+    "discovery": [("paths", "ignore"), ("paths", "discovery")],
+}
+
+# Scopes whose change requires a full re-index
+REINDEX_SCOPES = ("embedding", "chunking")
+
+# Code versions hashed into a scope, so changing how chunks are cut
+# re-chunks existing indexes too
+SCOPE_VERSIONS = {"chunking": CHUNKER_VERSION}
+
+
 def hash_config(config: dict) -> str:
-    """Generate hash of config for change detection."""
+    """Generate hash of the whole config (pre-scope state only)."""
     config_str = json.dumps(config, sort_keys=True)
     return hashlib.sha256(config_str.encode()).hexdigest()
 
-def index_project(project_root: Path, force: bool = False, verbose: bool = True):
+def hash_config_scopes(config: dict) -> Dict[str, str]:
+    """Hash the keys of each INDEX_SCOPES scope: {scope: hash}."""
+    scopes = {}
+    for scope, keys in INDEX_SCOPES.items():
+        values = [(config.get(section) or {}).get(key) for section, key in keys]
+        if scope in SCOPE_VERSIONS:
+            values.append(SCOPE_VERSIONS[scope])
+        scopes[scope] = hashlib.sha256(
+            json.dumps(values, sort_keys=True).encode()
+        ).hexdigest()
+    return scopes
+
+class IndexResult(NamedTuple):
+    indexed: int      # files (re-)embedded by this run
+    removed: int      # files dropped from the index
+    total_files: int  # files tracked in the manifest
+
+    @property
+    def fresh(self) -> bool:
+        """True when the index was already up to date."""
+        return not self.indexed and not self.removed
+
+def index_project(
+    project_root: Path,
+    force: bool = False,
+    verbose: bool = True,
+    paranoid: bool = False,
+    jobs: int = None,
+    config: dict = None,
+    vector_store: VectorStore = None,
+) -> IndexResult:
     """
     Main indexing function with full state management.
     
+    Scans the project once and hands the in-memory manifest straight to
+    indexing. The embedder and vector store are only set up when there is
+    something to embed or delete, so a fresh index costs one stat pass.
+    
     Args:
         project_root: Root directory of the project
         force: If True, forces full re-index regardless of state
         verbose: If True, shows detailed progress. If False, minimal output.
+        paranoid: If True, the scan rehashes every file instead of trusting stat data
+        jobs: Number of hashing threads for the scan (defaults to scan.jobs)
+        config: Already loaded config (loaded and validated here if None)
+        vector_store: Open vector store to reuse (created on demand if None)
     """
     if verbose:
         console.print("[bold]Building RAG Index[/bold]\n")
     
+    project_root = Path(project_root).resolve()
     state_dir = ensure_state_dir(project_root)
     state_manager = StateManager(state_dir)
 
-    # Step 1: Check if manifest exists
-    if verbose:
-        console.print("[dim]1. Checking project scan status...[/dim]")
-    manifest_path = state_dir / "manifest.json"
-    
-    from bugtrace.analyze.core import scan_project
-    scan_project(project_root, verbose=verbose)
+    # Step 1: Load and validate config (once for the whole pipeline)
     if verbose:
-        console.print("   [green]✓ Scan complete[/green]\n")
-    
-    # Step 2: Load and validate config
-    if verbose:
-        console.print("[dim]2. Loading configuration...[/dim]")
-    config = load_user_config(project_root)
+        console.print("[dim]1. Loading configuration...[/dim]")
+    if config is None:
+        config = load_user_config(project_root)
     
     try:
         validate_config(config)
@@ -60,32 +112,59 @@ def index_project(project_root: Path, force: bool = False, verbose: bool = True)
         console.print(f"   [red]✗ Invalid configuration:[/red]\n{e}")
         raise
     
+    # Step 2: Scan - brings the manifest up to date and returns it
+    if verbose:
+        console.print("[dim]2. Scanning project files...[/dim]")
+    from bugtrace.analyze.core import scan_project
+    scan = scan_project(
+        project_root,
+        verbose=verbose,
+        paranoid=paranoid,
+        jobs=jobs,
+        config=config,
+        state_manager=state_manager,
+    )
+    if verbose:
+        console.print("   [green]✓ Scan complete[/green]\n")
+    
     # Step 3: Check for config changes
     if verbose:
         console.print("[dim]3. Checking for configuration changes...[/dim]")
-    current_config_hash = hash_config(config)
-    config_changed = state_manager.config_changed(current_config_hash)
+    current_scopes = hash_config_scopes(config)
+    changed_scopes = state_manager.changed_config_scopes(
+        current_scopes, legacy_hash=hash_config(config)
+    )
     
-    if config_changed:
+    if "embedding" in changed_scopes:
+        if verbose:
+            console.print("   [yellow]⚠ Embedding settings changed - full re-embed required[/yellow]")
+    elif "chunking" in changed_scopes:
+        if verbose:
+            console.print("   [yellow]⚠ Chunking settings changed - re-chunking all files "
+                          "(unchanged chunks reuse cached embeddings)[/yellow]")
+    elif "discovery" in changed_scopes:
         if verbose:
-            console.print("   [yellow]⚠ Configuration changed - full re-index required[/yellow]")
-        force = True  # Config change forces full re-index
+            console.print("   [cyan]→ Ignore rules changed - only added/removed files are updated[/cyan]")
     else:
         if verbose:
-            console.print("   [green]✓ Configuration unchanged[/green]")
+            console.print("   [green]✓ No index-relevant configuration changes[/green]")
     
-    # Step 4: Load manifest and determine what to index
+    if any(scope in changed_scopes for scope in REINDEX_SCOPES):
+        force = True
+    elif changed_scopes and not force:
+        # Discovery changes are fully handled by the scan/stale-file diff
+        state_manager.update_config_scopes(current_scopes)
+    
+    # Step 4: Determine what to index from the scanned manifest
     if verbose:
         console.print("[dim]4. Analyzing files to index...[/dim]")
-    manifest = load_manifest(state_dir)
+    manifest = scan.manifest
     
     if not manifest:
         console.print("   [red]✗ Manifest is empty. Nothing to index.[/red]")
-        return
+        return IndexResult(0, 0, 0)
 
     index_dir = state_dir / "index"
-    embedder = get_embedder(config)
-    vector_store = VectorStore(index_dir, project_root, embedder=embedder)
     
     
     # -------------------------------
@@ -95,25 +174,26 @@ def index_project(project_root: Path, force: bool = False, verbose: bool = True)
         console.print("[dim]4.5 Cleaning removed/ignored files from index...[/dim]")
 
     indexed_files = state_manager.state.get("indexed_files", {})
-    manifest_files = set(manifest.keys())
+    removed_files = [path for path in indexed_files if path not in manifest]
+    state_manager.clear_failures(
+        [path for path in state_manager.get_failures() if path not in manifest]
+    )
 
-    removed_files = set(indexed_files.keys()) - manifest_files
+    if force:
+        files_to_index = {path: entry_hash(entry) for path, entry in manifest.items()}
+    else:
+        files_to_index = state_manager.get_files_to_index(manifest)
+
+    if (removed_files or files_to_index) and vector_store is None:
+        index_dir.mkdir(exist_ok=True)
+        vector_store = VectorStore(index_dir, project_root, embedder=get_embedder(config), field_weights=config["rag"].get("field_weights"),
+                              keyword_backend=config["rag"].get("keyword_backend", "bm25"))
 
     if removed_files:
         if verbose:
             console.print(f"   [yellow]→ Removing {len(removed_files)} stale files from vector DB[/yellow]")
 
-        for file_path in removed_files:
-            try:
-                vector_store.delete_file_chunks(file_path)
-            except Exception:
-                pass  # safe fallback
-
-            # remove from state tracking
-            indexed_files.pop(file_path, None)
-
-        state_manager.state["indexed_files"] = indexed_files
-        state_manager.save()
+        _remove_from_index(removed_files, vector_store, state_manager)
 
         if verbose:
             console.print("   [green]✓ Stale files removed[/green]")
@@ -125,18 +205,19 @@ def index_project(project_root: Path, force: bool = False, verbose: bool = True)
     # -------------------------------
     
     if force:
-        files_to_index = manifest
+        # Forget everything up front and record the new config scopes: files
+        # are checkpointed as they are written, so an interrupted full
+        # re-index resumes where it stopped instead of starting over
+        state_manager.reset_indexed_files(current_scopes)
         if verbose:
             console.print(f"   [yellow]→ Full re-index: {len(files_to_index)} files[/yellow]")
     else:
-        files_to_index = state_manager.get_files_to_index(manifest)
-        
         if not files_to_index:
             if verbose:
                 console.print("   [green]✓ All files already indexed - nothing to do![/green]")
                 console.print(f"\n[bold green]✅ Index is up to date![/bold green]")
                 console.print(f"   • Total indexed files: {len(manifest)}")
-            return
+            return IndexResult(0, len(removed_files), len(manifest))
         
         if verbose:
             console.print(f"   [cyan]→ Incremental index: {len(files_to_index)} files need updating[/cyan]")
@@ -165,34 +246,105 @@ def index_project(project_root: Path, force: bool = False, verbose: bool = True)
         console.print("[bold]Building embeddings...[/bold]")
     
     try:
-        _build_embeddings(files_to_index, config, index_dir, state_manager, verbose=verbose)
-        
-        # Step 8: Update state after successful indexing
-        state_manager.mark_files_indexed(files_to_index)
-        state_manager.update_config_hash(current_config_hash)
-        state_manager.update_index_time()
-        state_manager.update_metadata(
-            total_files=len(manifest),
-            total_chunks=len(files_to_index) * 10  # Placeholder ## TODO change this later
+        result = _build_embeddings(
+            files_to_index, config, index_dir, state_manager,
+            verbose=verbose, embedder=vector_store.embedder, vector_store=vector_store,
         )
         
+        # Step 8: Update state after indexing. Written files were already
+        # checkpointed batch by batch; failed ones stay unmarked (and are
+        # listed by `bugtrace status`) so the next run retries them.
+        with state_manager.transaction():
+            state_manager.update_config_scopes(current_scopes)
+            state_manager.update_index_time()
+            state_manager.update_metadata(total_files=len(manifest))
+        
         if verbose:
             console.print(f"\n[bold green]✅ Indexing complete![/bold green]")
-            console.print(f"   • Indexed: {len(files_to_index)} files")
+            console.print(f"   • Indexed: {len(files_to_index) - len(result.failed)} files")
+            if result.failed:
+                console.print(f"   • Failed: {len(result.failed)} files (retried on the next run)")
             console.print(f"   • Total in index: {len(manifest)} files")
             console.print(f"   • Index location: {index_dir}")
         
     except Exception as e:
         console.print(f"\n[bold red]❌ Indexing failed:[/bold red] {e}")
         raise
+    
+    return IndexResult(len(files_to_index) - len(result.failed), len(removed_files), len(manifest))
+
+def index_changes(
+    project_root: Path,
+    config: dict,
+    state_manager: StateManager,
+    changed: Dict[str, str],
+    removed: Iterable[str] = (),
+    embedder=None,
+    vector_store: VectorStore = None,
+    verbose: bool = False,
+) -> int:
+    """
+    Push a known set of changes through chunk -> embed -> store.
+    
+    Used by `bugtrace watch`, which already knows which paths changed and
+    keeps its embedder and vector store open between batches, so there is
+    no scan, config check or stale-file sweep here.
+    
+    Args:
+        project_root: Root directory of the project
+        config: Validated user configuration
+        state_manager: State manager instance
+        changed: Dict of {filepath: hash} of new or modified files
+        removed: File paths to drop from the index
+        embedder / vector_store: Reused when given, created otherwise
+    
+    Returns the number of chunks written.
+    """
+    removed = [path for path in removed if path in state_manager.state.get("indexed_files", {})]
+    if not changed and not removed:
+        return 0
+    
+    index_dir = state_manager.state_dir / "index"
+    index_dir.mkdir(exist_ok=True)
+    if vector_store is None:
+        embedder = embedder or get_embedder(config)
+        vector_store = VectorStore(index_dir, project_root, embedder=embedder, field_weights=config["rag"].get("field_weights"),
+                              keyword_backend=config["rag"].get("keyword_backend", "bm25"))
+    
+    _remove_from_index(removed, vector_store, state_manager)
+    result = _build_embeddings(
+        changed, config, index_dir, state_manager,
+        verbose=verbose, embedder=vector_store.embedder, vector_store=vector_store,
+        show_progress=verbose,
+    )
+    
+    state_manager.update_index_time()
+    return result.chunks
+
+def _remove_from_index(paths: Iterable[str], vector_store: VectorStore, state_manager: StateManager):
+    """
+    Delete files' chunks from the vector store and forget them in state.
+    
+    If the delete fails the error propagates and the files stay recorded
+    (with their chunk ids), so the next run retries instead of leaving
+    untracked chunks in the index.
+    """
+    paths = list(paths)
+    vector_store.delete_files(paths, state_manager.get_chunk_ids(paths))
+    
+    # remove from state tracking
+    state_manager.unmark_files_indexed(paths)
 
 def _build_embeddings(
     files_to_index: Dict[str, str],
     config: dict,
     index_dir: Path,
     state_manager: StateManager,
-    verbose: bool = True
-):
+    verbose: bool = True,
+    embedder=None,
+    vector_store: VectorStore = None,
+    show_progress: bool = True,
+) -> PipelineResult:
     """
     Build embeddings for files and store in vector database.
     
@@ -201,46 +353,44 @@ def _build_embeddings(
         config: User configuration
         index_dir: Directory for vector store
         state_manager: State manager instance
+        embedder / vector_store: Reused when given, created otherwise
+        show_progress: Show the pipeline progress bar
+    
+    Returns the PipelineResult; files in .failed were not written.
     """
 
     from bugtrace.rag.embeddings import get_embedder
-    from bugtrace.rag.chunker import Chunker
     from bugtrace.rag.vector_store import VectorStore
     from pathlib import Path as FilePath
     
     if not files_to_index:
-        return
+        return PipelineResult(0, 0, {}, 0.0, 0.0)
 
     # Initialize components
 
-    if verbose:
-        console.print("[dim]Initializing embedding system...[/dim]")
-    
-    try:
-        embedder = get_embedder(config)
+    if embedder is None:
         if verbose:
-            console.print(f"   [green]✓ Embedder ready (dimension: {embedder.get_dimension()})[/green]")
-    except Exception as e:
-        console.print(f"   [red]✗ Failed to initialize embedder: {e}[/red]")
-        raise
-
-    chunker = Chunker(
-        chunk_size=config['rag']['chunk_size'],
-        chunk_overlap=config['rag']['chunk_overlap']
-    )
+            console.print("[dim]Initializing embedding system...[/dim]")
+        
+        try:
+            embedder = get_embedder(config)
+            if verbose:
+                console.print(f"   [green]✓ Embedder ready (dimension: {embedder.get_dimension()})[/green]")
+        except Exception as e:
+            console.print(f"   [red]✗ Failed to initialize embedder: {e}[/red]")
+            raise
 
-    # Get project root from first file path
-    first_file = FilePath(list(files_to_index.keys())[0])
-    project_root = first_file.parent
-    while project_root.parent != project_root:
-        if (project_root / ".bugtrace").exists():
-            break
-        project_root = project_root.parent
-    
-      # Initialize embedder
-    embedder = get_embedder(config)
-    
-    vector_store = VectorStore(index_dir, project_root, embedder=embedder)
+    if vector_store is None:
+        # Get project root from first file path
+        first_file = FilePath(list(files_to_index.keys())[0])
+        project_root = first_file.parent
+        while project_root.parent != project_root:
+            if (project_root / ".bugtrace").exists():
+                break
+            project_root = project_root.parent
+        
+        vector_store = VectorStore(index_dir, project_root, embedder=embedder, field_weights=config["rag"].get("field_weights"),
+                              keyword_backend=config["rag"].get("keyword_backend", "bm25"))
     if verbose:
         # console.print(f"   [green]✓ Vector store ready: {vector_store.collection_name}[/green]\n")
         console.print("   [green]✓ Hybrid retrieval system ready[/ green]")
@@ -248,56 +398,47 @@ def _build_embeddings(
         console.print("   • BM25 store: ready\n")
     
 
-# Process files with progress
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        
-        task = progress.add_task(
-            f"Processing {len(files_to_index)} files...",
-            total=len(files_to_index)
+    # Unchanged chunks are served from .bugtrace/embeddings.db
+    embedder = cached_embedder(embedder, state_manager.state_dir, config)
+    
+    # Checkpoint every store commit: written files are marked indexed with
+    # their chunk ids right away, so an interrupted run resumes from here
+    def on_written(written: Dict[str, List[str]]):
+        state_manager.mark_files_indexed(
+            {path: files_to_index[path] for path in written}, written
         )
-        
-        total_chunks = 0
-        
-        for filepath_str in files_to_index.keys():
-            filepath = FilePath(filepath_str)
-            
-            try:
-                # Read file content
-                content = filepath.read_text(encoding='utf-8', errors='ignore')
-                
-                # Delete old chunks for this file
-                vector_store.delete_file_chunks(str(filepath))
-                
-                # Chunk the file
-                chunks = chunker.chunk_file(filepath, content)
-                
-                if not chunks:
-                    progress.advance(task)
-                    continue
-                
-                # Generate embeddings
-                texts = [chunk['text'] for chunk in chunks]
-                embeddings = embedder.embed_texts(texts)
-                
-                # Store in vector database
-                vector_store.add_chunks(chunks, embeddings)
-                
-                total_chunks += len(chunks)
-                progress.update(
-                    task,
-                    description=f"Processed {filepath.name}: {len(chunks)} chunks"
-                )
-                
-            except Exception as e:
-                console.print(f"   [yellow]⚠ Error processing {filepath.name}: {e}[/yellow]")
-            
-            progress.advance(task)
-        if verbose:
-            progress.update(task, description=f"[green]✓ Completed: {total_chunks} chunks indexed")
-    # Update state metadata with actual chunk count
-    state_manager.update_metadata(total_chunks=total_chunks)
+
+    def on_failed(filepath: str, error: str):
+        state_manager.record_failures({filepath: (files_to_index.get(filepath), error)})
+    
+    # Process files through the read -> chunk -> embed -> write pipeline
+    result = run_pipeline(
+        files_to_index.keys(),
+        config,
+        embedder,
+        vector_store,
+        show_progress=show_progress,
+        on_written=on_written,
+        on_failed=on_failed,
+        stored_ids=state_manager.get_chunk_ids,
+    )
+    
+    for filepath, error in result.failed.items():
+        console.print(f"   [yellow]⚠ Error processing {FilePath(filepath).name}: {error}[/yellow]")
+    if verbose and result.files:
+        console.print(
+            f"   [dim]{result.files / max(result.elapsed, 1e-6):.1f} files/s, "
+            f"{result.chunks / max(result.elapsed, 1e-6):.1f} chunks/s, "
+            f"embed {result.embed_latency * 1000:.0f} ms/batch[/dim]"
+        )
+        if isinstance(embedder, CachedEmbedder):
+            console.print(
+                f"   [dim]Embedding cache: {embedder.cache.hits} hits, "
+                f"{embedder.cache.misses} misses[/dim]"
+            )
+    
+    # Record the chunks now in the index (an incremental run only knows
+    # how many it wrote itself)
+    state_manager.update_metadata(total_chunks=vector_store.get_stats()["total_chunks"])
+    return result
     
\ No newline at end of file
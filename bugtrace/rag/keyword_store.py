@@ -0,0 +1,148 @@
+"""
+Keyword (lexical) indexes searched next to the vectors.
+
+VectorStore keeps one keyword store per collection, picked by
+rag.keyword_backend:
+
+    bm25  BM25Store - memory-mapped BM25F segment plus journal (default)
+    fts5  FTS5Store - SQLite FTS5 table ranked with bm25()
+
+Both index the same fields per chunk (see KeywordStore._fields) and
+return results in the same shape, so hybrid search does not care which
+one is in use.
+"""
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+import os
+import shutil
+
+from bugtrace.rag.bm25_index import FIELDS
+from bugtrace.rag.tokenizer import tokenize
+
+
+KEYWORD_BACKENDS = ("bm25", "fts5")
+
+# Where each backend keeps its index inside a collection directory
+_BACKEND_PATHS = {"bm25": "bm25", "fts5": "keywords.db"}
+
+# Chunk metadata indexed in the symbol field
+_SYMBOL_KEYS = ("function_name", "class_name", "qualified_name", "symbols", "definition_name")
+
+
+class KeywordStore(ABC):
+    """
+    Base class for keyword indexes over chunks.
+
+    Chunks are dicts with 'text' and 'metadata'; a file's chunks are
+    addressed by the resolved path in metadata['file']. search() returns
+    dicts with 'text', 'metadata', 'score' and 'bm25_score' (normalized to
+    0.1-1.0) and 'source': 'bm25'.
+    """
+
+    project_root: Optional[Path] = None
+
+    @abstractmethod
+    def add_chunks(self, chunks: List[Dict]):
+        """Index chunks."""
+        pass
+
+    @abstractmethod
+    def delete_files(self, paths):
+        """Remove the chunks of several files."""
+        pass
+
+    @abstractmethod
+    def replace_files(self, files: Dict[str, List[Dict]]):
+        """Replace the chunks of several files ({filepath: chunks})."""
+        pass
+
+    @abstractmethod
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """The k best chunks for a query, best first."""
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of indexed chunks."""
+        pass
+
+    def delete_file_chunks(self, filepath: str):
+        self.delete_files([filepath])
+
+    def close(self):
+        """Release files and connections held by the store."""
+        pass
+
+    def _fields(self, doc: dict) -> List[List[str]]:
+        """Tokens of a chunk per field, in FIELDS order: text, path, symbols."""
+        metadata = doc["metadata"]
+
+        path = metadata.get("file") or ""
+        if self.project_root is not None:
+            prefix = str(self.project_root) + os.sep
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+
+        names = []
+        for key in _SYMBOL_KEYS:
+            value = metadata.get(key)
+            if value and str(value) not in names:
+                names.append(str(value))
+
+        fields = {
+            "body": tokenize(doc["text"]),
+            "path": tokenize(path),
+            "symbol": tokenize(" ".join(names)),
+        }
+        return [fields[field] for field in FIELDS]
+
+
+def get_keyword_store(
+    backend: str,
+    persist_dir: Path,
+    project_root: Optional[Path] = None,
+    field_weights: Optional[Dict[str, float]] = None,
+) -> KeywordStore:
+    """
+    Factory function to create the keyword store of a collection.
+
+    Indexes left in persist_dir by the other backends are removed: they
+    stop being updated once another backend is in use, and switching back
+    must start from an empty index (which VectorStore then refills).
+
+    Args:
+        backend: rag.keyword_backend (one of KEYWORD_BACKENDS)
+        persist_dir: Collection directory (.bugtrace/index/<collection>)
+        project_root: Project root, paths are indexed relative to it
+        field_weights: Weight per field (rag.field_weights)
+
+    Returns:
+        KeywordStore instance
+    """
+    if backend not in KEYWORD_BACKENDS:
+        raise ValueError(f"Unsupported keyword backend: {backend}")
+
+    for other, name in _BACKEND_PATHS.items():
+        if other != backend:
+            _remove_index(persist_dir / name)
+
+    path = persist_dir / _BACKEND_PATHS[backend]
+    if backend == "fts5":
+        from bugtrace.rag.fts_store import FTS5Store
+        return FTS5Store(path, project_root=project_root, field_weights=field_weights)
+
+    from bugtrace.rag.bm25_store import BM25Store
+    return BM25Store(path, project_root=project_root, field_weights=field_weights)
+
+
+def _remove_index(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    # SQLite keeps its write-ahead log next to the database
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(str(path) + suffix)
+        except FileNotFoundError:
+            pass
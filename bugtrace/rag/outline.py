@@ -0,0 +1,354 @@
+# bugtrace/rag/outline.py
+"""
+Outline scanners for brace languages (JS/TS, Go, Java, Rust).
+
+No parser dependency: one compiled scanner per language walks the file
+once, stepping from brace to brace while the regex engine skips code,
+comments and string literals in between. Whenever a `{` opens, the
+statement head before it is matched against that language's declaration
+patterns; the matching `}` closes the symbol. The result is
+the same Symbol tree the Python front end produces, so pack_symbols()
+chunks these files on symbol boundaries too.
+
+Symbols are only recognised at the top level and directly inside
+containers (classes, interfaces, impl blocks, namespaces, ...); anything
+declared inside a function body stays part of that function.
+"""
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+import re
+
+from bugtrace.rag.structure import Symbol, line_at, newline_offsets
+
+
+class _Decl(NamedTuple):
+    pattern: Pattern
+    kind: str              # "class" (container) or "function"
+    member_only: bool      # only valid directly inside a container
+    hints: Tuple[str, ...]  # the head must contain one of these to match
+
+
+class _Language(NamedTuple):
+    braces: Pattern        # skips code, literals and comments up to the next brace
+    tokens: Pattern        # comments, literals and ';' inside a statement head
+    decls: List[_Decl]     # tried in order; group "name" (and optional "owner")
+
+
+# Keywords that look like `name(...) {` but never declare anything
+_CONTROL = frozenset(
+    "if for while switch catch with synchronized try else do return new "
+    "function match loop unsafe async await yield typeof delete throw".split()
+)
+
+# Longest statement head (characters before a `{`) matched against declarations
+_MAX_HEAD = 1000
+
+# Lines above a declaration that belong to it
+_ANNOTATIONS = ("@", "#[")
+
+_NOT_NEWLINE = re.compile(r"[^\n]")
+
+_COMMENTS = [r"//[^\n]*", r"/\*.*?\*/"]
+_DQ_STRING = r'"(?:\\.|[^"\\\n])*"'
+_SQ_STRING = r"'(?:\\.|[^'\\\n])*'"
+
+
+def _language(literals: List[str], starters: str, decls: List[_Decl]) -> _Language:
+    """
+    Compile a language's scanners. `starters` are the characters a
+    comment or literal can begin with; everything else is skipped in bulk.
+    """
+    skip = "|".join(
+        [f"[^{{}}{re.escape(starters)}]+"] + _COMMENTS + literals + [f"[{re.escape(starters)}]"]
+    )
+    return _Language(
+        # One match per structural brace: the regex engine consumes the code,
+        # literals and comments before it, so Python only sees braces.
+        # The empty alternative ends the last match at the end of the file.
+        braces=re.compile(f"(?:{skip})*(?P<brace>[{{}}]|\\Z)", re.DOTALL),
+        tokens=re.compile("|".join(_COMMENTS + literals + [";"]), re.DOTALL),
+        decls=decls,
+    )
+
+
+def _decl(pattern: str, kind: str, hints: Tuple[str, ...], member_only: bool = False) -> _Decl:
+    # Declarations are matched against the end of the statement head
+    return _Decl(re.compile(pattern + r"\s*\Z", re.DOTALL | re.MULTILINE), kind, member_only, hints)
+
+
+_TS_MODIFIERS = r"(?:(?:export|default|declare|abstract|public|private|protected|static|readonly|override|async|get|set)\s+)*"
+_TS_TYPE_PARAMS = r"(?:<[^{}]*?>)?"
+_TS_RETURN = r"(?::[^{}=;]*)?"
+
+_JS = _language(
+    literals=[_DQ_STRING, _SQ_STRING, r"`(?:\\.|[^`\\])*`"],
+    starters="/\"'`",
+    decls=[
+        _decl(
+            r"\b(?:class|interface|enum|namespace|module)\s+(?P<name>[A-Za-z_$][\w$]*)"
+            r"[^{};]*",
+            "class",
+            ("class", "interface", "enum", "namespace", "module"),
+        ),
+        _decl(
+            r"\bfunction\b\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)\s*" + _TS_TYPE_PARAMS
+            + r"\s*\([^{};]*\)\s*" + _TS_RETURN,
+            "function",
+            ("function",),
+        ),
+        _decl(
+            r"\b(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*(?::[^=;{}]*)?=\s*(?:async\s*)?"
+            r"(?:function\b\s*\*?\s*[\w$]*\s*\([^{};]*\)|" + _TS_TYPE_PARAMS
+            + r"\s*(?:\([^{};]*\)|[A-Za-z_$][\w$]*)\s*" + _TS_RETURN + r"\s*=>)\s*" + _TS_RETURN,
+            "function",
+            ("=",),
+        ),
+        # Class members: methods, accessors and arrow-function fields
+        _decl(
+            r"^[ \t]*" + _TS_MODIFIERS + r"\*?\s*(?P<name>#?[A-Za-z_$][\w$]*)\s*\??\s*"
+            + _TS_TYPE_PARAMS + r"\s*\([^{};]*\)\s*" + _TS_RETURN,
+            "function",
+            ("(",),
+            member_only=True,
+        ),
+        _decl(
+            r"^[ \t]*" + _TS_MODIFIERS + r"(?P<name>#?[A-Za-z_$][\w$]*)\s*(?::[^=;{}]*)?="
+            r"\s*(?:async\s*)?(?:\([^{};]*\)|[A-Za-z_$][\w$]*)\s*" + _TS_RETURN + r"\s*=>",
+            "function",
+            ("=>",),
+            member_only=True,
+        ),
+    ],
+)
+
+_GO = _language(
+    literals=[_DQ_STRING, _SQ_STRING, r"`[^`]*`"],
+    starters="/\"'`",
+    decls=[
+        _decl(
+            r"^[ \t]*func\s*(?:\(\s*(?:\w+\s+)?\*?\s*(?P<owner>\w+)[^)]*\)\s*)?"
+            r"(?P<name>\w+)\s*(?:\[[^\]]*\])?\s*\([^{}]*",
+            "function",
+            ("func",),
+        ),
+        _decl(
+            r"^[ \t]*type\s+(?P<name>\w+)\s*(?:\[[^\]]*\])?\s+(?:struct|interface)",
+            "class",
+            ("type",),
+        ),
+    ],
+)
+
+_JAVA = _language(
+    literals=[r'""".*?"""', _DQ_STRING, _SQ_STRING],
+    starters="/\"'",
+    decls=[
+        _decl(
+            r"\b(?:class|interface|enum|record)\s+(?P<name>\w+)[^{};]*",
+            "class",
+            ("class", "interface", "enum", "record"),
+        ),
+        # Methods and constructors
+        _decl(
+            r"(?<!new )\b(?P<name>\w+)\s*\([^{};]*\)\s*(?:throws\s+[\w.,\s<>]+)?",
+            "function",
+            ("(",),
+            member_only=True,
+        ),
+    ],
+)
+
+_RUST = _language(
+    literals=[
+        r'r(?P<hashes>#*)".*?"(?P=hashes)',
+        r'"(?:\\.|[^"\\])*"',
+        # Char literals; a lone quote is a lifetime and is skipped
+        r"'(?:\\.[^'\n]*|[^\\'\n])'",
+    ],
+    starters="/\"'r",
+    decls=[
+        _decl(r"\bfn\s+(?P<name>\w+)[^{};]*", "function", ("fn",)),
+        _decl(
+            r"\b(?:struct|enum|trait|union|mod)\s+(?P<name>\w+)[^{};]*",
+            "class",
+            ("struct", "enum", "trait", "union", "mod"),
+        ),
+        _decl(
+            r"\bimpl\b\s*(?:<[^{};]*?>)?\s*(?:[^{};]*?\bfor\s+)?(?P<name>[\w:]+)[^{};]*",
+            "class",
+            ("impl",),
+        ),
+    ],
+)
+
+LANGUAGES: Dict[str, _Language] = {
+    '.js': _JS,
+    '.jsx': _JS,
+    '.mjs': _JS,
+    '.cjs': _JS,
+    '.ts': _JS,
+    '.tsx': _JS,
+    '.go': _GO,
+    '.java': _JAVA,
+    '.rs': _RUST,
+}
+
+
+class _Open(NamedTuple):
+    symbol: Optional[dict]  # None for a plain block
+    container: bool
+
+
+def outline_symbols(suffix: str, content: str) -> Optional[List[Symbol]]:
+    """
+    Symbol tree of a JS/TS, Go, Java or Rust file, or None if the
+    language has no scanner or nothing was found.
+    """
+    language = LANGUAGES.get(suffix)
+    if language is None:
+        return None
+
+    newlines = newline_offsets(content)
+    roots: List[dict] = []
+    stack: List[_Open] = []
+    blocks = 0  # open braces on the stack that are not containers
+    head_start = 0
+
+    for match in language.braces.finditer(content):
+        brace = match.group("brace")
+        if not brace:
+            break
+        pos = match.start("brace")
+
+        if brace == "{":
+            symbol = None
+            # Only the top level and container bodies declare symbols
+            if not blocks:
+                symbol = _declaration(language, content, head_start, pos, bool(stack), newlines)
+            parent = stack[-1].symbol if stack else None
+            siblings = parent["children"] if parent else roots
+            # Symbols must own their lines: one that shares a line with its
+            # parent's signature or a previous sibling (`}; function f() {`,
+            # minified code) stays part of the surrounding text
+            if symbol is not None and (
+                (siblings and siblings[-1]["end"] >= symbol["start"])
+                or (parent is not None and symbol["start"] <= parent["header_end"])
+            ):
+                symbol = None
+            if symbol is not None:
+                # Go methods are qualified by their receiver type
+                owner = symbol.pop("owner")
+                if parent is not None:
+                    symbol["qualname"] = f"{parent['qualname']}.{symbol['name']}"
+                elif owner:
+                    symbol["qualname"] = f"{owner}.{symbol['name']}"
+                else:
+                    symbol["qualname"] = symbol["name"]
+                (parent["children"] if parent else roots).append(symbol)
+            container = symbol is not None and symbol["kind"] == "class"
+            stack.append(_Open(symbol, container))
+            blocks += not container
+        elif stack:
+            entry = stack.pop()
+            blocks -= not entry.container
+            if entry.symbol is not None:
+                entry.symbol["end"] = line_at(newlines, pos)
+
+        head_start = pos + 1
+
+    last_line = line_at(newlines, max(len(content) - 1, 0))
+    for entry in stack:
+        if entry.symbol is not None and "end" not in entry.symbol:
+            entry.symbol["end"] = last_line
+
+    symbols = [_freeze(symbol) for symbol in roots if "end" in symbol]
+    return symbols or None
+
+
+def _declaration(
+    language: _Language,
+    content: str,
+    head_start: int,
+    brace: int,
+    in_container: bool,
+    newlines: List[int],
+) -> Optional[dict]:
+    """Match the statement head before a `{` against the declarations."""
+    # Declaration heads are short; don't rescan huge expressions
+    head_start = max(head_start, brace - _MAX_HEAD)
+    head = content[head_start:brace]
+    if not head.strip():
+        return None
+
+    # The head starts after the last ';'; comments are blanked out
+    # (keeping offsets) so they can't look like declarations
+    cut = 0
+    comments = []
+    tokens = language.tokens.finditer(head) if (";" in head or "/" in head) else ()
+    for token in tokens:
+        if token.group() == ";":
+            cut = token.end()
+            comments = []
+        elif token.group()[:2] in ("//", "/*"):
+            comments.append(token.span())
+    head_start += cut
+    head = head[cut:]
+    if comments:
+        parts, last = [], 0
+        for start, end in comments:
+            parts.append(head[last:start - cut])
+            parts.append(_NOT_NEWLINE.sub(" ", head[start - cut:end - cut]))
+            last = end - cut
+        parts.append(head[last:])
+        head = "".join(parts)
+    if not head.strip():
+        return None
+
+    for decl in language.decls:
+        if decl.member_only and not in_container:
+            continue
+        # Substring checks are much cheaper than a failed search
+        if not any(hint in head for hint in decl.hints):
+            continue
+        found = decl.pattern.search(head)
+        if found is None or found.group("name") in _CONTROL:
+            continue
+        owner = found.groupdict().get("owner")
+        return {
+            "name": found.group("name").split("::")[-1],
+            "kind": decl.kind,
+            "start": line_at(newlines, head_start + _declaration_start(head, found.start())),
+            "header_end": line_at(newlines, brace),
+            "children": [],
+            "owner": owner,
+        }
+    return None
+
+
+def _declaration_start(head: str, pos: int) -> int:
+    """
+    Offset in head where a declaration starts: the start of the line the
+    match begins on, extended over annotation/attribute lines right above
+    it (`@Override`, `#[derive(...)]`). Heads of languages without `;`
+    can reach far back, so the head's own start is not used.
+    """
+    while pos < len(head) and head[pos].isspace():
+        pos += 1
+    line_start = head.rfind("\n", 0, pos) + 1
+    while line_start > 0:
+        previous = head.rfind("\n", 0, line_start - 1) + 1
+        if not head[previous:line_start].strip().startswith(_ANNOTATIONS):
+            break
+        line_start = previous
+    return line_start
+
+
+def _freeze(symbol: dict) -> Symbol:
+    return Symbol(
+        name=symbol["name"],
+        qualname=symbol["qualname"],
+        kind=symbol["kind"],
+        start=symbol["start"],
+        header_end=symbol["header_end"],
+        end=symbol["end"],
+        children=[_freeze(child) for child in symbol["children"] if "end" in child],
+    )
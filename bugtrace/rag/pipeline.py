@@ -0,0 +1,416 @@
+# bugtrace/rag/pipeline.py
+"""
+Staged indexing pipeline.
+
+    read (threads) -> chunk (process pool) -> embed (token-budget batches, concurrent) -> write (one thread)
+
+Each stage hands work to the next through a bounded window or queue, so
+disk reads, chunking, embedding requests and store writes overlap while
+memory stays flat on large projects. The writer is the only stage that
+touches the stores; it commits whole files in bulk.
+"""
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from bugtrace.rag.chunker import Chunker
+from bugtrace.rag.embeddings.batching import Batch, TokenBudgetBatcher
+
+
+console = Console()
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_TOKENS = 16384
+DEFAULT_EMBED_CONCURRENCY = 2
+DEFAULT_WRITE_BATCH = 512
+
+# Below this many files per worker, starting chunk processes costs more
+# than it saves; chunk on a thread instead
+_MIN_FILES_PER_WORKER = 4
+
+
+class PipelineSettings(NamedTuple):
+    jobs: int               # chunking worker processes (1 = chunk on a thread)
+    read_threads: int
+    batch_size: int         # texts per embedding request
+    batch_tokens: int       # estimated tokens per embedding request
+    embed_concurrency: int  # embedding requests in flight
+    write_batch: int        # chunks per store commit
+
+
+class PipelineResult(NamedTuple):
+    files: int                  # files written to the stores
+    chunks: int                 # chunks written to the stores
+    failed: Dict[str, str]      # {filepath: error} for files that were not written
+    elapsed: float              # seconds
+    embed_latency: float        # mean seconds per embedding request
+
+
+def pipeline_settings(config: dict) -> PipelineSettings:
+    """Read the `index` config section, filling in defaults."""
+    index = config.get("index") or {}
+    cpus = os.cpu_count() or 1
+
+    jobs = index.get("jobs") or min(cpus, 8)
+    return PipelineSettings(
+        jobs=jobs,
+        read_threads=min(4, max(1, jobs)),
+        batch_size=index.get("batch_size") or DEFAULT_BATCH_SIZE,
+        batch_tokens=index.get("batch_tokens") or DEFAULT_BATCH_TOKENS,
+        embed_concurrency=index.get("embed_concurrency") or DEFAULT_EMBED_CONCURRENCY,
+        write_batch=DEFAULT_WRITE_BATCH,
+    )
+
+
+# ----------------------------------------------------------------------
+# Stage functions (chunking runs in worker processes)
+# ----------------------------------------------------------------------
+
+_worker_chunker: Optional[Chunker] = None
+
+
+def _init_chunk_worker(chunk_size: int, chunk_overlap: int):
+    global _worker_chunker
+    _worker_chunker = Chunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _chunk_file(filepath: str, content: str) -> List[Dict]:
+    return _worker_chunker.chunk_file(Path(filepath), content)
+
+
+def _read_file(filepath: str) -> str:
+    return Path(filepath).read_text(encoding="utf-8", errors="ignore")
+
+
+def _embed_batch(embedder, texts: List[str]) -> Tuple[List[List[float]], float]:
+    started = time.perf_counter()
+    embeddings = embedder.embed_texts(texts)
+    if len(embeddings) != len(texts):
+        raise RuntimeError(f"embedder returned {len(embeddings)} vectors for {len(texts)} texts")
+    return embeddings, time.perf_counter() - started
+
+
+def _bounded(submit: Callable[..., Future], items: Iterable, window: int) -> Iterator[Tuple[object, Future]]:
+    """
+    Submit items with at most `window` futures in flight and yield
+    (item, future) in submission order.
+    """
+    in_flight = deque()
+    for item in items:
+        in_flight.append((item, submit(item)))
+        if len(in_flight) >= window:
+            yield in_flight.popleft()
+    while in_flight:
+        yield in_flight.popleft()
+
+
+# ----------------------------------------------------------------------
+# Pipeline
+# ----------------------------------------------------------------------
+
+class _Writer(threading.Thread):
+    """
+    Single consumer that owns all store writes.
+
+    Receives embedded batches as (entries, embeddings, done_files, error)
+    where entries are (filepath, chunk) pairs. A file is committed only once
+    all of its chunks have arrived (it is listed in done_files); each commit
+    replaces the old chunks of all its files in one replace_files call.
+
+    After each commit, on_written({filepath: chunk ids}) is called for the
+    files it wrote, so callers can checkpoint progress batch by batch.
+    Files that fail are reported through fail(filepath, error).
+
+    stored_ids(filepaths) returns the chunk ids recorded for files that are
+    already in the store, so their old chunks are deleted by id.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        write_batch: int,
+        on_commit: Callable[[int, int], None],
+        fail: Callable[[str, str], None],
+        on_written: Optional[Callable[[Dict[str, List[str]]], None]] = None,
+        stored_ids: Optional[Callable[[List[str]], Dict[str, List[str]]]] = None,
+    ):
+        super().__init__(name="bugtrace-index-writer", daemon=True)
+        self.vector_store = vector_store
+        self.write_batch = write_batch
+        self.on_commit = on_commit
+        self.fail = fail
+        self.on_written = on_written
+        self.stored_ids = stored_ids
+        self.inbox: queue.Queue = queue.Queue(maxsize=4)
+
+        self.buffer: Dict[str, List[Tuple[Dict, List[float]]]] = {}
+        self.ready: List[str] = []
+        self.ready_chunks = 0
+        self.failed: Set[str] = set()
+        self.files = 0
+        self.chunks = 0
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                break
+            entries, embeddings, done_files, error = item
+
+            if error is not None:
+                newly_failed = [
+                    filepath for filepath in dict.fromkeys(filepath for filepath, _ in entries)
+                    if filepath not in self.failed
+                ]
+                for filepath in newly_failed:
+                    self.failed.add(filepath)
+                    self.fail(filepath, error)
+                # Failed files are done too, as far as progress goes
+                if newly_failed:
+                    self.on_commit(len(newly_failed), 0)
+            else:
+                for (filepath, chunk), embedding in zip(entries, embeddings):
+                    self.buffer.setdefault(filepath, []).append((chunk, embedding))
+
+            for filepath in done_files:
+                if filepath in self.failed:
+                    self.buffer.pop(filepath, None)
+                    continue
+                self.ready.append(filepath)
+                self.ready_chunks += len(self.buffer.get(filepath, ()))
+
+            if self.ready_chunks >= self.write_batch:
+                self._commit()
+        self._commit()
+
+    def _commit(self):
+        if not self.ready:
+            return
+        files, self.ready, self.ready_chunks = self.ready, [], 0
+
+        chunks, embeddings = {}, {}
+        for filepath in files:
+            buffered = self.buffer.pop(filepath, ())
+            chunks[filepath] = [chunk for chunk, _ in buffered]
+            embeddings[filepath] = [embedding for _, embedding in buffered]
+
+        try:
+            old_ids = self.stored_ids(files) if self.stored_ids is not None else None
+            written = self.vector_store.replace_files(chunks, embeddings, old_ids)
+        except Exception as e:
+            for filepath in files:
+                self.failed.add(filepath)
+                self.fail(filepath, f"write failed: {e}")
+            self.on_commit(len(files), 0)
+            return
+
+        if self.on_written is not None:
+            try:
+                self.on_written(written)
+            except Exception as e:
+                # The chunks are stored but not recorded; the next run redoes them
+                for filepath in files:
+                    self.fail(filepath, f"checkpoint failed: {e}")
+
+        chunk_count = sum(len(file_chunks) for file_chunks in chunks.values())
+        self.files += len(files)
+        self.chunks += chunk_count
+        self.on_commit(len(files), chunk_count)
+
+
+def run_pipeline(
+    files: Iterable[str],
+    config: dict,
+    embedder,
+    vector_store,
+    settings: PipelineSettings = None,
+    show_progress: bool = True,
+    on_written: Optional[Callable[[Dict[str, List[str]]], None]] = None,
+    on_failed: Optional[Callable[[str, str], None]] = None,
+    stored_ids: Optional[Callable[[List[str]], Dict[str, List[str]]]] = None,
+) -> PipelineResult:
+    """
+    Chunk, embed and store files.
+
+    Args:
+        files: File paths to (re-)index
+        config: User configuration (rag.chunk_size / rag.chunk_overlap / index.*)
+        embedder: Embedder used for all batches
+        vector_store: Store the writer commits to
+        settings: Overrides pipeline_settings(config)
+        show_progress: Render a progress bar with throughput
+        on_written: Called from the writer thread with {filepath: chunk ids}
+            after every store commit, so progress can be checkpointed
+        on_failed: Called with (filepath, error) as soon as a file fails
+        stored_ids: Returns {filepath: chunk ids} recorded for the files of
+            a commit, so their old chunks are deleted by id
+
+    Returns a PipelineResult; files that failed to read, chunk, embed or
+    write are listed in .failed and left untouched in the stores.
+    """
+    paths = list(files)
+    settings = settings or pipeline_settings(config)
+    started = time.perf_counter()
+    if not paths:
+        return PipelineResult(0, 0, {}, 0.0, 0.0)
+
+    chunk_args = (config["rag"]["chunk_size"], config["rag"]["chunk_overlap"])
+    if settings.jobs > 1 and len(paths) >= settings.jobs * _MIN_FILES_PER_WORKER:
+        chunk_pool = ProcessPoolExecutor(
+            max_workers=settings.jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_chunk_worker,
+            initargs=chunk_args,
+        )
+        chunk_window = settings.jobs * 4
+    else:
+        chunk_pool = ThreadPoolExecutor(
+            max_workers=1, initializer=_init_chunk_worker, initargs=chunk_args
+        )
+        chunk_window = 4
+    read_pool = ThreadPoolExecutor(max_workers=settings.read_threads, thread_name_prefix="bugtrace-read")
+    embed_pool = ThreadPoolExecutor(max_workers=settings.embed_concurrency, thread_name_prefix="bugtrace-embed")
+
+    failed: Dict[str, str] = {}
+    failed_lock = threading.Lock()
+    latency = {"total": 0.0, "requests": 0}
+
+    def fail(filepath: str, error: str):
+        with failed_lock:
+            failed[filepath] = error
+            if on_failed is not None:
+                try:
+                    on_failed(filepath, error)
+                except Exception:
+                    pass  # the failure is still returned in PipelineResult.failed
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("[dim]{task.fields[rate]}[/dim]"),
+        TimeElapsedColumn(),
+        console=console,
+        disable=not show_progress,
+    )
+    task = progress.add_task("Indexing", total=len(paths), rate="")
+    totals = {"files": 0, "chunks": 0}
+    totals_lock = threading.Lock()
+
+    def on_commit(file_count: int, chunk_count: int):
+        with totals_lock:
+            totals["files"] += file_count
+            totals["chunks"] += chunk_count
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            mean_ms = latency["total"] / latency["requests"] * 1000 if latency["requests"] else 0.0
+            rate = (
+                f"{totals['files'] / elapsed:.1f} files/s · "
+                f"{totals['chunks'] / elapsed:.1f} chunks/s · "
+                f"embed {mean_ms:.0f} ms/batch"
+            )
+        progress.update(task, advance=file_count, rate=rate)
+
+    writer = _Writer(vector_store, settings.write_batch, on_commit, fail, on_written, stored_ids)
+
+    def read_stage():
+        submit = lambda filepath: read_pool.submit(_read_file, filepath)
+        for filepath, future in _bounded(submit, paths, settings.read_threads * 4):
+            try:
+                yield filepath, future.result()
+            except Exception as e:
+                fail(filepath, f"read failed: {e}")
+                on_commit(1, 0)
+
+    def chunk_stage():
+        submit = lambda item: chunk_pool.submit(_chunk_file, *item)
+        for (filepath, _), future in _bounded(submit, read_stage(), chunk_window):
+            try:
+                yield filepath, future.result()
+            except Exception as e:
+                fail(filepath, f"chunking failed: {e}")
+                on_commit(1, 0)
+
+    in_flight = deque()
+    # Packs chunks from many files into requests capped by count and tokens
+    batcher = TokenBudgetBatcher(settings.batch_size, settings.batch_tokens)
+    batch_done: List[str] = []
+
+    def drain_one():
+        entries, done_files, future = in_flight.popleft()
+        try:
+            embeddings, seconds = future.result()
+        except Exception as e:
+            writer.inbox.put((entries, None, done_files, f"embedding failed: {e}"))
+            return
+        with totals_lock:
+            latency["total"] += seconds
+            latency["requests"] += 1
+        writer.inbox.put((entries, embeddings, done_files, None))
+
+    def submit_batch(closed: Optional[Batch]):
+        # Files finished so far had all their chunks in `closed` or earlier
+        nonlocal batch_done
+        done_files, batch_done = batch_done, []
+        if closed is not None:
+            entries = closed.items
+            future = embed_pool.submit(_embed_batch, embedder, closed.texts)
+        else:
+            entries = []
+            future = Future()
+            future.set_result(([], 0.0))
+        in_flight.append((entries, done_files, future))
+        while len(in_flight) > settings.embed_concurrency:
+            drain_one()
+
+    writer.start()
+    try:
+        with progress:
+            for filepath, chunks in chunk_stage():
+                for chunk in chunks:
+                    closed = batcher.add((filepath, chunk), chunk["text"])
+                    if closed is not None:
+                        submit_batch(closed)
+                batch_done.append(filepath)
+
+            if len(batcher) or batch_done:
+                submit_batch(batcher.flush())
+            while in_flight:
+                drain_one()
+
+            writer.inbox.put(None)
+            writer.join()
+            progress.update(
+                task,
+                description=f"[green]✓ Indexed {writer.files} files ({writer.chunks} chunks)",
+            )
+    finally:
+        if writer.is_alive():
+            try:
+                writer.inbox.put(None, timeout=5)
+            except queue.Full:
+                pass
+        read_pool.shutdown(wait=False, cancel_futures=True)
+        embed_pool.shutdown(wait=False, cancel_futures=True)
+        chunk_pool.shutdown(wait=True, cancel_futures=True)
+
+    mean_latency = latency["total"] / latency["requests"] if latency["requests"] else 0.0
+    return PipelineResult(
+        writer.files, writer.chunks, failed, time.perf_counter() - started, mean_latency
+    )
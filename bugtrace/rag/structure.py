@@ -0,0 +1,298 @@
+# bugtrace/rag/structure.py
+"""
+Structural chunking: cut files on symbol boundaries instead of separators.
+
+A language front end turns a file into a tree of Symbols (line spans of
+classes, functions and methods); pack_symbols() then packs that tree into
+chunks:
+
+- small neighbouring symbols (and the code between them) are merged up
+  to chunk_size
+- a class that does not fit is packed member by member
+- an oversized body is split into line windows, and every window carries
+  the enclosing signature(s) so it still reads as part of its symbol
+  (innermost first: outer ones are dropped when they would take more
+  than half the chunk)
+
+Each chunk records the qualified names (`Class.method`) of the symbols it
+covers, so chunks line up with what the agent cites.
+"""
+from typing import List, NamedTuple, Optional
+import ast
+import bisect
+
+
+class Symbol(NamedTuple):
+    name: str
+    qualname: str          # e.g. "Outer.Inner.method"
+    kind: str              # "class" or "function"
+    start: int             # first line (decorators included), 1-based
+    header_end: int        # last line of the signature
+    end: int               # last line, inclusive
+    children: list         # nested Symbols that may become chunks of their own
+
+
+class Piece(NamedTuple):
+    text: str
+    start: int             # first source line covered, 1-based
+    end: int               # last source line covered, inclusive
+    symbols: List[Symbol]  # symbols that start in this piece, in order
+    scope: Optional[str]   # qualified name of the enclosing symbol
+
+
+# A carried signature may use at most this share of a chunk
+_MAX_HEADER_SHARE = 4
+
+# ... and all carried signatures together at most this share
+_MAX_CARRIED_SHARE = 2
+
+
+def split_lines(content: str) -> List[str]:
+    """Split on '\\n' only (as the Python tokenizer does), keeping line ends."""
+    lines = content.split("\n")
+    last = lines.pop()
+    lines = [line + "\n" for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def newline_offsets(content: str) -> List[int]:
+    """Character offsets of every newline in content, in order."""
+    offsets = []
+    pos = content.find('\n')
+    while pos != -1:
+        offsets.append(pos)
+        pos = content.find('\n', pos + 1)
+    return offsets
+
+
+def line_at(newlines: List[int], offset: int) -> int:
+    """1-based line number of a character offset (newlines from newline_offsets)."""
+    return bisect.bisect_left(newlines, offset) + 1
+
+
+# ----------------------------------------------------------------------
+# Python front end
+# ----------------------------------------------------------------------
+
+def python_symbols(content: str) -> List[Symbol]:
+    """
+    Top-level classes and functions of a Python module, with methods and
+    nested classes as children of their class. Raises SyntaxError if the
+    source does not parse.
+    """
+    tree = ast.parse(content)
+    return _python_body(tree.body, "")
+
+
+def _python_body(body, prefix: str) -> List[Symbol]:
+    symbols = []
+    for node in body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        first = node.body[0]
+        first_line = min([first.lineno] + [d.lineno for d in getattr(first, "decorator_list", ())])
+        qualname = f"{prefix}{node.name}"
+
+        if isinstance(node, ast.ClassDef):
+            kind = "class"
+            children = _python_body(node.body, qualname + ".")
+        else:
+            # Nested functions stay part of their function's body
+            kind = "function"
+            children = []
+
+        symbols.append(Symbol(
+            name=node.name,
+            qualname=qualname,
+            kind=kind,
+            start=start,
+            header_end=max(node.lineno, first_line - 1),
+            end=node.end_lineno,
+            children=children,
+        ))
+    return symbols
+
+
+# ----------------------------------------------------------------------
+# Packer
+# ----------------------------------------------------------------------
+
+def pack_symbols(
+    lines: List[str],
+    symbols: List[Symbol],
+    chunk_size: int,
+    chunk_overlap: int = 0,
+) -> List[Piece]:
+    """
+    Pack a file's lines into chunks of at most chunk_size characters
+    (single lines longer than that are cut), following the symbol tree.
+    """
+    packer = _Packer(lines, chunk_size, chunk_overlap)
+    packer.pack(1, len(lines), symbols, [], None)
+    return packer.pieces
+
+
+class _Packer:
+    def __init__(self, lines: List[str], chunk_size: int, chunk_overlap: int):
+        self.lines = lines
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_overlap = max(0, chunk_overlap)
+        self.pieces: List[Piece] = []
+
+        # offsets[i] = character offset of line i + 1
+        self.offsets = [0]
+        for line in lines:
+            self.offsets.append(self.offsets[-1] + len(line))
+
+    def size(self, start: int, end: int) -> int:
+        return self.offsets[end] - self.offsets[start - 1]
+
+    def text(self, start: int, end: int) -> str:
+        return "".join(self.lines[start - 1:end])
+
+    def carried(self, headers: List[str]) -> str:
+        """
+        The signatures that prefix a piece. Outer ones are dropped first so
+        the prefix leaves at least half the chunk for the body it introduces.
+        """
+        limit = self.chunk_size // _MAX_CARRIED_SHARE
+        kept, size = [], 0
+        for header in reversed(headers):
+            if size + len(header) > limit:
+                break
+            kept.append(header)
+            size += len(header)
+        return "".join(reversed(kept))
+
+    def signature(self, symbol: Symbol) -> str:
+        header = self.text(symbol.start, symbol.header_end)
+        limit = self.chunk_size // _MAX_HEADER_SHARE
+        if len(header) > limit:
+            header = header[:limit].rstrip() + " ...\n"
+        return header
+
+    # ------------------------------------------------------------------
+
+    def pack(self, lo: int, hi: int, symbols: List[Symbol], headers: List[str], scope: Optional[str], lead: Optional[int] = None):
+        """
+        Pack lines lo..hi, which contain `symbols`, prefixing every piece
+        with the carried `headers`. `lead` is the line where those headers
+        start, reported as the start of the first piece.
+        """
+        # Alternate the code between symbols (None) with the symbols themselves
+        items = []
+        cursor = lo
+        for symbol in symbols:
+            if symbol.start > cursor:
+                items.append((cursor, symbol.start - 1, None))
+            items.append((symbol.start, symbol.end, symbol))
+            cursor = symbol.end + 1
+        if cursor <= hi:
+            items.append((cursor, hi, None))
+
+        budget = self.chunk_size - len(self.carried(headers))
+        group, group_size = [], 0
+        for start, end, symbol in items:
+            size = self.size(start, end)
+            if size > budget:
+                lead = self.flush(group, headers, scope, lead)
+                group, group_size = [], 0
+                self.split(start, end, symbol, headers, scope, lead)
+                lead = None
+                continue
+            if group and group_size + size > budget:
+                lead = self.flush(group, headers, scope, lead)
+                group, group_size = [], 0
+            group.append((start, end, symbol))
+            group_size += size
+        self.flush(group, headers, scope, lead)
+
+    def flush(self, group, headers: List[str], scope: Optional[str], lead: Optional[int]) -> Optional[int]:
+        """Emit one piece for a group of items; returns the unused lead."""
+        if not group:
+            return lead
+        span = self.trim(group[0][0], group[-1][1])
+        if span is None:
+            return lead
+        start, end = span
+        symbols = [symbol for _, _, symbol in group if symbol is not None]
+        self.piece(self.carried(headers) + self.text(start, end), lead or start, end, symbols, scope)
+        return None
+
+    def trim(self, start: int, end: int):
+        """Drop blank lines at both ends; None if nothing is left."""
+        while start <= end and not self.lines[start - 1].strip():
+            start += 1
+        while end >= start and not self.lines[end - 1].strip():
+            end -= 1
+        return (start, end) if start <= end else None
+
+    def split(self, start: int, end: int, symbol: Optional[Symbol], headers: List[str], scope: Optional[str], lead: Optional[int]):
+        """Break up one item that is larger than a chunk."""
+        if symbol is None:
+            self.windows(start, end, headers, [], scope, lead)
+            return
+
+        inner_headers = headers + [self.signature(symbol)]
+        body_start = symbol.header_end + 1
+        if symbol.children:
+            self.pack(body_start, symbol.end, symbol.children, inner_headers, symbol.qualname, lead or symbol.start)
+        elif body_start <= symbol.end:
+            # The carried signature gives each window its context, so the
+            # windows of a body do not overlap
+            self.windows(body_start, symbol.end, inner_headers, [symbol], scope, lead or symbol.start, overlap=0)
+        else:
+            # Signature alone is oversized (e.g. a one-line def)
+            self.windows(symbol.start, symbol.end, headers, [symbol], scope, lead)
+
+    def windows(
+        self,
+        start: int,
+        end: int,
+        headers: List[str],
+        symbols: List[Symbol],
+        scope: Optional[str],
+        lead: Optional[int],
+        overlap: Optional[int] = None,
+    ):
+        """Line windows of at most one chunk, overlapping by ~chunk_overlap."""
+        overlap = self.chunk_overlap if overlap is None else overlap
+        prefix = self.carried(headers)
+        budget = self.chunk_size - len(prefix)
+        line = start
+        while line <= end:
+            if self.size(line, line) > budget:
+                self.cut_line(line, prefix, budget, symbols, scope, lead)
+                lead = None
+                line += 1
+                continue
+
+            last = line
+            while last < end and self.size(line, last + 1) <= budget:
+                last += 1
+            span = self.trim(line, last)
+            if span is not None:
+                self.piece(prefix + self.text(*span), lead or span[0], span[1], symbols, scope)
+                lead = None
+            if last >= end:
+                break
+
+            # Step back for the overlap, but always move forward
+            next_line = last + 1
+            while next_line - 1 > line and self.size(next_line - 1, last) <= overlap:
+                next_line -= 1
+            line = next_line
+
+    def cut_line(self, line: int, prefix: str, budget: int, symbols: List[Symbol], scope: Optional[str], lead: Optional[int]):
+        text = self.lines[line - 1]
+        for i in range(0, len(text), budget):
+            part = text[i:i + budget]
+            if part.strip():
+                self.piece(prefix + part, lead or line, line, symbols, scope)
+                lead = None
+
+    def piece(self, text: str, start: int, end: int, symbols: List[Symbol], scope: Optional[str]):
+        self.pieces.append(Piece(text.rstrip("\n"), start, end, symbols, scope))
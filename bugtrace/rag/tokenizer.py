@@ -0,0 +1,95 @@
+"""
+Code-aware tokenizer for the BM25 keyword index.
+
+Every identifier is indexed whole and by its parts, so a query in plain
+words finds the code that spells them as one name:
+
+    VectorStore.delete_file_chunks
+        -> vectorstore.delete_file_chunks  (whole, lowercased)
+           vectorstore, delete_file_chunks (dotted parts)
+           vector, store, delete, file, chunk (camelCase / snake_case
+                                               parts, stemmed)
+
+Parts are lowercased and lightly stemmed (plural endings only, which is
+what varies between `chunks` in prose and `chunk` in names). Single
+characters are only kept when they are the whole token.
+
+Identifiers are runs of Unicode word characters, so non-ASCII names,
+comments and CJK text are indexed too; camelCase splitting follows each
+letter's case, and letters without case (CJK, for example) stay in one
+word.
+
+Bump TOKENIZER_VERSION whenever the output changes: indexes built with
+another version are rebuilt on open.
+"""
+from functools import lru_cache
+from itertools import chain
+from typing import List, Tuple
+import re
+
+
+TOKENIZER_VERSION = 3
+
+_TOKEN = re.compile(r'\w+(?:\.\w+)*')
+_WORD = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens of a document: identifiers whole, then their parts."""
+    return list(chain.from_iterable(map(_split_token, _TOKEN.findall(text))))
+
+
+@lru_cache(maxsize=1024)
+def tokenize_query(text: str) -> Tuple[str, ...]:
+    """tokenize() for queries, memoized (agents repeat their searches)."""
+    return tuple(tokenize(text))
+
+
+@lru_cache(maxsize=65536)
+def _split_token(token: str) -> Tuple[str, ...]:
+    whole = token.lower()
+    tokens = [whole]
+    for component in token.split("."):
+        lowered = component.lower()
+        if lowered != whole and len(lowered) > 1:
+            tokens.append(lowered)
+        for word in _words(component):
+            stem = _stem(word)
+            if stem != lowered and len(stem) > 1:
+                tokens.append(stem)
+    return tuple(tokens)
+
+
+def _words(component: str) -> List[str]:
+    words = []
+    for part in component.split("_"):
+        if not part:
+            continue
+        if part.isascii():
+            words.extend(word.lower() for word in _WORD.findall(part))
+        else:
+            # Split the part's case shape with the ASCII pattern and cut
+            # the part at the same places
+            shape = "".join(map(_shape, part))
+            words.extend(part[m.start():m.end()].lower() for m in _WORD.finditer(shape))
+    return words
+
+
+def _shape(char: str) -> str:
+    if char.isupper():
+        return "A"
+    if char.isdigit():
+        return "0"
+    return "a"
+
+
+def _stem(word: str) -> str:
+    if len(word) <= 3 or not word.endswith("s"):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith(("ss", "us", "is")):
+        return word
+    return word[:-1]
@@ -1,23 +1,102 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, Dict, Iterable, List, Optional
 from langchain_chroma import Chroma 
 import hashlib
-from bugtrace.rag.bm25_store import BM25Store
+import json
+import queue
+import threading
+import time
+from bugtrace.rag.keyword_store import get_keyword_store
+
+
+# Ids / paths per ChromaDB request; stays under SQLite's variable limit
+_WRITE_BATCH = 500
+
+# Chunks read back per ChromaDB request when refilling the keyword store
+_FILL_BATCH = 5000
+
+# ChromaDB metadata key holding the chunk's original metadata as JSON.
+# ChromaDB only stores scalars, so the searchable copy next to it is
+# flattened (see _upsert); this one is what comes back out.
+_METADATA_KEY = "chunk_metadata"
+
+# Seconds to wait for the semantic leg of a search (rag.semantic_timeout)
+DEFAULT_SEMANTIC_TIMEOUT = 10.0
+
+
+class _SearchThreads:
+    """
+    Small pool of daemon threads kept between searches.
+
+    ThreadPoolExecutor joins its workers at interpreter exit, so a query
+    embedding that never returns would still hang the process after its
+    search timed out. Threads are started as needed, up to max_workers.
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._queued = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = Future()
+        with self._lock:
+            self._queued += 1
+            if self._queued > self._idle and self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(
+                    target=self._work, name=f"{self.name}-{self._threads}", daemon=True
+                ).start()
+        self._queue.put((future, fn, args))
+        return future
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            future, fn, args = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+                self._queued -= 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+_SEARCH_THREADS = _SearchThreads(max_workers=4, name="bugtrace-search")
+
 
 class VectorStore:
     """ChromaDB wrapper for storing code embeddings"""
     
-    def __init__(self, index_dir: Path, project_root: Path, embedder,collection_name=None):
+    def __init__(self, index_dir: Path, project_root: Path, embedder,collection_name=None,
+                 field_weights: Optional[Dict[str, float]] = None, keyword_backend: str = "bm25",
+                 semantic_timeout: Optional[float] = DEFAULT_SEMANTIC_TIMEOUT):
         """
         Initialize ChromaDB vector store with auto-generated collection name.
         
         Args:
             index_dir: Directory to store ChromaDB data (.bugtrace/index)
             project_root: Project root path (used for collection naming)
+            field_weights: BM25F weights per keyword field (rag.field_weights)
+            keyword_backend: Keyword index implementation (rag.keyword_backend)
+            semantic_timeout: Seconds a search waits for the semantic leg
+                before returning keyword results only (None or 0 = no limit)
         """
         self.index_dir = index_dir
         self.project_root = project_root
         self.embedder = embedder
+        self.semantic_timeout = semantic_timeout or None
 
         # Generate unique collection name
         if collection_name:
@@ -28,9 +107,12 @@ class VectorStore:
         self.persist_dir = index_dir / self.collection_name
         self.persist_dir.mkdir(parents=True, exist_ok=True)
 
-        # Initialize BM25 Store for hybrid search
-        self.bm25_store = BM25Store(
-            self.persist_dir / "bm25"
+        # Initialize the keyword store for hybrid search
+        self.keyword_store = get_keyword_store(
+            keyword_backend,
+            self.persist_dir,
+            project_root=project_root,
+            field_weights=field_weights,
         )
 
         # self.reranker = Reranker()
@@ -47,7 +129,28 @@ class VectorStore:
             )
         except Exception as e:
             raise RuntimeError(f"Failed to initialize ChromaDB: {e}")
+
+        if not len(self.keyword_store):
+            self._fill_keyword_store()
         
+    def _fill_keyword_store(self):
+        """
+        Index the stored chunks into an empty keyword store, e.g. after
+        rag.keyword_backend changed. Chunk text and metadata come back from
+        ChromaDB, so nothing is re-chunked or re-embedded; the metadata is
+        the original copy stored by _upsert, so refilled chunks index and
+        rank exactly like freshly added ones.
+        """
+        collection = self.vector_store._collection
+        total = collection.count()
+        for offset in range(0, total, _FILL_BATCH):
+            page = collection.get(include=["documents", "metadatas"], limit=_FILL_BATCH, offset=offset)
+            self.keyword_store.add_chunks([
+                {"text": text, "metadata": _chunk_metadata(metadata)}
+                for text, metadata in zip(page["documents"], page["metadatas"])
+                if text is not None and metadata is not None
+            ])
+
     def _generate_collection_name(self) -> str:
         """
         Generate unique collection name based on project.
@@ -70,16 +173,24 @@ class VectorStore:
         
         return collection_name
     
-    def add_chunks(self, chunks: List[Dict], embeddings_list: List[List[float]]):
+    def add_chunks(self, chunks: List[Dict], embeddings_list: List[List[float]]) -> List[str]:
         """
         Store chunks with their embeddings in ChromaDB.
         
         Args:
             chunks: List of chunk dicts with 'text' and 'metadata'
+        
+        Returns the vector store ids, parallel to chunks.
         """
         if not chunks:
-            return
+            return []
         
+        ids = self._upsert(chunks, embeddings_list)
+        self.keyword_store.add_chunks(chunks)
+        return ids
+    
+    def _upsert(self, chunks: List[Dict], embeddings_list: List[List[float]]) -> List[str]:
+        """Upsert chunks into ChromaDB only; returns their ids."""
         # Prepare data for ChromaDB
         ids = []
         texts = [chunk['text'] for chunk in chunks]
@@ -95,63 +206,134 @@ class VectorStore:
                 for k, v in chunk['metadata'].items()
                 if v is not None and not isinstance(v, (list, dict))
             }
+            clean_metadata[_METADATA_KEY] = json.dumps(chunk['metadata'])
             metadatas.append(clean_metadata)
         
-        self.vector_store.add_texts(
-            texts=texts,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings_list
-        )
-        self.bm25_store.add_chunks(chunks)
+        # Upsert the precomputed vectors directly: Chroma.add_texts ignores
+        # passed embeddings and would embed every text a second time
+        for i in range(0, len(ids), _WRITE_BATCH):
+            self.vector_store._collection.upsert(
+                ids=ids[i:i + _WRITE_BATCH],
+                embeddings=embeddings_list[i:i + _WRITE_BATCH],
+                metadatas=metadatas[i:i + _WRITE_BATCH],
+                documents=texts[i:i + _WRITE_BATCH],
+            )
+        return ids
     
-    def delete_file_chunks(self, filepath: str):
+    def replace_files(
+        self,
+        files: Dict[str, List[Dict]],
+        embeddings: Dict[str, List[List[float]]],
+        stored_ids: Optional[Dict[str, List[str]]] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        Replace the chunks of several files in one pass per store.
+        
+        Args:
+            files: {filepath: chunks} - the complete new chunk list per file
+                (an empty list just removes the file's old chunks)
+            embeddings: {filepath: vectors}, parallel to each file's chunks
+            stored_ids: {filepath: ids} of the chunks stored for these files,
+                as recorded in state (see _delete_vectors)
+        
+        Returns {filepath: ids of the stored chunks}.
+        """
+        paths = [str(Path(filepath).resolve()) for filepath in files]
+        self._delete_vectors(paths, stored_ids)
+        
+        chunks, vectors, written = [], [], {}
+        for filepath, file_chunks in files.items():
+            chunks.extend(file_chunks)
+            vectors.extend(embeddings.get(filepath, ()))
+        if len(vectors) != len(chunks):
+            raise ValueError(f"{len(vectors)} embeddings for {len(chunks)} chunks")
+        
+        ids = self._upsert(chunks, vectors) if chunks else []
+        pos = 0
+        for filepath, file_chunks in files.items():
+            written[filepath] = ids[pos:pos + len(file_chunks)]
+            pos += len(file_chunks)
+        
+        self.keyword_store.replace_files(dict(zip(paths, files.values())))
+        return written
+    
+    def delete_files(self, paths: Iterable[str], stored_ids: Optional[Dict[str, List[str]]] = None):
+        """
+        Delete all chunks of several files: batched deletes in ChromaDB
+        (see _delete_vectors) and one keyword store update.
+        """
+        paths = [str(Path(filepath).resolve()) for filepath in paths]
+        if not paths:
+            return
+        self._delete_vectors(paths, stored_ids)
+        self.keyword_store.delete_files(paths)
+    
+    def delete_file_chunks(self, filepath: str, chunk_ids: Optional[List[str]] = None):
         """
         Delete all chunks from a specific file.
         Used when file is removed or changed.
         
         Args:
             filepath: Path to file whose chunks should be deleted
+            chunk_ids: Ids of its stored chunks, if recorded
+        """
+        self.delete_files([filepath], {filepath: chunk_ids} if chunk_ids is not None else None)
+    
+    def _delete_vectors(self, paths: List[str], stored_ids: Optional[Dict[str, List[str]]] = None):
         """
-        filepath = str(Path(filepath).resolve())
-        # Query all chunks from this file
+        Delete ChromaDB chunks of files. Files with recorded ids are deleted
+        by id, which costs O(their chunks); the others by their 'file'
+        metadata, which gets slower as the collection grows.
+        """
+        stored = {str(Path(filepath).resolve()): ids for filepath, ids in (stored_ids or {}).items()}
+        ids = [chunk_id for path in paths for chunk_id in stored.get(path, ())]
+        unknown = [path for path in paths if path not in stored]
 
-        try: 
-            self.bm25_store.delete_file_chunks(filepath)
-        except Exception:
-            pass
-        
-        try:
-            all_data = self.vector_store.get()
-            ids_to_delete = [
-                all_data['ids'][i]
-                for i, metadata in enumerate(all_data['metadatas'])
-                if metadata.get('file') == filepath
-            ]
-            if ids_to_delete:
-                self.vector_store.delete(ids=ids_to_delete)
-        except Exception:
-            pass
+        for i in range(0, len(ids), _WRITE_BATCH):
+            self.vector_store._collection.delete(ids=ids[i:i + _WRITE_BATCH])
+        for i in range(0, len(unknown), _WRITE_BATCH):
+            batch = unknown[i:i + _WRITE_BATCH]
+            where = {"file": batch[0]} if len(batch) == 1 else {"file": {"$in": batch}}
+            self.vector_store._collection.delete(where=where)
 
     def search(self, query: str, top_k: int = 5, retrieval_k: int = 15):
         """
         Hybrid retrieval:
         - semantic search
-        - BM25 keyword search
+        - keyword search (BM25 or FTS5, see rag.keyword_backend)
+
+        The legs are independent: the semantic one (query embedding plus
+        ANN search) runs on a search thread while the keyword one runs
+        here. If the semantic leg takes longer than semantic_timeout, the
+        keyword results are returned alone.
         """
+        started = time.monotonic()
+        semantic_future = _SEARCH_THREADS.submit(
+            self.vector_store.similarity_search_with_score, query, retrieval_k
+        )
 
-        semantic_results = self.vector_store.similarity_search_with_score(
+        keyword = self.keyword_store.search(
             query=query,
             k=retrieval_k
         )
 
+        timeout = None
+        if self.semantic_timeout is not None:
+            timeout = max(0.0, started + self.semantic_timeout - time.monotonic())
+        try:
+            semantic_results = semantic_future.result(timeout=timeout)
+        except FutureTimeout:
+            # Still running or queued behind a stuck request; drop it
+            semantic_future.cancel()
+            semantic_results = []
+
         semantic = []
 
         for doc, score in semantic_results:
             normalized_score = 1 / (1 + score)
             semantic.append({
                 "text": doc.page_content,
-                "metadata": doc.metadata,
+                "metadata": _chunk_metadata(doc.metadata),
                 "score": float(normalized_score),
                 "semantic_score": float(normalized_score),
                 "bm25_score": None,
@@ -159,11 +341,6 @@ class VectorStore:
                 "source": "semantic"
             })
 
-        keyword = self.bm25_store.search(
-            query=query,
-            k=retrieval_k
-        )
-
         # Merge + deduplicate
         combined = {}
 
@@ -234,9 +411,11 @@ class VectorStore:
     #     )
     def get_stats(self) -> Dict:
         """Get statistics"""
+        # count() instead of get(): get() loads every row (and fails on
+        # large collections with "too many SQL variables")
         try:
-            count = len(self.vector_store.get()['ids'])
-        except:
+            count = self.vector_store._collection.count()
+        except Exception:
             count = 0
         
         return {
@@ -247,4 +426,16 @@ class VectorStore:
 
     @property
     def bm25(self):
-        return self.bm25_store
\ No newline at end of file
+        return self.keyword_store
+
+
+def _chunk_metadata(metadata: Dict) -> Dict:
+    """
+    A chunk's metadata as it was added, from the ChromaDB copy. Chunks
+    stored before the original was kept come back flattened (values as
+    strings) until their files are re-indexed.
+    """
+    original = metadata.get(_METADATA_KEY)
+    if original is None:
+        return dict(metadata)
+    return json.loads(original)
@@ -0,0 +1,397 @@
+# bugtrace/rag/watcher.py
+"""
+`bugtrace watch`: keep the manifest and index current while you work.
+
+The watcher subscribes to filesystem events (inotify on Linux, periodic
+stat polling elsewhere), coalesces bursts such as branch switches into one
+batch, and pushes only the affected paths through the indexer.
+
+After every applied batch it bumps a generation counter in
+.bugtrace/watch.json. A live watcher is the only writer of the index:
+`bugtrace index` refuses to run next to it, and query paths (analyze,
+session) skip their scan/index freshness check, waiting briefly for the
+watcher's initial sync if it is still running.
+"""
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional, Set
+import json
+import os
+import time
+
+from rich.console import Console
+
+from bugtrace.utils.fs import (
+    compare_manifest,
+    discover_files,
+    ensure_state_dir,
+    should_ignore,
+)
+from bugtrace.utils.state import StateManager
+from bugtrace.config.settings import load_user_config, validate_config
+
+
+console = Console()
+
+WATCH_FILE = "watch.json"
+CONFIG_FILE = "bugtrace.yaml"
+
+# Seconds query paths wait for a watcher's initial sync
+INITIAL_SYNC_WAIT = 30.0
+
+
+def read_watch_state(state_dir: Path) -> Optional[dict]:
+    """
+    Return the contents of .bugtrace/watch.json if its watcher process is
+    still alive, else None. Cheap enough to call on every query.
+    """
+    try:
+        watch_state = json.loads((state_dir / WATCH_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not _pid_alive(watch_state.get("pid")):
+        return None
+    return watch_state
+
+
+def wait_for_watcher(
+    state_dir: Path,
+    timeout: float = INITIAL_SYNC_WAIT,
+    poll_interval: float = 0.2,
+) -> Optional[dict]:
+    """
+    Watch state of the running watcher, or None when there is none (the
+    caller then brings the index up to date itself).
+
+    While the watcher is still on its initial sync (generation 0), waits up
+    to `timeout` seconds for it to finish. A watcher that is still syncing
+    after that is returned anyway: it owns the index, so the caller must
+    not index next to it.
+    """
+    deadline = time.monotonic() + timeout
+    watch_state = read_watch_state(state_dir)
+    while watch_state is not None and not watch_state.get("generation"):
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+        watch_state = read_watch_state(state_dir)
+    return watch_state
+
+
+def _pid_alive(pid) -> bool:
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProjectWatcher:
+    """
+    Watches a project and applies changes to the manifest and index.
+
+    Args:
+        project_root: Root directory of the project
+        debounce: Seconds of quiet before a batch of events is applied
+        max_delay: Upper bound on how long a busy stream of events is held back
+        poll_interval: Rescan interval when inotify is unavailable
+        paranoid / jobs: Passed through to hashing, as for `bugtrace scan`
+    """
+
+    def __init__(
+        self,
+        project_root: Path,
+        debounce: float = 0.5,
+        max_delay: float = 5.0,
+        poll_interval: float = 2.0,
+        paranoid: bool = False,
+        jobs: int = None,
+        verbose: bool = True,
+    ):
+        self.project_root = Path(project_root).resolve()
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.paranoid = paranoid
+        self.jobs = jobs
+        self.verbose = verbose
+
+        self.state_dir = ensure_state_dir(self.project_root)
+        self.generation = 0
+        self.started_at = datetime.now().isoformat()
+        self.backend = None
+        self.vector_store = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def run(self):
+        """Initial sync, then apply changes until interrupted."""
+        existing = read_watch_state(self.state_dir)
+        if existing:
+            raise RuntimeError(f"Another watcher is already running (pid {existing['pid']})")
+
+        self._write_watch_state()
+        try:
+            self._start_backend()
+            # Watches exist before the initial sync, so nothing that changes
+            # during it is missed (at worst it is applied twice)
+            self._resync("initial sync")
+
+            if self.backend is None:
+                self._poll_loop()
+            else:
+                self._event_loop()
+        finally:
+            if self.backend is not None:
+                self.backend.close()
+            try:
+                (self.state_dir / WATCH_FILE).unlink()
+            except OSError:
+                pass
+
+    def _start_backend(self):
+        from bugtrace.utils.inotify import DirectoryWatcher, inotify_available
+
+        self._load_config()
+        if not inotify_available():
+            console.print(f"[yellow]⚠ inotify not available - polling every {self.poll_interval}s[/yellow]")
+            return
+        self.backend = DirectoryWatcher(self.project_root, skip_dir=self._skip_dir)
+        if self.verbose:
+            console.print(f"[dim]Watching {self.backend.watch_count} directories[/dim]")
+
+    def _load_config(self):
+        self.config = load_user_config(self.project_root)
+        validate_config(self.config)
+        self.ignore = self.config.get("paths", {}).get("ignore", [])
+        self.git_mode = self.config.get("paths", {}).get("discovery", "walk") == "git"
+        if self.jobs is None:
+            self.jobs = (self.config.get("scan") or {}).get("jobs")
+
+    def _skip_dir(self, dir_path: str) -> bool:
+        path = Path(dir_path)
+        return path == self.state_dir or should_ignore(path, self.project_root, self.ignore)
+
+    # ------------------------------------------------------------------
+    # Event loops
+    # ------------------------------------------------------------------
+
+    def _event_loop(self):
+        dirty: Set[str] = set()
+        gone_dirs: Set[str] = set()
+        full = False
+        first_event = last_event = 0.0  # monotonic times of the pending batch
+        state_prefix = str(self.state_dir) + os.sep
+
+        while True:
+            timeout = None
+            if dirty or gone_dirs or full:
+                deadline = min(last_event + self.debounce, first_event + self.max_delay)
+                timeout = max(0.0, deadline - time.monotonic())
+
+            had_pending = bool(dirty or gone_dirs or full)
+            events = self.backend.read(timeout)
+            now = time.monotonic()
+
+            for event in events:
+                if event.path.startswith(state_prefix) or event.path == str(self.state_dir):
+                    continue
+                name = os.path.basename(event.path)
+                if event.path == str(self.project_root / CONFIG_FILE) or (
+                    self.git_mode and name == ".gitignore"
+                ):
+                    full = True
+                elif event.is_dir:
+                    if event.removed:
+                        gone_dirs.add(event.path)
+                else:
+                    dirty.add(event.path)
+
+            overflowed = self.backend.overflowed
+            if overflowed:
+                # Kernel queue overflowed: events were lost
+                self.backend.overflowed = False
+                full = True
+
+            if events or overflowed:
+                if not had_pending:
+                    first_event = now
+                last_event = now
+
+            if not (dirty or gone_dirs or full):
+                continue
+            if now - last_event < self.debounce and now - first_event < self.max_delay:
+                continue
+
+            batch, batch_dirs, batch_full = dirty, gone_dirs, full
+            dirty, gone_dirs, full = set(), set(), False
+            try:
+                if batch_full:
+                    self._resync("configuration or ignore rules changed")
+                    self.backend.add_tree(str(self.project_root))
+                else:
+                    self._flush(batch, batch_dirs)
+            except Exception as e:
+                console.print(f"[red]✗ Update failed:[/red] {e} [dim](will retry)[/dim]")
+                dirty |= batch
+                gone_dirs |= batch_dirs
+                full = full or batch_full
+                first_event = last_event = time.monotonic()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if self._config_mtime() != self.config_mtime:
+                    self._resync("configuration changed")
+                    continue
+                discovery = discover_files(self.project_root, self.config)
+                new_entries, changes = compare_manifest(
+                    self.manifest, discovery.files,
+                    paranoid=self.paranoid, jobs=self.jobs, git_oids=discovery.git_oids,
+                )
+                self._apply(self.manifest, new_entries, changes)
+            except Exception as e:
+                console.print(f"[red]✗ Update failed:[/red] {e} [dim](will retry)[/dim]")
+
+    # ------------------------------------------------------------------
+    # Applying changes
+    # ------------------------------------------------------------------
+
+    def _resync(self, reason: str):
+        """Full scan + index, as `bugtrace index` would do."""
+        from bugtrace.rag.indexer import index_project
+
+        if self.verbose:
+            console.print(f"[dim]Syncing index ({reason})...[/dim]")
+        self._load_config()
+        self.config_mtime = self._config_mtime()
+        # The store was built from the previous config (embedder, keyword
+        # backend, field weights); let index_project build one from this one
+        if self.vector_store is not None:
+            self.vector_store.keyword_store.close()
+            self.vector_store = None
+        result = index_project(
+            self.project_root,
+            verbose=False,
+            paranoid=self.paranoid,
+            jobs=self.jobs,
+            config=self.config,
+            vector_store=self.vector_store,
+        )
+
+        # index_project used its own state manager; reload what it touched
+        self.state_manager = StateManager(self.state_dir)
+        self.manifest = self.state_manager.store.load_manifest()
+        self._bump(f"synced {result.total_files} files ({result.indexed} indexed, {result.removed} removed)")
+
+    def _flush(self, dirty: Set[str], gone_dirs: Set[str]):
+        """Apply one debounced batch of changed paths."""
+        candidates = set(dirty)
+        for dir_path in gone_dirs:
+            prefix = dir_path + os.sep
+            candidates.update(path for path in self.manifest if path.startswith(prefix))
+
+        git_oids = {}
+        if self.git_mode:
+            # Tracked/ignored status depends on the git index as well as
+            # ignore rules, so let discovery decide which paths belong
+            discovery = discover_files(self.project_root, self.config)
+            included = {str(path) for path in discovery.files}
+            files = [Path(path) for path in candidates if path in included]
+            git_oids = {path: oid for path, oid in discovery.git_oids.items() if path in candidates}
+        else:
+            files = [
+                Path(path) for path in candidates
+                if os.path.isfile(path)
+                and not should_ignore(Path(path), self.project_root, self.ignore)
+            ]
+
+        old_entries = {path: self.manifest[path] for path in candidates if path in self.manifest}
+        new_entries, changes = compare_manifest(
+            old_entries, files, paranoid=self.paranoid, jobs=self.jobs, git_oids=git_oids
+        )
+        self._apply(old_entries, new_entries, changes)
+
+    def _apply(self, old_entries: Dict[str, dict], new_entries: Dict[str, dict], changes: Dict):
+        """Write manifest rows for a batch and index what changed."""
+        from bugtrace.rag.indexer import index_changes
+
+        rows = {path: entry for path, entry in new_entries.items() if old_entries.get(path) != entry}
+        removed = changes["removed"]
+        to_index = self.state_manager.get_files_to_index(new_entries)
+        if not rows and not removed and not to_index:
+            return
+
+        store = self.state_manager.store
+        with store.transaction():
+            store.upsert_manifest(rows)
+            store.delete_manifest(removed)
+            self.state_manager.update_scan_time()
+        self.manifest.update(rows)
+        for path in removed:
+            self.manifest.pop(path, None)
+
+        if (to_index or removed) and self.vector_store is None:
+            from bugtrace.rag.embeddings import get_embedder
+            from bugtrace.rag.vector_store import VectorStore
+
+            index_dir = self.state_dir / "index"
+            index_dir.mkdir(exist_ok=True)
+            self.vector_store = VectorStore(
+                index_dir, self.project_root, embedder=get_embedder(self.config),
+                field_weights=self.config["rag"].get("field_weights"),
+                keyword_backend=self.config["rag"].get("keyword_backend", "bm25"),
+            )
+
+        total_chunks = index_changes(
+            self.project_root,
+            self.config,
+            self.state_manager,
+            to_index,
+            removed,
+            vector_store=self.vector_store,
+        )
+
+        summary = []
+        if to_index:
+            summary.append(f"{len(to_index)} indexed ({total_chunks} chunks)")
+        if removed:
+            summary.append(f"{len(removed)} removed")
+        self._bump(", ".join(summary) or "manifest refreshed")
+
+    # ------------------------------------------------------------------
+    # Generation counter
+    # ------------------------------------------------------------------
+
+    def _bump(self, summary: str):
+        self.generation += 1
+        self._write_watch_state()
+        if self.verbose:
+            stamp = datetime.now().strftime("%H:%M:%S")
+            console.print(f"[dim]{stamp}[/dim] [green]↻[/green] {summary} [dim](generation {self.generation})[/dim]")
+
+    def _write_watch_state(self):
+        watch_state = {
+            "pid": os.getpid(),
+            "generation": self.generation,
+            "started_at": self.started_at,
+            "updated_at": datetime.now().isoformat(),
+            "backend": "inotify" if self.backend is not None else "poll",
+        }
+        path = self.state_dir / WATCH_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(watch_state), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def _config_mtime(self) -> Optional[int]:
+        try:
+            return (self.project_root / CONFIG_FILE).stat().st_mtime_ns
+        except OSError:
+            return None
@@ -1,8 +1,19 @@
 from pathlib import Path
 import hashlib
-import json
-from typing import Dict, List
-from fnmatch import fnmatch
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import re
+
+from bugtrace.utils.store import open_store
+
+# Files modified this close to the start of a scan may change again within the
+# filesystem's timestamp granularity without their stat changing, so their stat
+# is not trusted on the next scan and they get rehashed.
+RACY_WINDOW_NS = 2_000_000_000
 
 
 def ensure_state_dir(project_root: Path) -> Path:
@@ -11,10 +22,6 @@ def ensure_state_dir(project_root: Path) -> Path:
 
     (state_dir / "logs").mkdir(exist_ok=True)
 
-    manifest = state_dir / "manifest.json"
-    if not manifest.exists():
-        manifest.write_text(json.dumps({}, indent=2))
-
     # state = state_dir / "state.json"
     # if not state.exists():
     #     state.write_text(
@@ -32,10 +39,155 @@ def hash_file(file_path: Path) -> str:
     """Return SHA256 hash of a file."""
     h = hashlib.sha256()
     with file_path.open("rb") as f:
-        while chunk := f.read(8192):
+        while chunk := f.read(262144):
             h.update(chunk)
     return h.hexdigest()
 
+def default_hash_jobs() -> int:
+    """Default number of hashing threads (same sizing as ThreadPoolExecutor)."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+def _hash_or_none(file_path: Path) -> Optional[str]:
+    try:
+        return hash_file(file_path)
+    except OSError:
+        return None
+
+def hash_files(files: Iterable[Path], jobs: Optional[int] = None) -> Iterator[Tuple[Path, Optional[str]]]:
+    """
+    Hash files on a bounded thread pool.
+    Yields (path, hash) in input order; the hash is None if the file
+    could not be read. hashlib releases the GIL while hashing, so reads
+    and hashing overlap across threads.
+
+    Args:
+        files: Files to hash
+        jobs: Number of hashing threads (None or 0 = default_hash_jobs())
+    """
+    jobs = jobs or default_hash_jobs()
+
+    if jobs <= 1:
+        for file_path in files:
+            yield file_path, _hash_or_none(file_path)
+        return
+
+    # Only keep a few files per worker in flight so memory stays bounded
+    window = jobs * 4
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="bugtrace-hash") as pool:
+        in_flight = deque()
+        for file_path in files:
+            in_flight.append((file_path, pool.submit(_hash_or_none, file_path)))
+            if len(in_flight) >= window:
+                done_path, future = in_flight.popleft()
+                yield done_path, future.result()
+
+        while in_flight:
+            done_path, future = in_flight.popleft()
+            yield done_path, future.result()
+
+def _glob_to_regex(pattern: str, match_separator: bool) -> str:
+    """
+    Translate a glob into a regex fragment.
+    With match_separator False, * and ? stop at "/" (used for single names).
+    """
+    star = ".*" if match_separator else "[^/]*"
+    any_char = "." if match_separator else "[^/]"
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            out.append(star)
+        elif c == "?":
+            out.append(any_char)
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+            else:
+                stuff = pattern[i:j].replace("\\", "\\\\")
+                i = j + 1
+                if stuff[0] == "!":
+                    stuff = "^" + stuff[1:]
+                elif stuff[0] in ("^", "["):
+                    stuff = "\\" + stuff
+                out.append(f"[{stuff}]")
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+class IgnoreMatcher:
+    """
+    paths.ignore patterns compiled once for the walker.
+
+    Same rules as should_ignore():
+      - patterns starting with . match a path component exactly (.git, .env)
+      - other patterns are globs matched against each path component
+        and against the whole relative path (*.pyc, build/*.js)
+
+    The walker prunes ignored directories, so only the last component of a
+    path needs checking. Literal names are a set lookup and every glob is
+    folded into a single regex, so the cost per entry stays flat however many
+    patterns there are.
+    """
+
+    _GLOB_CHARS = frozenset("*?[")
+
+    def __init__(self, patterns: List[str]):
+        self._fold = os.path.normcase if os.name == "nt" else None
+        literal_names = set()
+        name_globs = []
+        path_globs = []
+
+        for pattern in patterns:
+            if self._fold:
+                pattern = self._fold(pattern)
+            if pattern.startswith(".") or not (self._GLOB_CHARS & set(pattern)):
+                literal_names.add(pattern)
+                if not pattern.startswith(".") and "/" in pattern:
+                    # A literal relative path such as src/generated
+                    path_globs.append(re.escape(pattern))
+            else:
+                if "/" not in pattern:
+                    name_globs.append(_glob_to_regex(pattern, match_separator=False))
+                path_globs.append(_glob_to_regex(pattern, match_separator=True))
+
+        self.literal_names = frozenset(literal_names)
+
+        alternatives = []
+        if name_globs:
+            alternatives.append(f"(?:.*/)?(?:{'|'.join(name_globs)})")
+        if path_globs:
+            alternatives.append(f"(?:{'|'.join(path_globs)})")
+        self._regex = re.compile(f"(?:{'|'.join(alternatives)})\\Z", re.DOTALL) if alternatives else None
+
+    def match(self, name: str, rel_path: str) -> bool:
+        """
+        Check a single walk entry.
+
+        Args:
+            name: Entry name (last path component)
+            rel_path: "/"-separated path relative to the project root
+        """
+        if self._fold:
+            name, rel_path = self._fold(name), self._fold(rel_path)
+        if name in self.literal_names:
+            return True
+        return self._regex is not None and self._regex.match(rel_path) is not None
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(patterns: Tuple[str, ...]) -> IgnoreMatcher:
+    return IgnoreMatcher(list(patterns))
+
 def should_ignore(path: Path, project_root: Path, ignore_patterns: List[str]) -> bool:
     """
     Check if a path should be ignored based on patterns.
@@ -50,115 +202,273 @@ def should_ignore(path: Path, project_root: Path, ignore_patterns: List[str]) ->
         rel_path = path.relative_to(project_root)
     except ValueError:
         return False
-    
-    rel_path_str = str(rel_path).replace('\\', '/')
-    
-    for pattern in ignore_patterns:
-        # Special handling for patterns starting with . (hidden files/folders)
-        if pattern.startswith('.'):
-            # For hidden patterns, only match if the part starts with .
-            for part in rel_path.parts:
-                if part == pattern or part == pattern.lstrip('.'):
-                    # Exact match with or without the dot
-                    if part.startswith('.'):
-                        return True
-            
-            # Check filename if it's a hidden file
-            if path.name == pattern or (path.name.startswith('.') and path.name == pattern):
-                return True
-        else:
-            # For non-hidden patterns, use normal matching
-            # Check if any part of the path matches the pattern (for folder names)
-            for part in rel_path.parts:
-                if fnmatch(part, pattern):
-                    return True
-            
-            # Check the full relative path
-            if fnmatch(rel_path_str, pattern):
-                return True
-            
-            # Check just the filename
-            if fnmatch(path.name, pattern):
-                return True
-    
+
+    matcher = _cached_matcher(tuple(ignore_patterns))
+
+    # A path is ignored if it or any parent directory matches
+    prefix = ""
+    for part in rel_path.parts:
+        prefix = f"{prefix}/{part}" if prefix else part
+        if matcher.match(part, prefix):
+            return True
     return False
 
 def walk_project(project_root: Path, ignore: List[str] = None) -> List[Path]:
     """
-    Recursively walk project directory and return list of files.
+    Walk project directory and return list of files.
     Supports ignore patterns like .gitignore:
       - exact filenames/folders (__pycache__, node_modules)
       - glob patterns (*.pyc, *.log)
       - hidden folders starting with . (.git, .bugtrace) - won't match regular folders
       - folder names anywhere in the tree
+
+    Iterative os.scandir walk: entry types come from the directory listing
+    (no extra stat per file) and ignored directories are never descended into.
     """
-    ignore = ignore or []
+    matcher = IgnoreMatcher(ignore or [])
     all_files = []
-    
-    def _walk(current_path: Path):
-        """Recursive walker that respects ignore patterns"""
+
+    root_real = os.path.realpath(project_root)
+    followed_links = set()
+
+    # (directory path, "/"-terminated path relative to project root)
+    stack = [(str(project_root), "")]
+
+    while stack:
+        dir_path, rel_dir = stack.pop()
         try:
-            for item in current_path.iterdir():
-                # Check if this item should be ignored
-                if should_ignore(item, project_root, ignore):
-                    continue
-                
-                if item.is_dir():
-                    # Recursively walk subdirectory
-                    _walk(item)
-                elif item.is_file():
-                    all_files.append(item)
-        except PermissionError:
-            # Skip directories we don't have permission to read
-            pass
-    
-    _walk(project_root)
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            # Skip directories we can't read
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            if matcher.match(entry.name, rel_path):
+                continue
+
+            try:
+                if entry.is_dir():
+                    if entry.is_symlink() and not _follow_dir_link(
+                        entry.path, dir_path, root_real, followed_links
+                    ):
+                        continue
+                    subdirs.append((entry.path, rel_path + "/"))
+                elif entry.is_file():
+                    all_files.append(Path(entry.path))
+            except OSError:
+                continue
+
+        # Reverse so directories are visited in listing order
+        stack.extend(reversed(subdirs))
+
     return all_files
 
+def _follow_dir_link(link_path: str, parent_dir: str, root_real: str, followed: set) -> bool:
+    """
+    Decide whether to descend into a symlinked directory.
+    Each target is followed once, and links pointing back at the project root
+    or one of their own parent directories are skipped to avoid loops.
+    """
+    target = os.path.realpath(link_path)
+    if target in followed or target == root_real:
+        return False
+    parent_real = os.path.realpath(parent_dir)
+    if parent_real == target or parent_real.startswith(target.rstrip(os.sep) + os.sep):
+        return False
+    followed.add(target)
+    return True
+
+class Discovery(NamedTuple):
+    files: List[Path]
+    git_oids: Dict[str, str]   # {file path: blob id} for files git reports clean
+    mode: str                  # discovery mode actually used: "walk" or "git"
+
+def discover_files(project_root: Path, config: dict) -> Discovery:
+    """
+    List project files according to paths.discovery.
+
+    "walk" (default) walks the tree with paths.ignore. "git" takes the file
+    list from the repository's index and .gitignore rules (plus paths.ignore)
+    and falls back to walking when project_root is not a git checkout.
+    """
+    paths = config.get("paths", {})
+    ignore = paths.get("ignore", [])
+
+    if paths.get("discovery", "walk") == "git":
+        from bugtrace.utils.git import discover_git_files
+        found = discover_git_files(project_root, ignore)
+        if found is not None:
+            return Discovery(found.files, found.clean_oids, "git")
+
+    return Discovery(walk_project(project_root, ignore=ignore), {}, "walk")
+
 def load_manifest(state_dir: Path) -> Dict:
-    manifest_path = state_dir / "manifest.json"
-    if manifest_path.exists():
-        return json.loads(manifest_path.read_text())
-    return {}
+    """Load the manifest from .bugtrace/state.db."""
+    return open_store(state_dir).load_manifest()
 
 def save_manifest(state_dir: Path, manifest: Dict):
-    manifest_path = state_dir / "manifest.json"
-    manifest_path.write_text(json.dumps(manifest, indent=2))
+    """Replace the whole manifest (prefer update_manifest for incremental writes)."""
+    open_store(state_dir).replace_manifest(manifest)
 
-def update_manifest(state_dir: Path, files: List[Path]) -> Dict:
+def entry_hash(entry) -> Optional[str]:
     """
-    Update manifest with file hashes.
-    Removes files that are no longer tracked (either deleted or now ignored).
-    Returns stats: {new, changed, unchanged, removed}
+    Return the content hash stored in a manifest entry.
+    Entries are {hash, size, mtime_ns, ino} dicts; manifests written by
+    older versions store the bare hash string instead.
+    """
+    if isinstance(entry, dict):
+        return entry.get("hash")
+    return entry
+
+def _stat_matches(entry, st: os.stat_result) -> bool:
+    """True if the stat tuple recorded in a manifest entry still matches the file."""
+    if not isinstance(entry, dict) or entry.get("mtime_ns") is None:
+        return False
+    return (
+        entry.get("size") == st.st_size
+        and entry.get("mtime_ns") == st.st_mtime_ns
+        and entry.get("ino") == st.st_ino
+    )
+
+def compare_manifest(
+    old_manifest: Dict,
+    files: List[Path],
+    paranoid: bool = False,
+    jobs: Optional[int] = None,
+    git_oids: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict, Dict[str, List[str]]]:
+    """
+    Compare files on disk against a manifest without writing anything.
+
+    A file is only rehashed when its (size, mtime_ns, inode) differs from the
+    manifest entry, unless paranoid is set, in which case every file is hashed.
+    Hashing runs on hash_files() with the given number of jobs.
+
+    git_oids maps files that git's index reports clean to their blob id. The
+    blob id is recorded in the entry, and a file whose stat changed but whose
+    blob was hashed before (e.g. after switching branches) reuses that hash.
+
+    Returns (new_manifest, changes) where changes maps
+    new/changed/unchanged/removed to lists of file paths.
     """
-    old_manifest = load_manifest(state_dir)
     new_manifest = {}
-    stats = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
-    
-    # Track which files are currently being scanned
-    current_files = {str(filepath) for filepath in files}
-    
-    # Process current files
+    changes = {"new": [], "changed": [], "unchanged": [], "removed": []}
+    racy_after_ns = time.time_ns() - RACY_WINDOW_NS
+    git_oids = git_oids or {}
+
+    known_blobs = {}
+    if git_oids and not paranoid:
+        for entry in old_manifest.values():
+            if isinstance(entry, dict) and entry.get("oid"):
+                known_blobs[entry["oid"]] = entry["hash"]
+
+    # Stat everything first so only files that need it go to the hash pool.
+    # known_hash is None for files that must be hashed.
+    scanned = []
     for filepath in files:
         file_key = str(filepath)
-        current_hash = hash_file(filepath)
-        
-        if file_key not in old_manifest:
-            stats["new"] += 1
-        elif old_manifest[file_key] != current_hash:
-            stats["changed"] += 1
+        try:
+            st = filepath.stat()
+        except OSError:
+            # File vanished or became unreadable between walk and hash
+            continue
+        old_entry = old_manifest.get(file_key)
+        if not paranoid and _stat_matches(old_entry, st):
+            known_hash = old_entry["hash"]
         else:
-            stats["unchanged"] += 1
-        
-        new_manifest[file_key] = current_hash
-    
-    # Count removed files (were in old manifest but not in current scan)
-    for old_file in old_manifest.keys():
-        if old_file not in current_files:
-            stats["removed"] += 1
-    
-    save_manifest(state_dir, new_manifest)
-    return stats
+            known_hash = known_blobs.get(git_oids.get(file_key))
+        scanned.append((filepath, st, old_entry, known_hash))
+
+    hashed = hash_files(
+        (filepath for filepath, _, _, known_hash in scanned if known_hash is None),
+        jobs=jobs,
+    )
+
+    for filepath, st, old_entry, known_hash in scanned:
+        file_key = str(filepath)
+
+        if known_hash is None:
+            _, current_hash = next(hashed)
+            if current_hash is None:
+                continue
+        else:
+            current_hash = known_hash
+
+        if old_entry is None:
+            changes["new"].append(file_key)
+        elif entry_hash(old_entry) != current_hash:
+            changes["changed"].append(file_key)
+        else:
+            changes["unchanged"].append(file_key)
+
+        entry = {
+            "hash": current_hash,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns if st.st_mtime_ns < racy_after_ns else None,
+            "ino": st.st_ino,
+        }
+        oid = git_oids.get(file_key)
+        if oid is None and isinstance(old_entry, dict) and old_entry.get("hash") == current_hash:
+            oid = old_entry.get("oid")
+        if oid:
+            entry["oid"] = oid
+        new_manifest[file_key] = entry
+
+    # Files in the old manifest that were not scanned (deleted or now ignored)
+    changes["removed"] = [f for f in old_manifest if f not in new_manifest]
+
+    return new_manifest, changes
+
+def update_manifest(
+    state_dir: Path,
+    files: List[Path],
+    paranoid: bool = False,
+    jobs: Optional[int] = None,
+    git_oids: Optional[Dict[str, str]] = None,
+) -> Dict:
+    """
+    Update manifest with file hashes.
+    Unchanged files are detected from their stat and not rehashed unless
+    paranoid is set; the rest are hashed in parallel on `jobs` threads.
+    Removes files that are no longer tracked (either deleted or now ignored).
+    Returns stats: {new, changed, unchanged, removed}
+    """
+    _, changes = sync_manifest(state_dir, files, paranoid=paranoid, jobs=jobs, git_oids=git_oids)
+    return {key: len(paths) for key, paths in changes.items()}
+
+def sync_manifest(
+    state_dir: Path,
+    files: List[Path],
+    paranoid: bool = False,
+    jobs: Optional[int] = None,
+    git_oids: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict, Dict[str, List[str]]]:
+    """
+    Same as update_manifest, but returns the new manifest and the
+    new/changed/unchanged/removed path lists so callers can hand the diff
+    on (e.g. to indexing) without reloading the manifest.
+    """
+    store = open_store(state_dir)
+
+    old_manifest = store.load_manifest()
+    new_manifest, changes = compare_manifest(
+        old_manifest, files, paranoid=paranoid, jobs=jobs, git_oids=git_oids
+    )
+
+    # Only write rows that differ (new, changed or refreshed stat data)
+    changed_rows = {
+        path: entry
+        for path, entry in new_manifest.items()
+        if old_manifest.get(path) != entry
+    }
+    with store.transaction():
+        store.upsert_manifest(changed_rows)
+        store.delete_manifest(changes["removed"])
+
+    return new_manifest, changes
 
     # """
     # Hash files and update manifest.json.
@@ -0,0 +1,429 @@
+# bugtrace/utils/git.py
+"""
+Git-aware file discovery.
+
+Reads the repository's own tracking data directly (no `git` subprocess):
+  - .git/index for the list of tracked files and their cached stat data
+  - nested .gitignore files and .git/info/exclude for untracked files
+
+The resulting file list matches `git ls-files --cached --others
+--exclude-standard`, minus anything excluded by paths.ignore. The global
+core.excludesFile is not read.
+"""
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import os
+import re
+import struct
+
+from bugtrace.utils.fs import IgnoreMatcher
+
+
+# Index entry modes we treat as files (regular, executable, symlink)
+_FILE_MODES = {0o100644, 0o100755, 0o120000}
+
+_ENTRY_HEADER = struct.Struct(">10I20sH")
+_FLAG_EXTENDED = 0x4000
+_FLAG_STAGE_MASK = 0x3000
+_EXT_FLAG_SKIP_WORKTREE = 0x4000
+_EXT_FLAG_INTENT_TO_ADD = 0x2000
+
+
+class IndexEntry(NamedTuple):
+    """Cached stat data and blob id for one path in .git/index."""
+    mtime_ns: int
+    size: int
+    ino: int
+    mode: int
+    oid: str
+    stage: int
+    skip_worktree: bool
+    intent_to_add: bool
+
+
+def find_git_dir(project_root: Path) -> Optional[Tuple[Path, Path, Path]]:
+    """
+    Locate the git repository containing project_root.
+
+    Returns (worktree_root, git_dir, common_dir) or None if project_root is
+    not inside a git checkout. git_dir holds the index; common_dir holds
+    info/exclude (they differ for linked worktrees).
+    """
+    current = project_root.resolve()
+    while True:
+        dot_git = current / ".git"
+        if dot_git.is_dir():
+            return current, dot_git, dot_git
+        if dot_git.is_file():
+            # Linked worktree or submodule: ".git" is a "gitdir: <path>" file
+            try:
+                content = dot_git.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            if not content.startswith("gitdir:"):
+                return None
+            git_dir = Path(content[len("gitdir:"):].strip())
+            if not git_dir.is_absolute():
+                git_dir = (current / git_dir).resolve()
+            common_dir = git_dir
+            commondir_file = git_dir / "commondir"
+            if commondir_file.exists():
+                common = Path(commondir_file.read_text(encoding="utf-8").strip())
+                common_dir = common if common.is_absolute() else (git_dir / common).resolve()
+            return current, git_dir, common_dir
+        if current.parent == current:
+            return None
+        current = current.parent
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decode the offset varint used for index v4 path prefix compression."""
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def read_git_index(index_path: Path) -> Dict[str, IndexEntry]:
+    """
+    Parse a git index file (versions 2, 3 and 4).
+
+    Returns {path relative to the worktree: IndexEntry}. Extensions after the
+    entry table are not needed and are ignored. Raises ValueError if the file
+    is not a git index.
+    """
+    data = index_path.read_bytes()
+    if len(data) < 12 or data[:4] != b"DIRC":
+        raise ValueError(f"Not a git index: {index_path}")
+
+    version, count = struct.unpack_from(">II", data, 4)
+    if version not in (2, 3, 4):
+        raise ValueError(f"Unsupported git index version {version}")
+
+    entries = {}
+    pos = 12
+    previous_name = b""
+
+    for _ in range(count):
+        start = pos
+        (
+            _ctime_s, _ctime_ns, mtime_s, mtime_ns, _dev, ino, mode,
+            _uid, _gid, size, oid, flags,
+        ) = _ENTRY_HEADER.unpack_from(data, pos)
+        pos += _ENTRY_HEADER.size
+
+        ext_flags = 0
+        if version >= 3 and flags & _FLAG_EXTENDED:
+            (ext_flags,) = struct.unpack_from(">H", data, pos)
+            pos += 2
+
+        if version == 4:
+            strip, pos = _read_varint(data, pos)
+            end = data.index(b"\0", pos)
+            name = previous_name[:len(previous_name) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            end = data.index(b"\0", pos)
+            name = data[pos:end]
+            # Entries are NUL-padded to a multiple of 8 bytes
+            pos = start + ((end - start + 8) & ~7)
+
+        previous_name = name
+        entries[name.decode("utf-8", "surrogateescape")] = IndexEntry(
+            mtime_ns=mtime_s * 1_000_000_000 + mtime_ns,
+            size=size,
+            ino=ino,
+            mode=mode,
+            oid=oid.hex(),
+            stage=(flags & _FLAG_STAGE_MASK) >> 12,
+            skip_worktree=bool(ext_flags & _EXT_FLAG_SKIP_WORKTREE),
+            intent_to_add=bool(ext_flags & _EXT_FLAG_INTENT_TO_ADD),
+        )
+
+    return entries
+
+
+def index_entry_clean(entry: IndexEntry, st: os.stat_result, index_mtime_ns: int) -> bool:
+    """
+    True if git's cached stat data proves the file still matches entry.oid.
+
+    The index stores 32-bit size and inode; nanoseconds are compared only when
+    git recorded them. Entries modified at or after the index was written are
+    "racily clean" and are not trusted, same as git.
+    """
+    if entry.stage or entry.intent_to_add:
+        return False
+    if entry.mtime_ns >= index_mtime_ns:
+        return False
+    if entry.size != st.st_size & 0xFFFFFFFF or entry.ino != st.st_ino & 0xFFFFFFFF:
+        return False
+    if entry.mtime_ns % 1_000_000_000:
+        return entry.mtime_ns == st.st_mtime_ns
+    return entry.mtime_ns // 1_000_000_000 == st.st_mtime_ns // 1_000_000_000
+
+
+# ---------------------------------------------------------------------------
+# .gitignore rules
+# ---------------------------------------------------------------------------
+
+class _Rule(NamedTuple):
+    regex: "re.Pattern"
+    negated: bool
+    dir_only: bool
+    anchored: bool
+
+
+def _gitignore_glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore glob (with ** support) into a regex."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                at_start = i == 0 or pattern[i - 1] == "/"
+                at_end = i + 2 == n or pattern[i + 2] == "/"
+                if at_start and at_end:
+                    if i + 2 == n:
+                        out.append(".*")          # "foo/**": everything inside
+                        i += 2
+                    else:
+                        out.append("(?:.*/)?")    # "**/": zero or more directories
+                        i += 3
+                    continue
+            out.append("[^/]*")
+            while i < n and pattern[i] == "*":
+                i += 1
+            continue
+        if c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+            else:
+                stuff = pattern[i + 1:j].replace("\\", "\\\\")
+                if stuff[0] in "!^":
+                    stuff = "^" + stuff[1:]
+                out.append(f"[{stuff}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_gitignore(lines: List[str]) -> List[_Rule]:
+    """Parse gitignore lines into rules, in file order."""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+        if not line or line.startswith("#"):
+            continue
+
+        # Trailing spaces are ignored unless escaped
+        stripped = line.rstrip(" ")
+        if stripped.endswith("\\") and len(stripped) < len(line):
+            stripped += " "
+        line = stripped
+        if not line:
+            continue
+
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        # A slash at the start or middle anchors the pattern to this directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+
+        regex = re.compile(_gitignore_glob_to_regex(line) + r"\Z", re.DOTALL)
+        rules.append(_Rule(regex, negated, dir_only, anchored))
+    return rules
+
+
+def _load_rules(path: Path) -> List[_Rule]:
+    try:
+        return parse_gitignore(path.read_text(encoding="utf-8", errors="ignore").splitlines())
+    except OSError:
+        return []
+
+
+class _RuleSet(NamedTuple):
+    base: str            # "/"-terminated directory relative to the worktree ("" for root)
+    rules: List[_Rule]
+
+
+def _gitignored(rule_sets: List[_RuleSet], rel_path: str, name: str, is_dir: bool) -> bool:
+    """
+    Evaluate .gitignore rules for one path.
+    Deeper .gitignore files take precedence; within a file the last match wins.
+    rule_sets is ordered from lowest to highest precedence.
+    """
+    for rule_set in reversed(rule_sets):
+        local_path = rel_path[len(rule_set.base):]
+        for rule in reversed(rule_set.rules):
+            if rule.dir_only and not is_dir:
+                continue
+            target = local_path if rule.anchored else name
+            if rule.regex.match(target):
+                return not rule.negated
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Discovery
+# ---------------------------------------------------------------------------
+
+class GitFiles(NamedTuple):
+    files: List[Path]
+    clean_oids: Dict[str, str]   # {file path: blob id} for files git knows are clean
+
+
+def discover_git_files(project_root: Path, ignore: List[str] = None) -> Optional[GitFiles]:
+    """
+    List project files using git's tracking data.
+
+    Tracked files come from .git/index; untracked files are found by walking
+    the tree with .gitignore / .git/info/exclude rules applied. paths.ignore
+    patterns are applied on top of both. Files whose stat matches the index
+    are reported in clean_oids so callers can skip hashing them.
+
+    Returns None if project_root is not inside a git checkout.
+    """
+    located = find_git_dir(project_root)
+    if located is None:
+        return None
+    worktree, git_dir, common_dir = located
+
+    project_root = project_root.resolve()
+    worktree_str = str(worktree)
+    prefix = project_root.relative_to(worktree).as_posix()
+    prefix = "" if prefix == "." else prefix + "/"
+
+    index_path = git_dir / "index"
+    try:
+        index = read_git_index(index_path)
+        index_mtime_ns = index_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        index, index_mtime_ns = {}, 0
+
+    matcher = IgnoreMatcher(ignore or [])
+    files = []
+    clean_oids = {}
+    seen = set()
+
+    # paths.ignore decisions for directories (relative to project root)
+    dir_ignored = {"": False}
+
+    def _dir_is_ignored(rel_dir: str) -> bool:
+        if rel_dir in dir_ignored:
+            return dir_ignored[rel_dir]
+        parent, _, name = rel_dir.rpartition("/")
+        ignored = _dir_is_ignored(parent) or matcher.match(name, rel_dir)
+        dir_ignored[rel_dir] = ignored
+        return ignored
+
+    # 1. Tracked files
+    for path, entry in index.items():
+        if not path.startswith(prefix) or entry.skip_worktree or entry.mode not in _FILE_MODES:
+            continue
+        rel_path = path[len(prefix):]
+        if rel_path in seen:
+            continue  # conflicted paths appear once per stage
+        parent, _, name = rel_path.rpartition("/")
+        if _dir_is_ignored(parent) or matcher.match(name, rel_path):
+            continue
+
+        full_path = os.path.join(worktree_str, path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            continue  # deleted in the worktree
+        if not _is_regular(st):
+            continue
+
+        seen.add(rel_path)
+        files.append(Path(full_path))
+        # A symlink's blob is the link text, not the content we'd hash
+        if entry.mode != 0o120000 and index_entry_clean(entry, st, index_mtime_ns):
+            clean_oids[full_path] = entry.oid
+
+    # 2. Untracked, non-ignored files
+    rule_sets = [_RuleSet("", _load_rules(common_dir / "info" / "exclude"))]
+
+    # .gitignore files of the project root's ancestors inside the worktree;
+    # if one of those directories is ignored, nothing below it is untracked
+    parts = prefix.rstrip("/").split("/") if prefix else []
+    for i, part in enumerate(parts):
+        base = "/".join(parts[:i]) + "/" if i else ""
+        rules = _load_rules(worktree / base / ".gitignore")
+        if rules:
+            rule_sets.append(_RuleSet(base, rules))
+        if _gitignored(rule_sets, base + part, part, True):
+            return GitFiles(files, clean_oids)
+
+    stack = [(str(project_root), prefix, rule_sets)]
+    while stack:
+        dir_path, rel_dir, parent_rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+
+        local_rules = parent_rules
+        rules = _load_rules(Path(dir_path) / ".gitignore")
+        if rules:
+            local_rules = parent_rules + [_RuleSet(rel_dir, rules)]
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            if name == ".git":
+                continue
+            repo_path = rel_dir + name          # relative to the worktree
+            rel_path = repo_path[len(prefix):]  # relative to the project root
+            if matcher.match(name, rel_path):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir:
+                    if os.path.lexists(os.path.join(entry.path, ".git")):
+                        continue  # nested repository / submodule
+                    if not _gitignored(local_rules, repo_path, name, True):
+                        subdirs.append((entry.path, repo_path + "/", local_rules))
+                elif rel_path not in seen and entry.is_file():
+                    if not _gitignored(local_rules, repo_path, name, False):
+                        seen.add(rel_path)
+                        files.append(Path(entry.path))
+            except OSError:
+                continue
+
+        stack.extend(reversed(subdirs))
+
+    return GitFiles(files, clean_oids)
+
+
+def _is_regular(st: os.stat_result) -> bool:
+    return (st.st_mode & 0o170000) == 0o100000
@@ -0,0 +1,233 @@
+# bugtrace/utils/inotify.py
+"""
+Minimal inotify binding (Linux) used by `bugtrace watch`.
+
+Talks to libc through ctypes so no extra dependency is needed. inotify
+watches are per directory, so DirectoryWatcher adds one watch for every
+directory of the project (pruned with the same ignore matcher as the
+walker) and adds new watches as directories appear.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Event(NamedTuple):
+    path: str       # absolute path of the affected entry
+    is_dir: bool
+    removed: bool   # entry was deleted or moved away
+
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return _libc
+
+
+def inotify_available() -> bool:
+    """True on Linux when libc exposes inotify."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class DirectoryWatcher:
+    """
+    Recursive inotify watcher for a directory tree.
+
+    skip_dir(path) decides which directories are not watched (ignored
+    directories). read() returns the events that arrived within the timeout;
+    when the kernel queue overflows, `overflowed` is set and the caller
+    should rescan everything.
+    """
+
+    def __init__(self, root: Path, skip_dir: Optional[Callable[[str], bool]] = None):
+        self.root = str(root)
+        self.skip_dir = skip_dir or (lambda path: False)
+        self.overflowed = False
+
+        libc = _load_libc()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+        self._poller = select.poll()
+        self._poller.register(self.fd, select.POLLIN)
+
+        self.add_tree(self.root)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._wd_paths)
+
+    def add_tree(self, top: str) -> List[str]:
+        """
+        Watch `top` and every directory below it.
+        Returns the files found while adding watches, which may have been
+        created before their directory was watched.
+        """
+        found = []
+        stack = [top]
+        while stack:
+            dir_path = stack.pop()
+            if dir_path != self.root and self.skip_dir(dir_path):
+                continue
+            if not self._add_watch(dir_path):
+                continue
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            else:
+                                found.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return found
+
+    def _add_watch(self, dir_path: str) -> bool:
+        wd = _load_libc().inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(
+                    err,
+                    "inotify watch limit reached; raise fs.inotify.max_user_watches "
+                    "or add directories to paths.ignore",
+                )
+            return False  # vanished or not a directory any more
+        old_path = self._wd_paths.get(wd)
+        if old_path is not None:
+            self._path_wds.pop(old_path, None)
+        self._wd_paths[wd] = dir_path
+        self._path_wds[dir_path] = wd
+        return True
+
+    def _forget_tree(self, dir_path: str):
+        prefix = dir_path + os.sep
+        for path in [p for p in self._path_wds if p == dir_path or p.startswith(prefix)]:
+            wd = self._path_wds.pop(path)
+            self._wd_paths.pop(wd, None)
+            _load_libc().inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: Optional[float]) -> List[Event]:
+        """Wait up to `timeout` seconds (None = forever) and return events."""
+        if not self._poller.poll(None if timeout is None else int(timeout * 1000)):
+            return []
+
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            events.extend(self._parse(data))
+        return events
+
+    def _parse(self, data: bytes) -> List[Event]:
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+
+            dir_path = self._wd_paths.get(wd)
+            if dir_path is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # Watch removed by the kernel (directory deleted or unmounted)
+                self._wd_paths.pop(wd, None)
+                if self._path_wds.get(dir_path) == wd:
+                    del self._path_wds[dir_path]
+                continue
+
+            if not name:
+                # Event about the watched directory itself
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    events.append(Event(dir_path, True, True))
+                continue
+
+            path = os.path.join(dir_path, os.fsdecode(name))
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                if is_dir:
+                    self._forget_tree(path)
+                events.append(Event(path, is_dir, True))
+            elif is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                if not self.skip_dir(path):
+                    events.append(Event(path, True, False))
+                    events.extend(Event(f, False, False) for f in self.add_tree(path))
+            elif not is_dir:
+                events.append(Event(path, False, False))
+        return events
@@ -1,29 +1,39 @@
 # bugtrace/utils/state.py
 from pathlib import Path
-import json
-from typing import Dict, Optional, List
+from contextlib import contextmanager
+from typing import Dict, Optional, List, Iterable
 from datetime import datetime
 
+from bugtrace.utils.fs import entry_hash
+from bugtrace.utils.store import open_store
+
 
 class StateManager:
     """
-    Manages .bugtrace/state.json for tracking config changes,
+    Manages .bugtrace state for tracking config changes,
     index status, and project metadata.
+    
+    State lives in .bugtrace/state.db (see bugtrace.utils.store); each
+    update writes only the rows or keys it touches. self.state mirrors the
+    stored values for read access.
     """
     
     def __init__(self, state_dir: Path):
         self.state_dir = state_dir
-        self.state_path = state_dir / "state.json"
+        self.store = open_store(state_dir)
         self.state = self._load_state()
     
     def _load_state(self) -> dict:
-        """Load state.json or create default"""
-        if self.state_path.exists():
-            try:
-                return json.loads(self.state_path.read_text(encoding='utf-8'))
-            except:
-                return self._default_state()
-        return self._default_state()
+        """Load state from the store, filling in defaults"""
+        state = self._default_state()
+        values = self.store.get_values()
+        values.pop("json_migrated", None)
+        state.update(values)
+        state["indexed_files"] = self.store.load_indexed_files()
+        
+        if "created_at" not in values:
+            self.store.set_values(created_at=state["created_at"], version=state["version"])
+        return state
     
     def _default_state(self) -> dict:
         """Default state structure"""
@@ -33,7 +43,7 @@ class StateManager:
             "created_at": datetime.now().isoformat(),
             "last_scan": None,
             "last_index": None,
-            "config_hash": None,
+            "config_scopes": None,  # {scope: hash}, see rag.indexer.INDEX_SCOPES
             "indexed_files": {},  # {filepath: hash}
             "metadata": {
                 "total_files": 0,
@@ -42,33 +52,53 @@ class StateManager:
             }
         }
     
+    @contextmanager
+    def transaction(self):
+        """Commit every update made inside the block atomically"""
+        with self.store.transaction():
+            yield self
+    
     def save(self):
-        """Save state to disk"""
-        self.state_path.write_text(
-            json.dumps(self.state, indent=2),
-            encoding='utf-8'
-        )
+        """Write the full in-memory state to the store"""
+        with self.store.transaction():
+            self.store.set_values(**{
+                key: value for key, value in self.state.items()
+                if key != "indexed_files"
+            })
+            self.store.replace_indexed_files(self.state.get("indexed_files", {}))
     
     def update_scan_time(self):
         """Update last scan timestamp"""
         self.state["last_scan"] = datetime.now().isoformat()
-        self.save()
+        self.store.set_values(last_scan=self.state["last_scan"])
     
     def update_index_time(self):
         """Update last index timestamp"""
         self.state["last_index"] = datetime.now().isoformat()
-        self.save()
+        self.store.set_values(last_index=self.state["last_index"])
     
-    def update_config_hash(self, new_hash: str):
-        """Update config hash"""
-        self.state["config_hash"] = new_hash
-        self.save()
+    def update_config_scopes(self, scopes: Dict[str, str]):
+        """Record the per-scope config hashes the index was built with"""
+        self.state["config_scopes"] = dict(scopes)
+        self.store.set_values(config_scopes=self.state["config_scopes"])
     
-    def config_changed(self, current_hash: str) -> bool:
-        """Check if config has changed since last index"""
-        return self.state.get("config_hash") != current_hash
+    def changed_config_scopes(self, current: Dict[str, str], legacy_hash: Optional[str] = None) -> List[str]:
+        """
+        Return the config scopes that changed since the last index.
+        
+        State written before scopes existed only has a whole-config hash;
+        if it still matches (legacy_hash), nothing changed and the scopes
+        are adopted as they are.
+        """
+        stored = self.state.get("config_scopes")
+        if stored is None:
+            if legacy_hash is not None and self.state.get("config_hash") == legacy_hash:
+                self.update_config_scopes(current)
+                return []
+            return list(current)
+        return [scope for scope, value in current.items() if stored.get(scope) != value]
     
-    def get_files_to_index(self, manifest: Dict[str, str]) -> Dict[str, str]:
+    def get_files_to_index(self, manifest: Dict[str, dict]) -> Dict[str, str]:
         """
         Compare manifest with indexed files.
         Returns dict of files that need indexing {filepath: hash}
@@ -76,20 +106,60 @@ class StateManager:
         indexed = self.state.get("indexed_files", {})
         files_to_index = {}
         
-        for filepath, file_hash in manifest.items():
+        for filepath, entry in manifest.items():
+            file_hash = entry_hash(entry)
             # File is new or changed
             if filepath not in indexed or indexed[filepath] != file_hash:
                 files_to_index[filepath] = file_hash
         
         return files_to_index
     
-    def mark_files_indexed(self, files: Dict[str, str]):
-        """Mark files as indexed"""
+    def mark_files_indexed(self, files: Dict[str, str], chunk_ids: Optional[Dict[str, List[str]]] = None):
+        """Mark files as indexed (optionally with their chunk ids) and clear past failures"""
         if "indexed_files" not in self.state:
             self.state["indexed_files"] = {}
         
         self.state["indexed_files"].update(files)
-        self.save()
+        with self.store.transaction():
+            self.store.upsert_indexed_files(files, chunk_ids)
+            self.store.delete_failures(files)
+    
+    def reset_indexed_files(self, config_scopes: Dict[str, str]):
+        """
+        Start a full re-index: forget every indexed file and record the new
+        config scopes up front, so an interrupted run resumes instead of
+        starting over.
+        """
+        self.state["indexed_files"] = {}
+        with self.store.transaction():
+            self.store.replace_indexed_files({})
+            self.update_config_scopes(config_scopes)
+    
+    def get_chunk_ids(self, paths: Iterable[str]) -> Dict[str, List[str]]:
+        """Vector store ids recorded for indexed files"""
+        return self.store.load_chunk_ids(paths)
+    
+    def record_failures(self, failures: Dict[str, tuple]):
+        """Record files that failed to index: {filepath: (hash, error)}"""
+        self.store.upsert_failures(failures, datetime.now().isoformat())
+    
+    def clear_failures(self, paths: Iterable[str]):
+        """Forget failures for files that are gone or indexed"""
+        self.store.delete_failures(paths)
+    
+    def get_failures(self) -> Dict[str, dict]:
+        """Files that failed to index: {filepath: {hash, error, failed_at}}"""
+        return self.store.load_failures()
+    
+    def unmark_files_indexed(self, paths: Iterable[str]):
+        """Forget files that were removed from the index"""
+        paths = list(paths)
+        indexed = self.state.setdefault("indexed_files", {})
+        for path in paths:
+            indexed.pop(path, None)
+        with self.store.transaction():
+            self.store.delete_indexed_files(paths)
+            self.store.delete_failures(paths)
     
     def update_metadata(self, **kwargs):
         """Update metadata fields"""
@@ -97,4 +167,4 @@ class StateManager:
             self.state["metadata"] = {}
         
         self.state["metadata"].update(kwargs)
-        self.save()
\ No newline at end of file
+        self.store.set_values(metadata=self.state["metadata"])
\ No newline at end of file
@@ -0,0 +1,331 @@
+# bugtrace/utils/store.py
+"""
+SQLite-backed storage for .bugtrace/state.db.
+
+Holds the file manifest, the indexed-file table (with each file's chunk
+ids), per-file index failures and the small key/value state that used to
+live in manifest.json / state.json. Writes are
+row-level upserts inside transactions, so updating one file no longer
+rewrites the whole state. Existing JSON files are migrated once on open.
+"""
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+import json
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    path     TEXT PRIMARY KEY,
+    hash     TEXT NOT NULL,
+    size     INTEGER,
+    mtime_ns INTEGER,
+    ino      INTEGER,
+    oid      TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS indexed_files (
+    path      TEXT PRIMARY KEY,
+    hash      TEXT NOT NULL,
+    chunk_ids TEXT             -- JSON list of vector store ids
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS index_failures (
+    path      TEXT PRIMARY KEY,
+    hash      TEXT,
+    error     TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS kv (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+# Stay well below SQLite's host-parameter limit in IN (...) lists
+_BATCH = 500
+
+
+class StateStore:
+    """
+    Transactional store for a project's .bugtrace state.
+
+    One connection is shared per state directory (see open_store); all
+    access goes through a lock so the store can be used from worker threads.
+    """
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = state_dir
+        self.db_path = state_dir / "state.db"
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.conn = sqlite3.connect(
+            str(self.db_path),
+            isolation_level=None,  # explicit BEGIN/COMMIT via transaction()
+            check_same_thread=False,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate_schema()
+
+        self._migrate_json()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into one atomic commit.
+        Nested calls join the outermost transaction.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("COMMIT")
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+
+    def load_manifest(self) -> Dict[str, dict]:
+        """Return {path: {hash, size, mtime_ns, ino[, oid]}}."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, hash, size, mtime_ns, ino, oid FROM manifest"
+            ).fetchall()
+
+        manifest = {}
+        for path, file_hash, size, mtime_ns, ino, oid in rows:
+            entry = {"hash": file_hash, "size": size, "mtime_ns": mtime_ns, "ino": ino}
+            if oid:
+                entry["oid"] = oid
+            manifest[path] = entry
+        return manifest
+
+    def upsert_manifest(self, entries: Dict[str, dict]):
+        """Insert or update manifest rows."""
+        if not entries:
+            return
+        rows = [_manifest_row(path, entry) for path, entry in entries.items()]
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO manifest (path, hash, size, mtime_ns, ino, oid) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET hash=excluded.hash, size=excluded.size, "
+                "mtime_ns=excluded.mtime_ns, ino=excluded.ino, oid=excluded.oid",
+                rows,
+            )
+
+    def delete_manifest(self, paths: Iterable[str]):
+        """Remove manifest rows."""
+        self._delete_paths("manifest", paths)
+
+    def replace_manifest(self, manifest: Dict[str, dict]):
+        """Replace the whole manifest in one transaction."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM manifest")
+            self.upsert_manifest(manifest)
+
+    # ------------------------------------------------------------------
+    # Indexed files
+    # ------------------------------------------------------------------
+
+    def load_indexed_files(self) -> Dict[str, str]:
+        """Return {path: hash} of indexed files."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT path, hash FROM indexed_files"))
+
+    def upsert_indexed_files(self, files: Dict[str, str], chunk_ids: Optional[Dict[str, List[str]]] = None):
+        """Record files as indexed; chunk_ids maps paths to their vector store ids."""
+        if not files:
+            return
+        chunk_ids = chunk_ids or {}
+        rows = [
+            (path, file_hash, json.dumps(chunk_ids[path]) if path in chunk_ids else None)
+            for path, file_hash in files.items()
+        ]
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO indexed_files (path, hash, chunk_ids) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET hash=excluded.hash, chunk_ids=excluded.chunk_ids",
+                rows,
+            )
+
+    def delete_indexed_files(self, paths: Iterable[str]):
+        self._delete_paths("indexed_files", paths)
+
+    def load_chunk_ids(self, paths: Iterable[str]) -> Dict[str, List[str]]:
+        """Return {path: chunk ids} for indexed paths that have ids recorded."""
+        paths = list(paths)
+        found = {}
+        with self._lock:
+            for i in range(0, len(paths), _BATCH):
+                batch = paths[i:i + _BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT path, chunk_ids FROM indexed_files "
+                    f"WHERE chunk_ids IS NOT NULL AND path IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update((path, json.loads(ids)) for path, ids in rows)
+        return found
+
+    # ------------------------------------------------------------------
+    # Index failures
+    # ------------------------------------------------------------------
+
+    def load_failures(self) -> Dict[str, dict]:
+        """Return {path: {hash, error, failed_at}} for files that failed to index."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, hash, error, failed_at FROM index_failures ORDER BY path"
+            ).fetchall()
+        return {
+            path: {"hash": file_hash, "error": error, "failed_at": failed_at}
+            for path, file_hash, error, failed_at in rows
+        }
+
+    def upsert_failures(self, failures: Dict[str, tuple], failed_at: str):
+        """failures maps path -> (hash, error)."""
+        if not failures:
+            return
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO index_failures (path, hash, error, failed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET hash=excluded.hash, error=excluded.error, "
+                "failed_at=excluded.failed_at",
+                [(path, file_hash, error, failed_at) for path, (file_hash, error) in failures.items()],
+            )
+
+    def delete_failures(self, paths: Iterable[str]):
+        self._delete_paths("index_failures", paths)
+
+    def replace_indexed_files(self, files: Dict[str, str]):
+        """Replace the indexed-file table, keeping recorded chunk ids of kept rows."""
+        with self.transaction() as conn:
+            chunk_ids = self.load_chunk_ids(files)
+            conn.execute("DELETE FROM indexed_files")
+            self.upsert_indexed_files(files, chunk_ids)
+
+    # ------------------------------------------------------------------
+    # Key/value state
+    # ------------------------------------------------------------------
+
+    def get_values(self) -> Dict[str, object]:
+        """Return all key/value state, JSON-decoded."""
+        with self._lock:
+            rows = self.conn.execute("SELECT key, value FROM kv").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_value(self, key: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_values(self, **values):
+        """Upsert key/value pairs (JSON-encoded)."""
+        if not values:
+            return
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                [(key, json.dumps(value)) for key, value in values.items()],
+            )
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _delete_paths(self, table: str, paths: Iterable[str]):
+        paths = list(paths)
+        if not paths:
+            return
+        with self.transaction() as conn:
+            for i in range(0, len(paths), _BATCH):
+                batch = paths[i:i + _BATCH]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM {table} WHERE path IN ({placeholders})", batch)
+
+    def _migrate_schema(self):
+        """Add columns introduced after a state.db was first created."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(indexed_files)")}
+        if "chunk_ids" not in columns:
+            self.conn.execute("ALTER TABLE indexed_files ADD COLUMN chunk_ids TEXT")
+
+    def _migrate_json(self):
+        """
+        One-time import of manifest.json / state.json written by older
+        versions. The JSON files are renamed to *.json.bak afterwards.
+        """
+        if self.get_value("json_migrated"):
+            return
+
+        manifest_path = self.state_dir / "manifest.json"
+        state_path = self.state_dir / "state.json"
+
+        with self.transaction():
+            if manifest_path.exists():
+                try:
+                    manifest = json.loads(manifest_path.read_text(encoding="utf-8") or "{}")
+                except (OSError, ValueError):
+                    manifest = {}
+                self.upsert_manifest(manifest)
+
+            if state_path.exists():
+                try:
+                    state = json.loads(state_path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    state = {}
+                self.upsert_indexed_files(state.pop("indexed_files", None) or {})
+                self.set_values(**state)
+
+            self.set_values(json_migrated=True)
+
+        for path in (manifest_path, state_path):
+            if path.exists():
+                path.replace(path.with_name(path.name + ".bak"))
+
+
+def _manifest_row(path: str, entry) -> tuple:
+    # Manifests written before stat caching store the bare hash
+    if not isinstance(entry, dict):
+        return (path, entry, None, None, None, None)
+    return (
+        path,
+        entry["hash"],
+        entry.get("size"),
+        entry.get("mtime_ns"),
+        entry.get("ino"),
+        entry.get("oid"),
+    )
+
+
+_stores: Dict[str, StateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(state_dir: Path) -> StateStore:
+    """Return the shared StateStore for a state directory."""
+    key = str(Path(state_dir).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None or not store.db_path.exists():
+            store = StateStore(Path(key))
+            _stores[key] = store
+        return store